@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+"""
+Benchmark: overlap-free ("true") screen time
+
+Times aggregates.active_totals() (one sort + running-maximum sweep for all
+hour/day x device groups) on a year of events and checks the daily totals
+against a plain Python merge of each group's sorted intervals. Also reports
+how much of the summed duration is overlap.
+
+Usage: python3 benchmarks/bench_active.py [rows]
+"""
+
+import sys
+import time
+from collections import defaultdict
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent / "src"))
+
+import aggregates  # noqa: E402
+from bench_line_protocol import make_frame  # noqa: E402
+
+DEFAULT_ROWS = 1_000_000
+
+
+def merge_reference(intervals: list[tuple]) -> int:
+    """Length of the union of [start, end) intervals, merged one by one."""
+    total, current_start, current_end = 0, None, None
+    for start, end in sorted(intervals):
+        if current_end is None or start > current_end:
+            if current_end is not None:
+                total += current_end - current_start
+            current_start, current_end = start, end
+        else:
+            current_end = max(current_end, end)
+    return total + (current_end - current_start if current_end is not None else 0)
+
+
+def daily_reference(df) -> dict:
+    starts, ends = aggregates.interval_columns(df)
+    days = aggregates.day_starts(aggregates.local_days(df["unix_ts"]))
+    groups = defaultdict(list)
+    for day, source, start, end in zip(days.tolist(), df["source"].tolist(), starts.tolist(), ends.tolist()):
+        groups[(day, source)].append((start, end))
+        groups[(day, aggregates.ALL_DEVICES)].append((start, end))
+    return {key: merge_reference(intervals) for key, intervals in groups.items()}
+
+
+def main():
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_ROWS
+    df = make_frame(rows)
+
+    start = time.perf_counter()
+    totals = aggregates.active_totals(df)
+    elapsed = time.perf_counter() - start
+
+    start = time.perf_counter()
+    expected = daily_reference(df)
+    reference_time = time.perf_counter() - start
+
+    daily = totals["daily"]
+    actual = dict(zip(zip(daily["start"].tolist(), daily["source"].tolist()), daily["cents"].tolist()))
+    matches = actual == expected
+
+    summed = int((df["duration"] * 100).round().sum())
+    union = int(daily.loc[daily["source"] == aggregates.ALL_DEVICES, "cents"].sum())
+
+    print(f"{rows} events, {len(daily)} day groups, {len(totals['hourly'])} hour groups\n")
+    print(f"active_totals (hours + days):   {elapsed:>7.3f}s")
+    print(f"Python merge (days only):       {reference_time:>7.3f}s  matches: {matches}")
+    print(f"summed duration {summed / 360000:.0f}h, overlap-free {union / 360000:.0f}h "
+          f"({1 - union / summed:.0%} overlap)")
+
+    return 0 if matches else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,63 @@
+#!/usr/bin/env python3
+"""
+Benchmark: daily aggregates and time buckets
+
+Compares the previous per-day path (a Python date object per row via
+.dt.date, then one groupby per dimension) with the integer bucket
+arithmetic in aggregates.py, for a single day and for all daily and
+hourly buckets of the history, and checks that the totals match.
+
+Usage: python3 benchmarks/bench_aggregates.py [rows]
+"""
+
+import sys
+import time
+from pathlib import Path
+
+import pandas as pd
+
+sys.path.insert(0, str(Path(__file__).parent.parent / "src"))
+
+import aggregates  # noqa: E402
+import exporter  # noqa: E402
+from bench_line_protocol import make_frame  # noqa: E402
+
+DEFAULT_ROWS = 1_000_000
+
+
+def daily_previous(df: pd.DataFrame, target_date) -> dict:
+    """The previous calculate_daily_aggregates() filter and groupbys (minutes per device)."""
+    local = df["timestamp"].dt.tz_localize(None) + pd.to_timedelta(aggregates.local_offsets(df["unix_ts"]), unit="s")
+    df_day = df[local.dt.date == target_date]
+    return {k: round(v / 60, 1) for k, v in df_day.groupby("source", observed=True)["duration"].sum().items()}
+
+
+def timed(func, *args):
+    start = time.perf_counter()
+    result = func(*args)
+    return result, time.perf_counter() - start
+
+
+def main():
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_ROWS
+    df = make_frame(rows)
+    for column in ["source", "title", "category"]:
+        df[column] = df[column].astype("category")
+    target_date = pd.Timestamp(int(df["unix_ts"].iloc[-1]), unit="s").date()
+
+    old, old_time = timed(daily_previous, df, target_date)
+    new, new_time = timed(exporter.calculate_daily_aggregates, df, target_date)
+    matches = old == new["by_device"]
+
+    rolled, all_time = timed(aggregates.rollup_frame, df)
+
+    print(f"{rows} events, {len(rolled['days'])} days, {len(rolled['hours'])} hours\n")
+    print(f"one day, previous (.dt.date):   {old_time:>7.3f}s")
+    print(f"one day, integer buckets:       {new_time:>7.3f}s  matches: {matches}")
+    print(f"all hours + days:               {all_time:>7.3f}s")
+
+    return 0 if matches else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+"""
+Benchmark: parsing aw-import-screentime output
+
+Compares peak memory and time of the old approach (read all of stdout,
+decode, json.loads) with the streaming parser in biome.py on a synthetic
+Biome dump.
+
+Usage: python3 benchmarks/bench_biome_stream.py [events]
+"""
+
+import json
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent / "src"))
+
+from biome import iter_events  # noqa: E402
+
+DEFAULT_EVENTS = 500_000
+
+APPS = [
+    ("com.zhiliaoapp.musically", "TikTok - Videos, Shopping & mehr"),
+    ("net.whatsapp.WhatsApp", "WhatsApp Messenger"),
+    ("com.google.chrome.ios", "Google Chrome"),
+    ("com.apple.mobileslideshow", "Photos"),
+    ("com.n26.N26", "N26 — Love your bank"),
+]
+
+
+def write_dump(path: Path, events: int, seed: int = 42):
+    """Writes a Biome-style dump without holding it in memory."""
+    rng = random.Random(seed)
+    start = datetime(2026, 1, 1, tzinfo=timezone.utc)
+
+    with open(path, "w") as f:
+        f.write('[{"id": "aw-import-screentime_bench", "type": "currentwindow", '
+                '"client": "aw-import-screentime", "hostname": "iPhone", "events": [')
+        for i in range(events):
+            app, title = APPS[rng.randrange(len(APPS))]
+            event = {
+                "id": i,
+                "timestamp": (start + timedelta(seconds=i * 7)).isoformat().replace("+00:00", "Z"),
+                "duration": rng.random() * 300,
+                "duration_seconds": round(rng.random() * 300, 3),
+                "data": {"app": app, "title": title},
+            }
+            f.write((", " if i else "") + json.dumps(event))
+        f.write('], "created": "2026-01-01T00:00:00Z"}]\n')
+
+
+def load_all(path: Path) -> int:
+    """The previous approach: capture_output=True, text=True, json.loads."""
+    raw = path.read_bytes()
+    text = raw.decode("utf-8")
+    data = json.loads(text)
+    return sum(1 for _ in data[0]["events"])
+
+
+def load_streaming(path: Path) -> int:
+    with open(path, "rb") as f:
+        return sum(1 for _ in iter_events(f))
+
+
+def measure(func, path: Path):
+    tracemalloc.start()
+    start = time.perf_counter()
+    count = func(path)
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return count, elapsed, peak
+
+
+def main():
+    events = int(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_EVENTS
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = Path(tmp) / "dump.json"
+        write_dump(path, events)
+        print(f"Synthetic dump: {events} events, {path.stat().st_size / 1e6:.1f} MB\n")
+
+        print(f"{'mode':>10}  {'events':>8}  {'time':>7}  {'peak memory':>12}")
+        results = {}
+        for name, func in [("json.loads", load_all), ("streaming", load_streaming)]:
+            count, elapsed, peak = measure(func, path)
+            results[name] = count
+            print(f"{name:>10}  {count:>8}  {elapsed:>6.2f}s  {peak / 1e6:>9.1f} MB")
+
+        with open(path, "rb") as f:
+            identical = list(iter_events(f)) == json.loads(path.read_text())[0]["events"]
+        print(f"\nIdentical events: {identical}")
+
+    return 0 if identical and len(set(results.values())) == 1 else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+"""
+Benchmark: coalescing usage fragments
+
+Generates Biome-style fragmented sessions (an app session split into many
+short back-to-back fragments, some with small gaps) and reports the row
+reduction, the runtime and whether per-app totals stay exact for several
+gap tolerances.
+
+Usage: python3 benchmarks/bench_coalesce.py [events]
+"""
+
+import random
+import sys
+import time
+from collections import defaultdict
+from datetime import datetime, timezone
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent / "src"))
+
+from coalesce import coalesce_events, reduction_ratio  # noqa: E402
+
+DEFAULT_EVENTS = 200_000
+GAPS = [0, 5, 30, 120]
+SOURCES = ["Mac", "iPhone 15 Pro"]
+APPS = ["com.google.Chrome", "com.hnc.Discord", "net.whatsapp.WhatsApp", "com.apple.Terminal"]
+
+
+def make_events(count: int, seed: int = 42) -> list[dict]:
+    """Sessions of 1-40 fragments; fragments are 1-120s with 0-60s gaps."""
+    rng = random.Random(seed)
+    events, ts = [], 1_735_689_600.0
+    while len(events) < count:
+        source, app = rng.choice(SOURCES), rng.choice(APPS)
+        for _ in range(rng.randint(1, 40)):
+            duration = round(rng.uniform(1, 120), 2)
+            events.append({
+                "timestamp": datetime.fromtimestamp(ts, timezone.utc).isoformat(),
+                "app": app, "title": app.rsplit(".", 1)[-1], "duration": duration, "source": source,
+            })
+            ts += duration + rng.choice([0, 0, 0, rng.uniform(0, 60)])
+        ts += rng.uniform(300, 3600)
+    return events[:count]
+
+
+def totals(events: list[dict]) -> dict:
+    cents = defaultdict(int)
+    for ev in events:
+        cents[(ev["source"], ev["app"])] += round(ev["duration"] * 100)
+    return dict(cents)
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_EVENTS
+    events = make_events(count)
+    expected = totals(events)
+    ok = True
+
+    print(f"{count} fragments\n")
+    print(f"{'gap':>6}  {'rows':>8}  {'reduction':>9}  {'time':>7}  exact")
+    for gap in GAPS:
+        start = time.perf_counter()
+        merged = coalesce_events(events, gap)
+        elapsed = time.perf_counter() - start
+        exact = totals(merged) == expected
+        ok &= exact
+        print(f"{gap:>5}s  {len(merged):>8}  {reduction_ratio(len(events), len(merged)):>8.0%}  {elapsed:>6.2f}s  {exact}")
+
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,158 @@
+#!/usr/bin/env python3
+"""
+Benchmark: multi-host fan-in
+
+Starts an ingest server (src/ingest.py) on a temporary store and runs one
+collector process per simulated Mac against it in push mode. Each Mac has
+its own knowledgeC.db fixture and MAC_SOURCE_NAME, and all of them see the
+same iPhone (as Macs sharing one iCloud account do), so the server has to
+drop the copies. Checks that the store ends up with every distinct event
+exactly once and that a second round of collectors stores nothing.
+
+Usage: python3 benchmarks/bench_fanin.py [hosts] [mac_rows]
+"""
+
+import csv
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent / "src"))
+sys.path.insert(0, str(Path(__file__).parent))
+
+from fixtures import make_aw_binary, make_knowledge_db  # noqa: E402
+
+DEFAULT_HOSTS = 3
+DEFAULT_MAC_ROWS = 50_000
+MOBILE_EVENTS_PER_DAY = 300
+SHARED_DEVICES = [("iPhone", "SHARED-IPHONE-0001")]
+TOKEN = "bench-token"
+
+
+def configure_collector(work: Path, host: int):
+    """Points the collector of simulated Mac <host> at its fixtures."""
+    import collector
+
+    collector.KNOWLEDGE_DB = work / f"knowledgeC-{host}.db"
+    collector.AW_BIN = work / "aw-import-screentime"
+    collector.MAC_SOURCE_NAME = f"Mac {host}"
+    collector.COLLECTOR_HOST = f"mac-{host}.local"
+    os.environ["DEVICES"] = ",".join(f"{name}:{device_id}" for name, device_id in SHARED_DEVICES)
+    return collector
+
+
+def serve(work: Path):
+    """Child process: ingest server writing to work/store."""
+    import collector
+    import ingest
+
+    store = work / "store"
+    collector.STORE_BACKEND = "csv"
+    collector.OUTPUT_CSV = store / "screentime.csv"
+    collector.DEDUP_DB = store / "dedup.db"
+    collector.DEDUP_BLOOM = store / "dedup.bloom"
+    collector.COALESCE_GAP_SECONDS = None
+    ingest.HOSTS_DIR = store / "hosts"
+    ingest.INGEST_TOKEN = TOKEN
+
+    server = ingest.start_server("127.0.0.1", 0)
+    (work / "port").write_text(str(server.server_port))
+    while True:
+        time.sleep(3600)
+
+
+def collect(work: Path, host: int, url: str):
+    """Child process: one collector run in push mode."""
+    import metrics
+
+    metrics.REPORT_DIR = metrics.METRICS_TEXTFILE_DIR = work / "reports"
+    collector = configure_collector(work, host)
+    collector.COLLECTOR_MODE = "push"
+    collector.AGGREGATOR_URL = url
+    collector.INGEST_TOKEN = TOKEN
+    collector.main()
+
+
+def expected_events(work: Path, hosts: int) -> int:
+    """Distinct events (by dedup key) the collectors can see, extracted in-process."""
+    from dedup import event_key
+
+    keys = set()
+    for host in range(hosts):
+        collector = configure_collector(work, host)
+        events = collector.get_mac_data(0)
+        for name, device_id in SHARED_DEVICES:
+            events += collector.get_mobile_data(name, device_id, 0)
+        keys.update(event_key(ev) for ev in events)
+    return len(keys)
+
+
+def run_round(work: Path, hosts: int, url: str) -> float:
+    start = time.perf_counter()
+    procs = [subprocess.Popen([sys.executable, __file__, "--collect", str(work), str(host), url],
+                              stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True)
+             for host in range(hosts)]
+    for host, proc in enumerate(procs):
+        output, _ = proc.communicate()
+        if proc.returncode != 0:
+            print(output)
+            raise SystemExit(f"collector {host} failed")
+    return time.perf_counter() - start
+
+
+def main():
+    hosts = int(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_HOSTS
+    mac_rows = int(sys.argv[2]) if len(sys.argv) > 2 else DEFAULT_MAC_ROWS
+    end_ts = time.time()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        work = Path(tmp)
+        for host in range(hosts):
+            make_knowledge_db(work / f"knowledgeC-{host}.db", mac_rows, end_ts, seed=host)
+        make_aw_binary(work / "aw-import-screentime", MOBILE_EVENTS_PER_DAY, end_ts)
+
+        expected = expected_events(work, hosts)
+
+        log = open(work / "server.log", "w")
+        server = subprocess.Popen([sys.executable, __file__, "--serve", str(work)], stdout=log, stderr=log)
+        try:
+            for _ in range(100):
+                if (work / "port").exists():
+                    break
+                time.sleep(0.1)
+            url = f"http://127.0.0.1:{(work / 'port').read_text()}"
+
+            first = run_round(work, hosts, url)
+            with open(work / "store" / "screentime.csv", newline="") as f:
+                stored = sum(1 for _ in csv.DictReader(f))
+            second = run_round(work, hosts, url)
+            with open(work / "store" / "screentime.csv", newline="") as f:
+                stored_again = sum(1 for _ in csv.DictReader(f))
+            marks = {path.stem: json.loads(path.read_text())
+                     for path in sorted((work / "store" / "hosts").glob("*.json"))}
+        finally:
+            server.terminate()
+            server.wait()
+            log.close()
+
+    print(f"hosts:            {hosts} ({mac_rows:,} knowledgeC rows each, shared {SHARED_DEVICES[0][0]})")
+    print(f"first round:      {first:.2f}s, {stored:,} events stored ({stored / first:,.0f}/s)")
+    print(f"second round:     {second:.2f}s, {stored_again - stored:,} events stored")
+    print(f"host watermarks:  {', '.join(f'{h}: {len(m)} sources' for h, m in marks.items())}")
+
+    ok = stored == expected and stored_again == stored and len(marks) == hosts
+    print(f"distinct events:  {expected:,} expected - {'OK' if ok else 'MISMATCH'}")
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 2 and sys.argv[1] == "--serve":
+        serve(Path(sys.argv[2]))
+    elif len(sys.argv) > 4 and sys.argv[1] == "--collect":
+        collect(Path(sys.argv[2]), int(sys.argv[3]), sys.argv[4])
+    else:
+        sys.exit(main())
@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+"""
+Benchmark: Home Assistant sensor updates
+
+Pushes the sensors of a realistic aggregate to a local stub server with
+artificial latency: once like the previous implementation (one new
+connection per sensor, sequentially), then with the pooled concurrent
+publisher, then again with nothing changed (state cache hits only).
+If paho-mqtt is installed, the same runs go through HA_TRANSPORT=mqtt
+against a stub broker with the same latency.
+
+Usage: python3 benchmarks/bench_ha_publish.py [latency_ms] [devices]
+"""
+
+import contextlib
+import io
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import requests
+
+sys.path.insert(0, str(Path(__file__).parent.parent / "src"))
+
+import exporter  # noqa: E402
+from fixtures import StubMqttBroker, StubServer  # noqa: E402
+
+DEFAULT_LATENCY_MS = 50
+DEFAULT_DEVICES = 4
+
+
+def make_aggregates(devices: int) -> dict:
+    by_app = {f"App {i}": round(60 - i * 4.5, 1) for i in range(10)}
+    return {
+        "total_minutes": 312.4,
+        "by_device": {f"iPhone {i}": round(300 / devices, 1) for i in range(devices)},
+        "top_app": "App 0",
+        "top_app_minutes": by_app["App 0"],
+        "by_category": {"Social": 120.0, "Browser": 80.5, "Productivity": 60.2, "Other": 51.7},
+        "by_app": by_app,
+        "session_count": 240,
+    }
+
+
+def publish_previous(url: str, sensors: list[tuple]) -> bool:
+    """The previous update_ha_sensor loop: one requests.post per sensor."""
+    ok = True
+    for entity_id, state, unit, attrs in sensors:
+        payload = exporter.ha_payload(state, attrs, unit)
+        response = requests.post(f"{url}/api/states/{entity_id}", json=payload,
+                                 headers={"Authorization": "Bearer x"}, timeout=10)
+        ok &= response.status_code in [200, 201]
+    return ok
+
+
+def timed(func, *args):
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        result = func(*args)
+    return result, time.perf_counter() - start
+
+
+def main():
+    latency = (float(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_LATENCY_MS) / 1000
+    devices = int(sys.argv[2]) if len(sys.argv) > 2 else DEFAULT_DEVICES
+    sensors = exporter.build_ha_sensors(make_aggregates(devices))
+
+    with tempfile.TemporaryDirectory() as tmp, StubServer(latency=latency) as stub:
+        exporter.HA_URL = stub.url
+        exporter.HA_TOKEN = "x"
+        exporter.HA_STATE_FILE = Path(tmp) / ".ha_state.json"
+
+        print(f"{len(sensors)} sensors, {latency * 1000:g}ms server latency, "
+              f"HA_CONCURRENCY={exporter.HA_CONCURRENCY}\n")
+        print(f"{'run':>22}  {'requests':>8}  {'time':>7}")
+
+        rows = [
+            ("previous (sequential)", publish_previous, stub.url, sensors),
+            ("pooled + concurrent", exporter.publish_ha_sensors, sensors),
+            ("unchanged (cached)", exporter.publish_ha_sensors, sensors),
+        ]
+        ok = True
+        for label, func, *args in rows:
+            before = len(stub.requests)
+            result, elapsed = timed(func, *args)
+            ok &= result
+            print(f"{label:>22}  {len(stub.requests) - before:>8}  {elapsed:>6.3f}s")
+
+    try:
+        import paho.mqtt.client  # noqa: F401
+    except ImportError:
+        print("\npaho-mqtt not installed - skipping MQTT transport")
+        return 0 if ok else 1
+
+    with tempfile.TemporaryDirectory() as tmp, StubMqttBroker(latency=latency) as broker:
+        exporter.HA_TRANSPORT = "mqtt"
+        exporter.MQTT_HOST, exporter.MQTT_PORT = "127.0.0.1", broker.port
+        exporter.HA_STATE_FILE = Path(tmp) / ".ha_state.json"
+
+        print(f"\n{'run':>22}  {'messages':>8}  {'time':>7}")
+        for label in ["mqtt (first push)", "mqtt (unchanged)"]:
+            before = len(broker.messages)
+            result, elapsed = timed(exporter.publish_ha_sensors, sensors)
+            ok &= result
+            print(f"{label:>22}  {len(broker.messages) - before:>8}  {elapsed:>6.3f}s")
+
+        sensors[0] = (sensors[0][0], sensors[0][1] + 1, *sensors[0][2:])
+        before = len(broker.messages)
+        result, elapsed = timed(exporter.publish_ha_sensors, sensors)
+        ok &= result
+        print(f"{'mqtt (one delta)':>22}  {len(broker.messages) - before:>8}  {elapsed:>6.3f}s")
+        exporter.close_connections()
+
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
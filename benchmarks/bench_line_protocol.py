@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+"""
+Benchmark: InfluxDB line protocol encoding
+
+Compares the vectorized encoder in exporter.py against the previous
+iterrows-based implementation and verifies both produce identical output.
+
+Usage: python3 benchmarks/bench_line_protocol.py [rows ...]
+"""
+
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, str(Path(__file__).parent.parent / "src"))
+
+from exporter import encode_line_protocol  # noqa: E402
+
+DEFAULT_SIZES = [10_000, 100_000, 1_000_000]
+
+SOURCES = ["Mac", "iPhone 15 Pro", "iPad Pro", "iPhone Work"]
+APPS = [
+    ("com.google.Chrome", "Chrome", "Browser"),
+    ("com.hnc.Discord", "Discord", "Social"),
+    ("com.apple.springboard.today-view", "System: Today View", "System"),
+    ("com.example.weird", "Tag=Value, With Spaces", "Other"),
+    ("net.whatsapp.WhatsApp", "WhatsApp", "Social"),
+    ("com.microsoft.VSCode", "VS Code", "Productivity"),
+]
+
+
+def make_frame(rows: int, seed: int = 42) -> pd.DataFrame:
+    """Builds a frame shaped like exporter.load_data() output."""
+    rng = np.random.default_rng(seed)
+    app_idx = rng.integers(0, len(APPS), rows)
+    start = 1_735_689_600  # 2025-01-01
+    seconds = np.sort(rng.integers(start, start + 365 * 86400, rows))
+    # A third of the events carry sub-second precision like Biome timestamps
+    micros = np.where(rng.random(rows) < 0.33, rng.integers(0, 1_000_000, rows), 0)
+
+    df = pd.DataFrame({
+        "timestamp": pd.to_datetime(seconds * 1_000_000 + micros, unit="us", utc=True),
+        "app": [APPS[i][0] for i in app_idx],
+        "title": [APPS[i][1] for i in app_idx],
+        "duration": np.round(rng.random(rows) * 600, 2),
+        "source": np.array(SOURCES, dtype=object)[rng.integers(0, len(SOURCES), rows)],
+        "category": [APPS[i][2] for i in app_idx],
+    })
+    df["unix_ts"] = seconds
+    return df
+
+
+def encode_iterrows(df: pd.DataFrame) -> list[str]:
+    """The original per-row encoder, kept as the reference implementation."""
+    lines = []
+    for _, row in df.iterrows():
+        source = row["source"].replace(" ", "\\ ").replace(",", "\\,")
+        app = row["app"].replace(" ", "\\ ").replace(",", "\\,").replace("=", "\\=")
+        title = row["title"].replace(" ", "\\ ").replace(",", "\\,").replace("=", "\\=")
+        category = row["category"].replace(" ", "\\ ").replace(",", "\\,")
+        ts_ns = int(row["timestamp"].timestamp() * 1e9)
+        line = f'screentime,source={source},app={app},title={title},category={category} duration={row["duration"]} {ts_ns}'
+        lines.append(line)
+    return lines
+
+
+def timed(func, *args):
+    start = time.perf_counter()
+    result = func(*args)
+    return result, time.perf_counter() - start
+
+
+def main():
+    sizes = [int(arg) for arg in sys.argv[1:]] or DEFAULT_SIZES
+
+    print(f"{'rows':>10}  {'iterrows':>10}  {'vectorized':>10}  {'speedup':>8}  identical")
+    for rows in sizes:
+        df = make_frame(rows)
+        new_lines, new_time = timed(encode_line_protocol, df)
+        old_lines, old_time = timed(encode_iterrows, df)
+
+        identical = "\n".join(old_lines).encode() == "\n".join(new_lines).encode()
+        print(f"{rows:>10}  {old_time:>9.2f}s  {new_time:>9.2f}s  {old_time / new_time:>7.1f}x  {identical}")
+
+        if not identical:
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+"""
+Benchmark: knowledgeC.db extraction
+
+Compares collector.get_mac_data against the previous implementation
+(shifted-column predicate, fetchall, per-row astimezone) on a synthetic
+knowledgeC-shaped database, for a full extraction and for an incremental
+run that only needs the last day.
+
+Usage: python3 benchmarks/bench_mac_extract.py [rows]
+"""
+
+import contextlib
+import io
+import sqlite3
+import sys
+import tempfile
+import time
+from datetime import datetime
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent / "src"))
+
+import collector  # noqa: E402
+from fixtures import make_knowledge_db  # noqa: E402
+
+DEFAULT_ROWS = 2_000_000
+
+
+def get_mac_data_previous(db_path: Path, last_created_at: float) -> list[dict]:
+    """The original get_mac_data() query and row loop."""
+    query = """
+    SELECT
+        ZOBJECT.ZVALUESTRING AS "app",
+        (ZOBJECT.ZENDDATE - ZOBJECT.ZSTARTDATE) AS "usage",
+        (ZOBJECT.ZSTARTDATE + 978307200) as "start_time",
+        (ZOBJECT.ZENDDATE + 978307200) as "end_time",
+        (ZOBJECT.ZCREATIONDATE + 978307200) as "created_at"
+    FROM ZOBJECT
+    WHERE
+        ZSTREAMNAME = "/app/usage" AND
+        (ZOBJECT.ZCREATIONDATE + 978307200) > ?
+    ORDER BY ZSTARTDATE ASC
+    """
+    conn = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True)
+    rows = conn.execute(query, (last_created_at,)).fetchall()
+    conn.close()
+
+    events = []
+    for app, usage, start_time, end_time, created_at in rows:
+        if not app or usage is None:
+            continue
+        events.append({
+            "timestamp": datetime.fromtimestamp(start_time).astimezone().isoformat(),
+            "app": app,
+            "title": collector.get_app_title.__wrapped__(app),
+            "duration": round(usage, 2),
+            "source": "Mac",
+            "_created_at": created_at,
+        })
+    return events
+
+
+def timed(func, *args):
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        result = func(*args)
+    return result, time.perf_counter() - start
+
+
+def main():
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_ROWS
+    now = time.time()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = Path(tmp) / "knowledgeC.db"
+        start = time.perf_counter()
+        make_knowledge_db(db_path, rows, end_ts=now)
+        print(f"Fixture: {rows} ZOBJECT rows ({time.perf_counter() - start:.1f}s to build)\n")
+
+        ok = True
+        print(f"{'run':>12}  {'events':>8}  {'previous':>9}  {'current':>9}  identical")
+        for label, watermark in [("full", 0.0), ("incremental", now - 86400)]:
+            old, old_time = timed(get_mac_data_previous, db_path, watermark)
+            new, new_time = timed(collector.get_mac_data, watermark, db_path)
+            identical = old == new
+            ok &= identical
+            print(f"{label:>12}  {len(new):>8}  {old_time:>8.2f}s  {new_time:>8.2f}s  {identical}")
+
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+"""
+Benchmark: reading a live knowledgeC.db
+
+Runs get_mac_data repeatedly against a WAL-mode fixture while a separate
+process keeps writing to it (like macOS does), once reading the live file
+and once in snapshot mode. Reports latency percentiles and failed reads.
+
+Usage: python3 benchmarks/bench_mac_snapshot.py [rows] [reads]
+"""
+
+import contextlib
+import io
+import multiprocessing
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent / "src"))
+
+import collector  # noqa: E402
+from fixtures import APPLE_EPOCH_OFFSET, make_knowledge_db  # noqa: E402
+
+DEFAULT_ROWS = 200_000
+DEFAULT_READS = 20
+
+
+def writer(db_path: str, stop):
+    """Inserts usage rows in short exclusive transactions until stopped."""
+    conn = sqlite3.connect(db_path, timeout=30)
+    next_pk = conn.execute("SELECT MAX(Z_PK) FROM ZOBJECT").fetchone()[0] + 1
+    while not stop.is_set():
+        now = time.time() - APPLE_EPOCH_OFFSET
+        conn.execute("BEGIN EXCLUSIVE")
+        conn.executemany(
+            "INSERT INTO ZOBJECT (Z_PK, ZSTREAMNAME, ZVALUESTRING, ZSTARTDATE, ZENDDATE, ZCREATIONDATE) "
+            "VALUES (?, '/app/usage', 'com.google.Chrome', ?, ?, ?)",
+            [(next_pk + i, now - 60, now, now) for i in range(500)],
+        )
+        time.sleep(0.05)  # Hold the write lock like a long-running writer
+        conn.commit()
+        next_pk += 500
+        if next_pk % 20_000 < 500:
+            conn.execute("PRAGMA wal_checkpoint(PASSIVE)")
+    conn.close()
+
+
+def measure(db_path: Path, snapshot: bool, reads: int):
+    latencies, failures = [], 0
+    for _ in range(reads):
+        output = io.StringIO()
+        start = time.perf_counter()
+        with contextlib.redirect_stdout(output):
+            events = collector.get_mac_data(0.0, db_path, snapshot=snapshot)
+        latencies.append(time.perf_counter() - start)
+        if not events or "Error" in output.getvalue():
+            failures += 1
+    return latencies, failures
+
+
+def main():
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_ROWS
+    reads = int(sys.argv[2]) if len(sys.argv) > 2 else DEFAULT_READS
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = Path(tmp) / "knowledgeC.db"
+        make_knowledge_db(db_path, rows, end_ts=time.time())
+        with sqlite3.connect(db_path) as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+
+        stop = multiprocessing.Event()
+        proc = multiprocessing.Process(target=writer, args=(str(db_path), stop))
+        proc.start()
+        time.sleep(0.5)
+
+        try:
+            print(f"Fixture: {rows} rows, concurrent writer running\n")
+            print(f"{'mode':>9}  {'p50':>7}  {'p95':>7}  {'max':>7}  failed")
+            for label, snapshot in [("live", False), ("snapshot", True)]:
+                latencies, failures = measure(db_path, snapshot, reads)
+                p95 = sorted(latencies)[int(0.95 * (len(latencies) - 1))]
+                print(f"{label:>9}  {statistics.median(latencies):>6.2f}s  {p95:>6.2f}s  "
+                      f"{max(latencies):>6.2f}s  {failures}/{reads}")
+        finally:
+            stop.set()
+            proc.join()
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+"""
+Benchmark: title normalization
+
+Compares the previous linear TITLE_NORMALIZE scan with the precompiled
+TitleMatcher (uncached and LRU-cached) for mapping tables of growing size,
+and checks that all variants return the same titles.
+
+Usage: python3 benchmarks/bench_normalize.py [lookups]
+"""
+
+import random
+import string
+import sys
+import time
+from functools import lru_cache
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent / "src"))
+
+from config import TITLE_NORMALIZE, TitleMatcher  # noqa: E402
+
+DEFAULT_LOOKUPS = 100_000
+TABLE_SIZES = [len(TITLE_NORMALIZE), 500, 5_000]
+
+
+def normalize_linear(table: dict, title: str) -> str:
+    """The original normalize_title(), kept as the reference implementation."""
+    if title in table:
+        return table[title]
+    for long_name, short_name in table.items():
+        if title.startswith(long_name[:15]):
+            return short_name
+    return title
+
+
+def make_table(size: int, rng: random.Random) -> dict:
+    """TITLE_NORMALIZE padded with synthetic App Store names."""
+    table = dict(TITLE_NORMALIZE)
+    while len(table) < size:
+        words = ["".join(rng.choices(string.ascii_letters, k=rng.randint(3, 9))) for _ in range(4)]
+        long_name = f"{words[0]} {words[1]} - {words[2]} & {words[3]}"
+        table[long_name] = words[0]
+    return table
+
+
+def make_titles(table: dict, count: int, rng: random.Random) -> list[str]:
+    """Mix of exact names, truncated names, already short names and unknown apps."""
+    names = list(table)
+    titles = []
+    for _ in range(count):
+        name = rng.choice(names)
+        kind = rng.random()
+        if kind < 0.3:
+            titles.append(name)
+        elif kind < 0.6:
+            titles.append(name[:rng.randint(15, max(15, len(name)))])
+        elif kind < 0.8:
+            titles.append(table[name])
+        else:
+            titles.append("Unknown " + "".join(rng.choices(string.ascii_letters, k=8)))
+    return titles
+
+
+def timed(func, titles):
+    start = time.perf_counter()
+    result = [func(t) for t in titles]
+    return result, time.perf_counter() - start
+
+
+def main():
+    lookups = int(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_LOOKUPS
+    rng = random.Random(42)
+    ok = True
+
+    print(f"{'entries':>8}  {'linear':>9}  {'trie':>9}  {'trie+lru':>9}  equivalent")
+    for size in TABLE_SIZES:
+        table = make_table(size, rng)
+        titles = make_titles(table, lookups, rng)
+        matcher = TitleMatcher(table)
+
+        expected, linear_time = timed(lambda t: normalize_linear(table, t), titles)
+        trie_result, trie_time = timed(matcher, titles)
+        cached_result, cached_time = timed(lru_cache(maxsize=4096)(matcher), titles)
+
+        equivalent = expected == trie_result == cached_result
+        ok &= equivalent
+        print(f"{len(table):>8}  {linear_time:>8.3f}s  {trie_time:>8.3f}s  {cached_time:>8.3f}s  {equivalent}")
+
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
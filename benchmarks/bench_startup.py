@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+"""
+Benchmark: startup cost of the one-shot entry points
+
+Measures the import time of collector.py and exporter.py with
+`python -X importtime` and fails if either exceeds its budget or pulls in a
+module that should only load when there is work to do. Also runs
+exporter.main() twice against a small temporary store and checks that the
+second, no-new-data run never imports pandas, numpy or requests.
+
+Usage: python3 benchmarks/bench_startup.py [runs]
+"""
+
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+SRC_DIR = Path(__file__).parent.parent / "src"
+
+DEFAULT_RUNS = 5
+
+# Cumulative import time budgets (milliseconds) and modules that must not be loaded
+BUDGETS_MS = {"collector": 60, "exporter": 60}
+FORBIDDEN = {"pandas", "numpy", "requests"}
+
+# Runs exporter.main() twice on a temp store and reports what the second run imported
+NO_NEW_DATA_SCRIPT = """
+import contextlib, io, json, sys, time
+from pathlib import Path
+
+tmp = Path(sys.argv[1])
+import exporter
+import metrics
+from store import CsvStore
+
+metrics.REPORT_DIR = metrics.METRICS_TEXTFILE_DIR = tmp / "reports"
+
+exporter.CSV_FILE = tmp / "screentime.csv"
+exporter.STORE_BACKEND = "csv"
+exporter.LAST_EXPORT_FILE = tmp / ".last_export_timestamp"
+exporter.ROLLUP_FILE = tmp / ".daily_rollup.json"
+exporter.EXPORT_POSITION_FILE = tmp / ".last_export_position"
+exporter.INFLUX_TOKEN = exporter.HA_TOKEN = ""
+
+if not exporter.CSV_FILE.exists():
+    CsvStore(exporter.CSV_FILE).append(
+        {"timestamp": f"2026-01-01T00:{i % 60:02d}:00+00:00", "app": "com.google.Chrome",
+         "title": "Chrome", "duration": 30.0, "source": "Mac"} for i in range(100))
+
+start = time.perf_counter()
+with contextlib.redirect_stdout(io.StringIO()):
+    exporter.main()
+elapsed = time.perf_counter() - start
+print(json.dumps({"seconds": elapsed, "loaded": sorted(m for m in sys.modules if "." not in m)}))
+"""
+
+
+def import_time_ms(module: str) -> tuple[float, set]:
+    """Cumulative import time of module (ms) and the top-level modules it loaded."""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=SRC_DIR, capture_output=True, text=True, check=True,
+    )
+    total, loaded = 0.0, set()
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line.split("|")
+        if not cumulative.strip().isdigit():
+            continue  # Header line
+        loaded.add(name.strip().split(".")[0])
+        if name.strip() == module:
+            total = int(cumulative) / 1000
+    return total, loaded
+
+
+def run_exporter(tmp: str) -> dict:
+    result = subprocess.run(
+        [sys.executable, "-c", NO_NEW_DATA_SCRIPT, tmp],
+        cwd=SRC_DIR, capture_output=True, text=True, check=True,
+        env={**os.environ, "PYTHONPATH": str(SRC_DIR)},
+    )
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def main():
+    runs = int(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_RUNS
+    ok = True
+
+    print(f"{'module':>10}  {'median':>8}  {'budget':>7}  forbidden")
+    for module, budget in BUDGETS_MS.items():
+        samples, forbidden = [], set()
+        for _ in range(runs):
+            ms, loaded = import_time_ms(module)
+            samples.append(ms)
+            forbidden |= loaded & FORBIDDEN
+        median = statistics.median(samples)
+        passed = median <= budget and not forbidden
+        ok &= passed
+        print(f"{module:>10}  {median:>6.1f}ms  {budget:>5}ms  {', '.join(sorted(forbidden)) or '-'}"
+              f"{'' if passed else '  FAIL'}")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        start = time.perf_counter()
+        first = run_exporter(tmp)
+        first_wall = time.perf_counter() - start
+        start = time.perf_counter()
+        second = run_exporter(tmp)
+        second_wall = time.perf_counter() - start
+
+    forbidden = FORBIDDEN & set(second["loaded"])
+    ok &= not forbidden
+    print(f"\nexporter.main() with new data:    {first_wall:.2f}s process, {first['seconds']:.3f}s in main()")
+    print(f"exporter.main() without new data: {second_wall:.2f}s process, {second['seconds']:.3f}s in main()"
+          f"  imported: {', '.join(sorted(forbidden)) or 'none of ' + ', '.join(sorted(FORBIDDEN))}")
+
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,286 @@
+#!/usr/bin/env python3
+"""
+Synthetic fixtures for the benchmarks.
+"""
+
+import csv
+import json
+import random
+import sqlite3
+import sys
+import threading
+import time
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+# Seconds between 1970-01-01 and 2001-01-01
+APPLE_EPOCH_OFFSET = 978307200
+
+MAC_BUNDLES = [
+    "com.google.Chrome", "com.microsoft.VSCode", "com.apple.Terminal", "com.apple.finder",
+    "com.hnc.Discord", "com.spotify.client", "com.apple.Safari", "com.apple.MobileSMS",
+    "com.example.SomeUnmappedApp", "org.mozilla.firefox",
+]
+
+MOBILE_APPS = [
+    ("com.zhiliaoapp.musically", "TikTok - Videos, Shopping & mehr"),
+    ("net.whatsapp.WhatsApp", "WhatsApp Messenger"),
+    ("com.google.chrome.ios", "Google Chrome"),
+    ("com.apple.mobileslideshow", "Photos"),
+    ("com.n26.N26", "N26 — Love your bank"),
+    ("com.burbn.instagram", "Instagram"),
+]
+
+# Non-app streams that share ZOBJECT in a real knowledgeC.db
+OTHER_STREAMS = ["/display/isBacklit", "/device/isLocked", "/safari/history", "/notification/usage"]
+
+KNOWLEDGE_SCHEMA = """
+CREATE TABLE ZOBJECT (
+    Z_PK INTEGER PRIMARY KEY,
+    Z_ENT INTEGER,
+    Z_OPT INTEGER,
+    ZSTREAMNAME VARCHAR,
+    ZVALUESTRING VARCHAR,
+    ZSTARTDATE TIMESTAMP,
+    ZENDDATE TIMESTAMP,
+    ZCREATIONDATE TIMESTAMP
+);
+CREATE INDEX Z_OBJECT_ZSTREAMNAME ON ZOBJECT (ZSTREAMNAME);
+CREATE INDEX Z_OBJECT_ZCREATIONDATE ON ZOBJECT (ZCREATIONDATE);
+"""
+
+
+def make_knowledge_db(path: Path, rows: int, end_ts: float, days: int = 365,
+                      app_share: float = 0.4, seed: int = 42) -> Path:
+    """
+    Creates a knowledgeC.db-shaped SQLite file with `rows` ZOBJECT rows
+    spread over `days` days before end_ts (unix seconds). About app_share
+    of the rows belong to the /app/usage stream.
+    """
+    rng = random.Random(seed)
+    path = Path(path)
+    path.unlink(missing_ok=True)
+
+    start = end_ts - days * 86400 - APPLE_EPOCH_OFFSET
+    step = days * 86400 / max(rows, 1)
+
+    conn = sqlite3.connect(path)
+    conn.executescript(KNOWLEDGE_SCHEMA)
+
+    def generate():
+        for i in range(rows):
+            begin = start + i * step
+            duration = rng.randint(1, 900)
+            if rng.random() < app_share:
+                stream, value = "/app/usage", rng.choice(MAC_BUNDLES)
+            else:
+                stream, value = rng.choice(OTHER_STREAMS), None
+            # Rows are created when the usage interval ends
+            yield (i + 1, 1, 1, stream, value, begin, begin + duration, begin + duration + rng.random())
+
+    conn.executemany(
+        "INSERT INTO ZOBJECT (Z_PK, Z_ENT, Z_OPT, ZSTREAMNAME, ZVALUESTRING, ZSTARTDATE, ZENDDATE, ZCREATIONDATE) "
+        "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+        generate(),
+    )
+    conn.commit()
+    conn.close()
+    return path
+
+
+# Stand-in for aw-import-screentime: `events preview --device ID --since Nd`
+# prints a Biome-style dump with events_per_day events per day of the window
+AW_SCRIPT = """#!{python}
+import json, sys, zlib
+from datetime import datetime, timezone
+
+EVENTS_PER_DAY = {events_per_day}
+END_TS = {end_ts}
+APPS = {apps}
+
+args = sys.argv[1:]
+device = args[args.index("--device") + 1]
+days = int(args[args.index("--since") + 1].rstrip("d"))
+count = EVENTS_PER_DAY * days
+step = days * 86400 / max(count, 1)
+start = END_TS - days * 86400
+
+out = sys.stdout
+out.write('[{{"id": "aw-import-screentime_' + device + '", "type": "currentwindow", '
+          '"client": "aw-import-screentime", "hostname": "' + device + '", "events": [')
+for i in range(count):
+    # Keyed by the distance from END_TS, so overlapping --since windows return the same events
+    h = zlib.crc32(f"{{device}}:{{count - i}}".encode())
+    app, title = APPS[h % len(APPS)]
+    duration = round(1 + (h >> 8) % 10000 / 10000 * (min(step, 900) - 1), 3)
+    timestamp = datetime.fromtimestamp(start + i * step, timezone.utc).isoformat().replace("+00:00", "Z")
+    out.write((", " if i else "") + json.dumps({{
+        "id": i, "timestamp": timestamp, "duration": duration, "duration_seconds": duration,
+        "data": {{"app": app, "title": title}},
+    }}))
+out.write('], "created": "2026-01-01T00:00:00Z"}}]\\n')
+"""
+
+
+def make_aw_binary(path: Path, events_per_day: int, end_ts: float) -> Path:
+    """
+    Writes an executable fake aw-import-screentime. Each device ID gets its
+    own deterministic event stream; --since bounds the history like the real
+    tool (the collector never asks for more than 28 days).
+    """
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(AW_SCRIPT.format(python=sys.executable, events_per_day=int(events_per_day),
+                                     end_ts=float(end_ts), apps=json.dumps(MOBILE_APPS)))
+    path.chmod(0o755)
+    return path
+
+
+def make_csv_history(path: Path, days: int, sources: list[str], events_per_day: int,
+                     end_ts: float, seed: int = 42) -> int:
+    """
+    Writes a screentime.csv with events_per_day events per source and day
+    over `days` days before end_ts, in timestamp order. Returns the row count.
+    """
+    rng = random.Random(seed)
+    apps = [(bundle, bundle.rsplit(".", 1)[-1]) for bundle in MAC_BUNDLES] + MOBILE_APPS
+    count = days * events_per_day * len(sources)
+    step = days * 86400 / max(count, 1)
+    start = end_ts - days * 86400
+
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["timestamp", "app", "title", "duration", "source"])
+        for i in range(count):
+            app, title = apps[rng.randrange(len(apps))]
+            timestamp = datetime.fromtimestamp(start + i * step, timezone.utc).isoformat()
+            writer.writerow([timestamp, app, title, round(rng.uniform(1, 900), 2), sources[i % len(sources)]])
+    return count
+
+
+class StubServer:
+    """
+    Local HTTP server standing in for Home Assistant / InfluxDB.
+
+    Every POST sleeps `latency` seconds, records (path, body) and answers with
+    `status`. Use as a context manager; `url` is the base URL to point at.
+    """
+
+    def __init__(self, latency: float = 0.0, status: int = 200):
+        self.latency = latency
+        self.status = status
+        self.requests = []
+        self._lock = threading.Lock()
+
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"  # Keep-alive, like the real servers
+
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+                time.sleep(stub.latency)
+                with stub._lock:
+                    stub.requests.append((self.path, body))
+                self.send_response(stub.status)
+                body = b"" if stub.status == 204 else b"{}"
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.server.daemon_threads = True
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}"
+
+    def __enter__(self):
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *exc):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class StubMqttBroker:
+    """
+    Minimal MQTT 3.1.1 broker for local runs: accepts any client, acknowledges
+    CONNECT, QoS 1 PUBLISH and PINGREQ, and records (topic, payload, retain)
+    of every publish. Messages are not forwarded to subscribers.
+    """
+
+    def __init__(self, latency: float = 0.0):
+        import socketserver
+
+        self.latency = latency
+        self.messages = []
+        self._lock = threading.Lock()
+        broker = self
+
+        class Handler(socketserver.BaseRequestHandler):
+            def read_exact(self, size):
+                data = b""
+                while len(data) < size:
+                    chunk = self.request.recv(size - len(data))
+                    if not chunk:
+                        raise ConnectionError
+                    data += chunk
+                return data
+
+            def handle(self):
+                try:
+                    while True:
+                        header = self.read_exact(1)[0]
+                        length, shift = 0, 0
+                        while True:
+                            byte = self.read_exact(1)[0]
+                            length |= (byte & 0x7F) << shift
+                            shift += 7
+                            if not byte & 0x80:
+                                break
+                        body = self.read_exact(length)
+                        broker._handle(self.request, header, body)
+                except (ConnectionError, OSError):
+                    pass
+
+        self.server = socketserver.ThreadingTCPServer(("127.0.0.1", 0), Handler)
+        self.server.daemon_threads = True
+        self.port = self.server.server_address[1]
+
+    def _handle(self, sock, header, body):
+        kind = header >> 4
+        if kind == 1:  # CONNECT -> CONNACK accepted
+            sock.sendall(b"\x20\x02\x00\x00")
+        elif kind == 3:  # PUBLISH
+            qos = (header >> 1) & 0x03
+            topic_len = int.from_bytes(body[:2], "big")
+            topic = body[2:2 + topic_len].decode()
+            rest = body[2 + topic_len:]
+            packet_id, payload = (rest[:2], rest[2:]) if qos else (None, rest)
+            time.sleep(self.latency)
+            with self._lock:
+                self.messages.append((topic, payload.decode(), bool(header & 0x01)))
+            if qos == 1:
+                sock.sendall(b"\x40\x02" + packet_id)
+        elif kind == 12:  # PINGREQ -> PINGRESP
+            sock.sendall(b"\xd0\x00")
+        elif kind == 14:  # DISCONNECT
+            raise ConnectionError
+
+    def retained(self) -> dict:
+        """Last retained payload per topic, as a broker would hand it to new subscribers."""
+        with self._lock:
+            return {topic: payload for topic, payload, retain in self.messages if retain}
+
+    def __enter__(self):
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *exc):
+        self.server.shutdown()
+        self.server.server_close()
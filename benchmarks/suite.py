@@ -0,0 +1,276 @@
+#!/usr/bin/env python3
+"""
+Benchmark suite: every pipeline stage on synthetic histories
+
+Generates fixtures for each history size (1 day to 3 years):
+  - a knowledgeC.db-shaped SQLite file for the Mac
+  - a fake aw-import-screentime binary emitting Biome-style JSON per device
+  - a screentime.csv history across the Mac and all devices
+
+and runs each stage in its own child process against stub InfluxDB and
+Home Assistant servers (see fixtures.py):
+
+  mac_extract       collector.get_mac_data()
+  mobile_extract    collector.get_mobile_data() for every device (max. 28 days, like the real tool)
+  collect           collector.main(): parallel extraction, dedup, store write
+  load_data         exporter.load_data()
+  daily_aggregates  exporter.calculate_daily_aggregates() (after load_data)
+  influx_export     exporter.export_to_influxdb() (after load_data)
+  ha_publish        exporter.push_homeassistant(): daily rollup from the store + sensor push
+
+Each result records rows, seconds, rows/s and the peak RSS of the child
+process (which includes the stage's setup, e.g. load_data before
+daily_aggregates). Results are written to benchmarks/results/ as JSON;
+--compare prints the change against an earlier results file.
+
+Usage:
+  python3 benchmarks/suite.py [--sizes 1d,30d,1y,3y] [--stages ...] [--devices 2]
+                              [--events-per-day 500] [--fixtures DIR] [--compare FILE]
+"""
+
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+from pathlib import Path
+
+BENCH_DIR = Path(__file__).parent
+SRC_DIR = BENCH_DIR.parent / "src"
+RESULTS_DIR = BENCH_DIR / "results"
+
+SIZES = {"1d": 1, "30d": 30, "1y": 365, "3y": 3 * 365}
+STAGES = ["mac_extract", "mobile_extract", "collect", "load_data", "daily_aggregates",
+          "influx_export", "ha_publish"]
+
+# Share of knowledgeC.db rows that belong to the /app/usage stream
+APP_SHARE = 0.4
+# Stub server latency per request (seconds)
+STUB_LATENCY = 0.002
+
+
+# --- child process: runs one stage --------------------------------------------
+
+def configure(config: dict):
+    """Points collector, exporter and metrics at the fixtures and a scratch directory."""
+    sys.path.insert(0, str(SRC_DIR))
+    import collector
+    import exporter
+    import metrics
+
+    fixtures, work = Path(config["fixtures"]), Path(config["work"])
+    metrics.REPORT_DIR = metrics.METRICS_TEXTFILE_DIR = work / "reports"
+
+    collector.KNOWLEDGE_DB = fixtures / "knowledgeC.db"
+    collector.AW_BIN = Path(config["aw_bin"])
+    collector.MAX_SINCE_DAYS = min(config["days"], collector.MAX_SINCE_DAYS)
+    collector.STORE_BACKEND = "csv"
+    collector.OUTPUT_CSV = work / "screentime.csv"
+    collector.WATERMARK_FILE = work / "watermarks.json"
+    collector.LAST_TIMESTAMP_FILE = work / "screentime.csv.last"
+    collector.DEDUP_DB = work / "dedup.db"
+    collector.DEDUP_BLOOM = work / "dedup.bloom"
+    os.environ["DEVICES"] = ",".join(f"{name}:{device_id}" for name, device_id in config["devices"])
+
+    exporter.STORE_BACKEND = "csv"
+    exporter.CSV_FILE = fixtures / "screentime.csv"
+    exporter.ROLLUP_FILE = work / ".daily_rollup.json"
+    exporter.HA_STATE_FILE = work / ".ha_state.json"
+    exporter.INFLUX_URL, exporter.INFLUX_TOKEN = config["influx_url"], "bench"
+    exporter.HA_URL, exporter.HA_TOKEN = config["ha_url"], "bench"
+    exporter.HA_TRANSPORT = "rest"
+    return collector, exporter
+
+
+def run_stage(stage: str, config: dict) -> dict:
+    collector, exporter = configure(config)
+    rows = None
+
+    if stage in ("daily_aggregates", "influx_export"):
+        df = exporter.load_data()
+
+    start = time.perf_counter()
+    if stage == "mac_extract":
+        rows = len(collector.get_mac_data(0))
+    elif stage == "mobile_extract":
+        rows = sum(len(collector.get_mobile_data(name, device_id, 0)) for name, device_id in config["devices"])
+    elif stage == "collect":
+        collector.main()
+    elif stage == "load_data":
+        rows = len(exporter.load_data())
+    elif stage == "daily_aggregates":
+        exporter.calculate_daily_aggregates(df)
+        rows = len(df)
+    elif stage == "influx_export":
+        exporter.export_to_influxdb(df)
+        rows = len(df)
+    elif stage == "ha_publish":
+        exporter.push_homeassistant()
+    elapsed = time.perf_counter() - start
+
+    if stage == "collect":
+        with open(collector.OUTPUT_CSV) as f:
+            rows = sum(1 for _ in f) - 1  # Without the header
+    exporter.close_connections()
+    return {"rows": rows, "seconds": elapsed}
+
+
+def child_main(stage: str, config_json: str, result_path: str):
+    import contextlib
+    import io
+
+    config = json.loads(config_json)
+    with contextlib.redirect_stdout(io.StringIO()):
+        result = run_stage(stage, config)
+    Path(result_path).write_text(json.dumps(result))
+
+
+# --- parent process -----------------------------------------------------------
+
+def build_fixtures(root: Path, days: int, devices: list[tuple[str, str]], events_per_day: int,
+                   end_ts: float) -> dict:
+    """Creates (or reuses) the fixtures of one history size."""
+    from fixtures import make_csv_history, make_knowledge_db
+
+    root.mkdir(parents=True, exist_ok=True)
+    meta_file = root / "fixtures.json"
+    meta = {"days": days, "devices": [list(device) for device in devices], "events_per_day": events_per_day}
+    if meta_file.exists() and json.loads(meta_file.read_text()).get("params") == meta:
+        return json.loads(meta_file.read_text())
+
+    start = time.perf_counter()
+    make_knowledge_db(root / "knowledgeC.db", int(days * events_per_day / APP_SHARE), end_ts,
+                      days=days, app_share=APP_SHARE)
+    sources = ["Mac"] + [name for name, _ in devices]
+    csv_rows = make_csv_history(root / "screentime.csv", days, sources, events_per_day, end_ts)
+
+    info = {"params": meta, "csv_rows": csv_rows, "end_ts": end_ts,
+            "csv_bytes": (root / "screentime.csv").stat().st_size,
+            "knowledge_bytes": (root / "knowledgeC.db").stat().st_size}
+    meta_file.write_text(json.dumps(info))
+    print(f"  fixtures {days}d: {csv_rows} CSV rows ({info['csv_bytes'] / 1e6:.1f} MB), "
+          f"knowledgeC.db {info['knowledge_bytes'] / 1e6:.1f} MB  [{time.perf_counter() - start:.1f}s]",
+          flush=True)
+    return info
+
+
+def peak_rss_mb(usage) -> float:
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+    return usage.ru_maxrss / (1024 * 1024 if sys.platform == "darwin" else 1024)
+
+
+def run_child(stage: str, config: dict) -> dict:
+    """Runs one stage in a fresh interpreter and adds its peak RSS."""
+    with tempfile.TemporaryDirectory(prefix="screentime-bench-") as work:
+        config = {**config, "work": work}
+        result_path = Path(work) / "result.json"
+        proc = subprocess.Popen(
+            [sys.executable, __file__, "--child", stage, json.dumps(config), str(result_path)],
+            cwd=BENCH_DIR, stdout=subprocess.DEVNULL,
+        )
+        _, status, usage = os.wait4(proc.pid, 0)
+        proc.returncode = os.waitstatus_to_exitcode(status)
+        if proc.returncode:
+            return {"error": f"exit code {proc.returncode}", "peak_rss_mb": round(peak_rss_mb(usage), 1)}
+        result = json.loads(result_path.read_text())
+    result["peak_rss_mb"] = round(peak_rss_mb(usage), 1)
+    return result
+
+
+def git_revision() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=BENCH_DIR,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return ""
+
+
+def compare(results: list[dict], previous_path: Path):
+    previous = {(r["stage"], r["size"]): r for r in json.loads(previous_path.read_text())["results"]}
+    print(f"\nCompared with {previous_path.name}:")
+    print(f"{'stage':>17}  {'size':>4}  {'time':>8}  {'peak RSS':>9}")
+    for r in results:
+        old = previous.get((r["stage"], r["size"]))
+        if not old or "error" in r or "error" in old:
+            continue
+        time_change = r["seconds"] / old["seconds"] - 1 if old["seconds"] else 0.0
+        rss_change = r["peak_rss_mb"] / old["peak_rss_mb"] - 1 if old["peak_rss_mb"] else 0.0
+        print(f"{r['stage']:>17}  {r['size']:>4}  {time_change:>+7.0%}  {rss_change:>+8.0%}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Screen Time exporter benchmark suite")
+    parser.add_argument("--sizes", default=",".join(SIZES), help=f"comma-separated, from {', '.join(SIZES)}")
+    parser.add_argument("--stages", default=",".join(STAGES), help="comma-separated stage names")
+    parser.add_argument("--devices", type=int, default=2, help="mobile devices besides the Mac")
+    parser.add_argument("--events-per-day", type=int, default=500, help="events per device and day")
+    parser.add_argument("--fixtures", type=Path, help="fixture directory to create or reuse (default: temporary)")
+    parser.add_argument("--output", type=Path, help="results file (default: benchmarks/results/suite-<time>.json)")
+    parser.add_argument("--compare", type=Path, help="earlier results file to compare against")
+    args = parser.parse_args()
+
+    sizes = [size.strip() for size in args.sizes.split(",") if size.strip()]
+    stages = [stage.strip() for stage in args.stages.split(",") if stage.strip()]
+    unknown = [s for s in sizes if s not in SIZES] + [s for s in stages if s not in STAGES]
+    if unknown:
+        parser.error(f"unknown size/stage: {', '.join(unknown)}")
+
+    from fixtures import StubServer, make_aw_binary
+
+    devices = [(f"iPhone {i + 1}", f"bench-device-{i + 1}") for i in range(args.devices)]
+    end_ts = time.time()
+    results = []
+
+    with tempfile.TemporaryDirectory(prefix="screentime-fixtures-") as tmp, \
+            StubServer(latency=STUB_LATENCY, status=204) as influx, StubServer(latency=STUB_LATENCY) as ha:
+        fixture_root = args.fixtures or Path(tmp)
+        aw_bin = make_aw_binary(fixture_root / "aw-import-screentime", args.events_per_day, end_ts)
+
+        print(f"{len(devices)} devices + Mac, {args.events_per_day} events per device and day\n")
+        for size in sizes:
+            info = build_fixtures(fixture_root / size, SIZES[size], devices, args.events_per_day, end_ts)
+            config = {"fixtures": str(fixture_root / size), "days": SIZES[size], "devices": devices,
+                      "aw_bin": str(aw_bin), "influx_url": influx.url, "ha_url": ha.url}
+
+            for stage in stages:
+                result = run_child(stage, config)
+                if result.get("rows") is None and "error" not in result:
+                    result["rows"] = info["csv_rows"]
+                if "error" not in result:
+                    result["rows_per_second"] = round(result["rows"] / result["seconds"]) if result["seconds"] else 0
+                results.append({"stage": stage, "size": size, **result})
+
+                if "error" in result:
+                    print(f"{stage:>17}  {size:>4}  FAILED ({result['error']})", flush=True)
+                else:
+                    print(f"{stage:>17}  {size:>4}  {result['rows']:>9} rows  {result['seconds']:>8.3f}s  "
+                          f"{result['rows_per_second']:>10}/s  {result['peak_rss_mb']:>7.1f} MB", flush=True)
+
+    output = args.output or RESULTS_DIR / f"suite-{datetime.now().strftime('%Y%m%d-%H%M%S')}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps({
+        "created": datetime.now().isoformat(),
+        "revision": git_revision(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "devices": len(devices),
+        "events_per_day": args.events_per_day,
+        "results": results,
+    }, indent=2))
+    print(f"\nResults written to {output}")
+
+    if args.compare:
+        compare(results, args.compare)
+
+    return 1 if any("error" in r for r in results) else 0
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == "--child":
+        child_main(*sys.argv[2:5])
+    else:
+        sys.exit(main())
@@ -4,10 +4,21 @@ Apple Screen Time Exporter - Main Pipeline
 
 1. Collects data from Mac (knowledgeC.db) and iPhone (Biome)
 2. Exports to Home Assistant (and InfluxDB)
+
+Usage:
+  python3 run.py           # one-shot: collect + export, then exit (launchd StartInterval)
+  python3 run.py daemon    # keep running and schedule collect/export cycles in-process
+  python3 run.py ingest    # aggregator: receive events from pushing collectors + export cycles
 """
 
+import argparse
+import os
+import signal
 import subprocess
 import sys
+import threading
+import time
+import traceback
 from datetime import datetime
 from pathlib import Path
 
@@ -34,7 +45,7 @@ def run_script(name: str, display_name: str) -> bool:
     return result.returncode == 0
 
 
-def main():
+def run_once() -> int:
     print(f"╔{'═'*62}╗")
     print(f"║  Apple Screen Time Exporter - {datetime.now().strftime('%Y-%m-%d %H:%M')}       ║")
     print(f"╚{'═'*62}╝")
@@ -57,5 +68,121 @@ def main():
     return 0 if (collect_ok and export_ok) else 1
 
 
+def run_cycle(name: str, func) -> bool:
+    """
+    Runs one collect/export cycle in-process; errors are logged, not raised.
+    A cycle fails if it raises or returns False (e.g. an incomplete export).
+    """
+    print(f"\n{'='*60}")
+    print(f">>> {name} - {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
+    print('='*60, flush=True)
+
+    start = time.monotonic()
+    try:
+        ok = func() is not False
+    except Exception:
+        traceback.print_exc()
+        ok = False
+
+    print(f"[Daemon] {name} {'✓' if ok else '✗'} ({time.monotonic() - start:.1f}s)", flush=True)
+    return ok
+
+
+def run_daemon() -> int:
+    """
+    Keeps one process alive and runs collect/export cycles on a schedule.
+
+    Modules are imported once, so pandas/requests imports, mapping tables,
+    watermarks, the dedup index, the daily rollup and HTTP sessions stay
+    warm between cycles. SIGTERM/SIGINT finish the running cycle and exit.
+    """
+    sys.path.insert(0, str(SRC_DIR))
+    import collector
+    import exporter
+
+    collect_interval = float(os.getenv("COLLECT_INTERVAL", "300"))
+    export_interval = float(os.getenv("EXPORT_INTERVAL", str(collect_interval)))
+
+    stop = threading.Event()
+
+    def request_stop(signum, frame):
+        print(f"\n[Daemon] Received {signal.Signals(signum).name} - stopping after the current cycle", flush=True)
+        stop.set()
+
+    signal.signal(signal.SIGTERM, request_stop)
+    signal.signal(signal.SIGINT, request_stop)
+
+    print(f"[Daemon] Started (collect every {collect_interval:g}s, export every {export_interval:g}s)", flush=True)
+
+    next_collect = next_export = time.monotonic()
+    while not stop.is_set():
+        if time.monotonic() >= next_collect:
+            run_cycle("Collect", collector.main)
+            next_collect = time.monotonic() + collect_interval
+            # With a persistent MQTT connection, push sensor deltas right away
+            if exporter.HA_TRANSPORT == "mqtt" and not stop.is_set():
+                run_cycle("Push", exporter.push_homeassistant)
+
+        if not stop.is_set() and time.monotonic() >= next_export:
+            run_cycle("Export", exporter.main)
+            next_export = time.monotonic() + export_interval
+
+        stop.wait(max(0.0, min(next_collect, next_export) - time.monotonic()))
+
+    exporter.close_connections()
+    print("[Daemon] Stopped", flush=True)
+    return 0
+
+
+def run_ingest() -> int:
+    """
+    Aggregator for several Macs: serves the ingest API (src/ingest.py) that
+    collectors in push mode send their events to, and runs export cycles on
+    the combined store. Exports hold the store lock, so they never see a
+    half-stored batch. SIGTERM/SIGINT finish the running cycle and exit.
+    """
+    sys.path.insert(0, str(SRC_DIR))
+    import exporter
+    import ingest
+
+    export_interval = float(os.getenv("EXPORT_INTERVAL", os.getenv("COLLECT_INTERVAL", "300")))
+
+    stop = threading.Event()
+
+    def request_stop(signum, frame):
+        print(f"\n[Ingest] Received {signal.Signals(signum).name} - stopping after the current cycle", flush=True)
+        stop.set()
+
+    signal.signal(signal.SIGTERM, request_stop)
+    signal.signal(signal.SIGINT, request_stop)
+
+    server = ingest.start_server()
+    print(f"[Ingest] Export every {export_interval:g}s", flush=True)
+
+    while not stop.is_set():
+        with ingest.STORE_LOCK:
+            run_cycle("Export", exporter.main)
+        stop.wait(export_interval)
+
+    server.shutdown()
+    exporter.close_connections()
+    print("[Ingest] Stopped", flush=True)
+    return 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Apple Screen Time Exporter")
+    parser.add_argument("mode", nargs="?", choices=["once", "daemon", "ingest"], default="once",
+                        help="once (default): collect + export and exit; daemon: keep running; "
+                             "ingest: receive events from other Macs and export them")
+    args = parser.parse_args()
+
+    if args.mode == "daemon":
+        return run_daemon()
+    if args.mode == "ingest":
+        return run_ingest()
+    return run_once()
+
+
 if __name__ == "__main__":
     sys.exit(main())
@@ -0,0 +1,484 @@
+#!/usr/bin/env python3
+"""
+Apple Screen Time Exporter - Aggregates
+Time-bucketed rollups (by device, app, category, session count) for
+Home Assistant: hourly and daily buckets in the local timezone
+plus rolling windows (last hour / 24h / 7d), and overlap-free "active"
+screen time from the union of usage intervals.
+
+Durations are summed as integer hundredths of a second. The collector
+rounds every duration to 2 decimals, so these sums are exact and the
+result does not depend on how often or in which order rows were added.
+
+Bucket assignment works on integer epoch seconds: the local UTC offset is
+looked up once per distinct quarter hour, never per row.
+"""
+
+import hashlib
+import json
+import math
+import time
+from datetime import date, datetime, timezone
+from pathlib import Path
+
+from config import CATEGORIES, TITLE_NORMALIZE
+from state import atomic_write_text
+from store import UNITS_PER_SECOND
+
+# Rollup dimensions: event column -> key in each bucket's rollup
+DIMENSIONS = {"source": "by_device", "title": "by_app", "category": "by_category"}
+
+# Rolling windows (label -> seconds), resolved on hourly buckets (see window_rollup)
+WINDOWS = {"1h": 3600, "24h": 86400, "7d": 7 * 86400}
+
+# Hourly buckets kept in the persisted rollup (enough for the longest window)
+HOUR_RETENTION = max(WINDOWS.values()) + 86400
+
+TOP_K = 10
+
+ROLLUP_VERSION = 3
+
+# Key of the cross-device union in active-time results
+ALL_DEVICES = "all"
+
+# UTC offsets only change on quarter-hour boundaries
+_OFFSET_STEP = 900
+
+
+def config_fingerprint() -> str:
+    """Hash of the mapping tables; a change invalidates stored rollups."""
+    tables = json.dumps([TITLE_NORMALIZE, CATEGORIES], sort_keys=True)
+    return hashlib.sha1(tables.encode()).hexdigest()
+
+
+# --- Bucket arithmetic (numpy arrays of epoch seconds) ---
+
+def local_offsets(unix_ts):
+    """Local UTC offset in seconds for each epoch timestamp."""
+    import numpy as np
+
+    steps, inverse = np.unique(np.asarray(unix_ts, dtype="int64") // _OFFSET_STEP, return_inverse=True)
+    offsets = np.array([time.localtime(int(s) * _OFFSET_STEP).tm_gmtoff for s in steps], dtype="int64")
+    return offsets[inverse.reshape(-1)]
+
+
+def hour_starts(unix_ts, offsets=None):
+    """Epoch second at which each timestamp's local hour starts."""
+    import numpy as np
+
+    unix_ts = np.asarray(unix_ts, dtype="int64")
+    if offsets is None:
+        offsets = local_offsets(unix_ts)
+    return unix_ts - (unix_ts + offsets) % 3600
+
+
+def local_days(unix_ts, offsets=None):
+    """Local calendar day of each timestamp, as days since 1970-01-01."""
+    import numpy as np
+
+    unix_ts = np.asarray(unix_ts, dtype="int64")
+    if offsets is None:
+        offsets = local_offsets(unix_ts)
+    return (unix_ts + offsets) // 86400
+
+
+def day_starts(days):
+    """Epoch second of local midnight for each day index."""
+    import numpy as np
+
+    days = np.asarray(days, dtype="int64")
+    unique, inverse = np.unique(days, return_inverse=True)
+    starts = np.array([int(time.mktime(datetime.fromtimestamp(int(d) * 86400, timezone.utc)
+                                       .replace(tzinfo=None).timetuple())) for d in unique], dtype="int64")
+    return starts[inverse.reshape(-1)]
+
+
+def day_index(day: date) -> int:
+    return (day - date(1970, 1, 1)).days
+
+
+def _day_label(day: int) -> str:
+    """Days since the epoch -> ISO date."""
+    return datetime.fromtimestamp(int(day) * 86400, timezone.utc).date().isoformat()
+
+
+# --- Rollups ---
+
+def empty_rollup() -> dict:
+    return {"count": 0, **{key: {} for key in DIMENSIONS.values()}}
+
+
+def _bucket_rollups(df, column: str, label) -> dict:
+    """Rolls up df per value of a bucket column; label turns bucket values into keys."""
+    labels = {}
+    buckets = {}
+    for bucket, count in df.groupby(column).size().items():
+        labels[bucket] = label(bucket)
+        buckets[labels[bucket]] = {"count": int(count), **{key: {} for key in DIMENSIONS.values()}}
+
+    for dimension, key in DIMENSIONS.items():
+        sums = df.groupby([column, dimension], observed=True)["cents"].sum()
+        for (bucket, value), cents in sums.items():
+            buckets[labels[bucket]][key][value] = int(cents)
+
+    return buckets
+
+
+def rollup_frame(df, hours_since: float | None = None) -> dict:
+    """
+    Rolls up prepared events (unix_ts, duration, source, title, category) into
+        {"hours": {"<hour start epoch>": rollup}, "days": {"YYYY-MM-DD": rollup}}
+    where each rollup is {"count": n, "by_device": {...}, "by_app": {...},
+    "by_category": {...}} with durations in hundredths of a second.
+    Hours and days are local; hourly buckets are only built for hours
+    starting at or after hours_since.
+    """
+    if df.empty:
+        return {"hours": {}, "days": {}}
+
+    offsets = local_offsets(df["unix_ts"])
+    df = df.assign(
+        hour=hour_starts(df["unix_ts"], offsets),
+        day=local_days(df["unix_ts"], offsets),
+        cents=(df["duration"] * 100).round().astype("int64"),
+    )
+
+    recent = df if hours_since is None else df[df["hour"] >= hours_since]
+    return {
+        "hours": _bucket_rollups(recent, "hour", str),
+        "days": _bucket_rollups(df, "day", _day_label),
+    }
+
+
+def bucket_totals(df) -> dict:
+    """
+    Totals per (bucket start, source, app, title, category) for local hours
+    and days, as {"hourly": frame, "daily": frame} with columns start
+    (epoch seconds), the tag columns, cents and count.
+    """
+    offsets = local_offsets(df["unix_ts"])
+    df = df.assign(
+        hour=hour_starts(df["unix_ts"], offsets),
+        day=local_days(df["unix_ts"], offsets),
+        cents=(df["duration"] * 100).round().astype("int64"),
+    )
+
+    tags = ["source", "app", "title", "category"]
+    totals = {}
+    for name, column in [("hourly", "hour"), ("daily", "day")]:
+        grouped = (df.groupby([column, *tags], observed=True)["cents"]
+                   .agg(cents="sum", count="size").reset_index())
+        grouped["start"] = grouped[column] if column == "hour" else day_starts(grouped[column])
+        totals[name] = grouped[["start", *tags, "cents", "count"]]
+    return totals
+
+
+def touched_days(unix_ts) -> tuple[list[int], int, int]:
+    """
+    Local days containing the given timestamps, plus the epoch range
+    [start, end) from the first touched midnight to the end of the last day.
+    """
+    import numpy as np
+
+    days = np.unique(local_days(unix_ts))
+    start, end = day_starts([days[0], days[-1] + 1])
+    return days.tolist(), int(start), int(end)
+
+
+# --- Interval union (overlap-free screen time) ---
+
+def interval_columns(df):
+    """(start, end) of each event in hundredths of a second since the epoch."""
+    per_second = UNITS_PER_SECOND[df["timestamp"].dt.unit]
+    values = df["timestamp"].array.asi8
+    starts = values // (per_second // 100) if per_second >= 100 else values * (100 // per_second)
+    ends = starts + (df["duration"] * 100).round().astype("int64").to_numpy()
+    return starts, ends
+
+
+def union_segments(starts, ends):
+    """
+    Merges [start, end) intervals into disjoint segments with a sweep over
+    the intervals sorted by start: a segment ends where the next start lies
+    beyond the running maximum of all ends so far. O(n log n).
+    """
+    import numpy as np
+
+    order = np.argsort(starts, kind="stable")
+    starts, ends = np.asarray(starts)[order], np.asarray(ends)[order]
+    if not len(starts):
+        return starts, ends
+
+    reach = np.maximum.accumulate(ends)
+    first = np.ones(len(starts), dtype=bool)
+    first[1:] = starts[1:] > reach[:-1]
+    heads = np.flatnonzero(first)
+    return starts[heads], reach[np.r_[heads[1:] - 1, len(starts) - 1]]
+
+
+def union_length(starts, ends, groups, n_groups: int):
+    """
+    Length of the interval union per group (groups: codes 0..n_groups-1),
+    for all groups in one sweep. Each group is shifted into its own range
+    so the running maximum never carries over from one group to the next.
+    """
+    import numpy as np
+
+    starts, ends, groups = (np.asarray(a, dtype="int64") for a in (starts, ends, groups))
+    totals = np.zeros(n_groups, dtype="int64")
+    if not len(starts):
+        return totals
+
+    base = starts.min()
+    span = int(max(ends.max(), starts.max()) - base) + 1
+    segment_starts, segment_ends = union_segments(starts - base + groups * span, ends - base + groups * span)
+    np.add.at(totals, segment_starts // span, segment_ends - segment_starts)
+    return totals
+
+
+def active_totals(df) -> dict:
+    """
+    Overlap-free time per local hour and day, per device and across all
+    devices (source ALL_DEVICES), as {"hourly": frame, "daily": frame} with
+    columns start (epoch seconds), source and cents. Events count toward the
+    bucket they start in.
+    """
+    import numpy as np
+    import pandas as pd
+
+    starts, ends = interval_columns(df)
+    offsets = local_offsets(df["unix_ts"])
+    buckets = {
+        "hourly": hour_starts(df["unix_ts"], offsets),
+        "daily": day_starts(local_days(df["unix_ts"], offsets)),
+    }
+    source_codes, sources = pd.factorize(df["source"].astype(object).to_numpy())
+
+    totals = {}
+    for name, bucket in buckets.items():
+        bucket_codes, bucket_values = pd.factorize(np.asarray(bucket, dtype="int64"))
+        # (bucket, source) pairs as one integer code; all devices use an extra source slot
+        pair_codes, pairs = pd.factorize(bucket_codes * (len(sources) + 1) + source_codes)
+        per_device = union_length(starts, ends, pair_codes, len(pairs))
+        combined = union_length(starts, ends, bucket_codes, len(bucket_values))
+        totals[name] = pd.DataFrame({
+            "start": np.concatenate([bucket_values[pairs // (len(sources) + 1)], bucket_values]),
+            "source": np.concatenate([sources[pairs % (len(sources) + 1)],
+                                      np.full(len(bucket_values), ALL_DEVICES, dtype=object)]),
+            "cents": np.concatenate([per_device, combined]),
+        })
+    return totals
+
+
+def _union_by_day(starts, ends, days, sources) -> dict:
+    """{(day, source): cents} of overlap-free time, including source ALL_DEVICES."""
+    import pandas as pd
+
+    day_codes, day_values = pd.factorize(days)
+    source_codes, source_values = pd.factorize(sources)
+    pair_codes, pairs = pd.factorize(day_codes * len(source_values) + source_codes)
+    totals = {}
+    for pair, cents in zip(pairs.tolist(), union_length(starts, ends, pair_codes, len(pairs)).tolist()):
+        totals[(int(day_values[pair // len(source_values)]), source_values[pair % len(source_values)])] = cents
+    for day, cents in zip(day_values.tolist(), union_length(starts, ends, day_codes, len(day_values)).tolist()):
+        totals[(day, ALL_DEVICES)] = cents
+    return totals
+
+
+def merge_rollups(target: dict, new: dict):
+    """Adds the per-bucket rollups in new to target, in place."""
+    for label, bucket in new.items():
+        existing = target.setdefault(label, empty_rollup())
+        existing["count"] += bucket["count"]
+        for key in DIMENSIONS.values():
+            totals = existing[key]
+            for value, cents in bucket[key].items():
+                totals[value] = totals.get(value, 0) + cents
+
+
+def prorate_rollup(bucket: dict, fraction: float) -> dict:
+    """Scales a rollup to the given fraction of its bucket (counts rounded up, as sessions overlap it)."""
+    return {
+        "count": math.ceil(bucket["count"] * fraction),
+        **{key: {value: round(cents * fraction) for value, cents in bucket[key].items()}
+           for key in DIMENSIONS.values()},
+    }
+
+
+def window_rollup(hours: dict, now: float, seconds: int) -> dict:
+    """
+    Merges the hourly buckets of the last `seconds` before now. The hour the
+    window starts in only partly belongs to it and is prorated by the share
+    that does (events are assumed to be spread evenly over the hour).
+    """
+    start = now - seconds
+    window = {}
+    for hour, bucket in hours.items():
+        hour = int(hour)
+        if hour + 3600 <= start or hour > now:
+            continue
+        if hour < start:
+            bucket = prorate_rollup(bucket, (hour + 3600 - start) / 3600)
+        merge_rollups(window, {"window": bucket})
+    return window.get("window", empty_rollup())
+
+
+def _minutes(cents: int) -> float:
+    return round(cents / 100 / 60, 1)
+
+
+def top_k(totals: dict, k: int = TOP_K) -> list[tuple]:
+    """Largest (value, cents) pairs, ties broken by name."""
+    return sorted(totals.items(), key=lambda item: (-item[1], item[0]))[:k]
+
+
+def aggregates_from_rollup(day: dict | None, top: int = TOP_K) -> dict | None:
+    """
+    Converts one bucket's rollup into the Home Assistant aggregate format.
+    Only apps are cut to the top `top`; devices and categories are few
+    (configured) and reported in full.
+    """
+    if not day or not day["count"]:
+        return None
+
+    app_totals = top_k(day["by_app"], top)
+    top_app, top_app_cents = app_totals[0] if app_totals else ("Unknown", 0)
+
+    return {
+        "total_minutes": _minutes(sum(day["by_device"].values())),
+        "by_device": {k: _minutes(v) for k, v in sorted(day["by_device"].items())},
+        "top_app": top_app,
+        "top_app_minutes": _minutes(top_app_cents),
+        "by_category": {k: _minutes(v) for k, v in sorted(day["by_category"].items())},
+        "by_app": {k: _minutes(v) for k, v in app_totals},
+        "session_count": day["count"],
+        **({"active_minutes": _minutes(day["active"][ALL_DEVICES]),
+            "active_by_device": {k: _minutes(v) for k, v in sorted(day["active"].items()) if k != ALL_DEVICES}}
+           if "active" in day else {}),
+    }
+
+
+class DailyRollup:
+    """
+    Persisted local-day and recent-hour rollups that track how far into the
+    event store they have read, so each run only processes newly appended
+    events. Hourly buckets older than HOUR_RETENTION are dropped on save.
+
+    Days also carry "active": overlap-free cents per device and across all
+    devices (ALL_DEVICES). The union segments behind it are kept for the
+    same retention, so late events within it are merged exactly.
+    """
+
+    def __init__(self, path: Path, store_id: str):
+        self.path = Path(path)
+        self.store_id = store_id
+        self.offset = 0
+        self.days = {}
+        self.hours = {}
+        self.segments = {}  # day label -> {source: [[start, end], ...]} in 1/100 s
+
+    @classmethod
+    def load(cls, path: Path, store_id: str) -> "DailyRollup":
+        """Loads the rollup, starting over if the store or config changed."""
+        rollup = cls(path, store_id)
+        if not rollup.path.exists():
+            return rollup
+
+        try:
+            data = json.loads(rollup.path.read_text())
+        except (OSError, ValueError):
+            return rollup
+
+        if (data.get("version") == ROLLUP_VERSION and data.get("store") == store_id
+                and data.get("config") == config_fingerprint()):
+            rollup.offset = data["offset"]
+            rollup.days = data["days"]
+            rollup.hours = data["hours"]
+            rollup.segments = data["segments"]
+        return rollup
+
+    def reset(self):
+        self.offset = 0
+        self.days = {}
+        self.hours = {}
+        self.segments = {}
+
+    def add(self, df, offset: int):
+        """Adds newly read, prepared events and records the new store offset."""
+        rolled = rollup_frame(df, hours_since=time.time() - HOUR_RETENTION)
+        merge_rollups(self.days, rolled["days"])
+        merge_rollups(self.hours, rolled["hours"])
+        self._add_active(df)
+        self.offset = offset
+
+    def _add_active(self, df):
+        """
+        Merges the new intervals into the union segments of each touched
+        day. Days before the retention window (a rebuild, or late events)
+        are computed in one vectorised pass without segments and added to
+        the stored totals, so overlap across two runs is not removed there.
+        """
+        if df.empty:
+            return
+
+        import numpy as np
+        import pandas as pd
+
+        starts, ends = interval_columns(df)
+        days = local_days(df["unix_ts"])
+        sources = df["source"].astype(object).to_numpy()
+        recent = days >= day_index(datetime.fromtimestamp(time.time() - HOUR_RETENTION).date())
+
+        old = ~recent
+        if old.any():
+            for (day, source), cents in _union_by_day(starts[old], ends[old], days[old], sources[old]).items():
+                label = _day_label(day)
+                if label not in self.segments:
+                    active = self.days[label].setdefault("active", {})
+                    active[source] = active.get(source, 0) + cents
+
+        touched = set()
+        keys = pd.MultiIndex.from_arrays([days[recent], sources[recent]])
+        positions = np.flatnonzero(recent)
+        for (day, source), group in pd.Series(positions).groupby(keys).indices.items():
+            label = _day_label(day)
+            rows = positions[group]
+            previous = np.array(self.segments.get(label, {}).get(source, []), dtype="int64").reshape(-1, 2)
+            seg_starts, seg_ends = union_segments(np.concatenate([previous[:, 0], starts[rows]]),
+                                                  np.concatenate([previous[:, 1], ends[rows]]))
+            self.segments.setdefault(label, {})[source] = np.column_stack([seg_starts, seg_ends]).tolist()
+            touched.add(label)
+
+        for label in touched:
+            devices = self.segments[label]
+            active = {source: sum(end - start for start, end in segments) for source, segments in devices.items()}
+            everything = np.array([seg for segments in devices.values() for seg in segments], dtype="int64")
+            seg_starts, seg_ends = union_segments(everything[:, 0], everything[:, 1])
+            active[ALL_DEVICES] = int((seg_ends - seg_starts).sum())
+            self.days[label]["active"] = active
+
+    def save(self):
+        cutoff = time.time() - HOUR_RETENTION
+        self.hours = {hour: bucket for hour, bucket in self.hours.items() if int(hour) >= cutoff}
+        oldest = datetime.fromtimestamp(cutoff).date().isoformat()
+        self.segments = {label: segments for label, segments in self.segments.items() if label >= oldest}
+
+        data = {
+            "version": ROLLUP_VERSION,
+            "store": self.store_id,
+            "config": config_fingerprint(),
+            "offset": self.offset,
+            "days": self.days,
+            "hours": self.hours,
+            "segments": self.segments,
+        }
+        atomic_write_text(self.path, json.dumps(data))
+
+    def aggregates(self, target_date: date) -> dict | None:
+        return aggregates_from_rollup(self.days.get(target_date.isoformat()))
+
+    def window_aggregates(self, now: float | None = None) -> dict:
+        """{"1h": aggregates, "24h": ..., "7d": ...}; None for windows without events."""
+        now = time.time() if now is None else now
+        return {label: aggregates_from_rollup(window_rollup(self.hours, now, seconds))
+                for label, seconds in WINDOWS.items()}
@@ -0,0 +1,154 @@
+#!/usr/bin/env python3
+"""
+Apple Screen Time Exporter - Biome
+Streaming reader for aw-import-screentime output.
+
+`aw-import-screentime events preview` prints one JSON document:
+
+  [{"id": ..., "events": [{"timestamp": ..., "duration_seconds": ..., "data": {...}}, ...]}]
+
+Instead of loading the whole dump, the events of the first bucket are
+decoded one at a time from the child's stdout, so memory use stays
+constant no matter how much history the device has.
+"""
+
+import codecs
+import json
+import subprocess
+import threading
+
+READ_CHUNK = 64 * 1024
+
+_WHITESPACE = " \t\n\r"
+
+
+class _StreamDecoder:
+    """Incrementally decodes JSON values from a binary stream."""
+
+    def __init__(self, stream):
+        self.stream = stream
+        self.decoder = codecs.getincrementaldecoder("utf-8")()
+        self.json = json.JSONDecoder()
+        self.buf = ""
+        self.pos = 0
+        self.eof = False
+
+    def _fill(self) -> bool:
+        """Reads the next chunk into the buffer. Returns False at EOF."""
+        if self.eof:
+            return False
+
+        chunk = self.stream.read(READ_CHUNK)
+        if not chunk:
+            self.eof = True
+            self.buf = self.buf[self.pos:] + self.decoder.decode(b"", final=True)
+        else:
+            self.buf = self.buf[self.pos:] + self.decoder.decode(chunk)
+        self.pos = 0
+        return True
+
+    def peek(self) -> str:
+        """Returns the next non-whitespace character ("" at EOF) without consuming it."""
+        while True:
+            while self.pos < len(self.buf) and self.buf[self.pos] in _WHITESPACE:
+                self.pos += 1
+            if self.pos < len(self.buf):
+                return self.buf[self.pos]
+            if not self._fill():
+                return ""
+
+    def expect(self, char: str):
+        found = self.peek()
+        if found != char:
+            raise ValueError(f"Expected '{char}' in aw-import-screentime output, got '{found or 'EOF'}'")
+        self.pos += 1
+
+    def value(self):
+        """Decodes the next complete JSON value."""
+        self.peek()
+        while True:
+            try:
+                value, end = self.json.raw_decode(self.buf, self.pos)
+            except json.JSONDecodeError:
+                if self._fill():
+                    continue
+                raise
+            # A number at the very end of the buffer may continue in the next chunk
+            if end == len(self.buf) and self._fill():
+                continue
+            self.pos = end
+            return value
+
+
+def iter_events(stream):
+    """
+    Yields the events of the first bucket from a binary stream, one at a time.
+    Nothing is yielded if the output has no buckets or no "events" key.
+    """
+    reader = _StreamDecoder(stream)
+
+    reader.expect("[")
+    if reader.peek() == "]":
+        return
+    reader.expect("{")
+
+    while reader.peek() != "}":
+        key = reader.value()
+        reader.expect(":")
+
+        if key != "events":
+            reader.value()
+        else:
+            reader.expect("[")
+            while reader.peek() != "]":
+                yield reader.value()
+                if reader.peek() == ",":
+                    reader.pos += 1
+            # Only the first bucket is used, the rest of the output is ignored
+            return
+
+        if reader.peek() == ",":
+            reader.pos += 1
+
+
+def stream_command_events(cmd: list[str], timeout: float):
+    """
+    Runs cmd and yields the events from its stdout while it is running.
+    Raises CalledProcessError / TimeoutExpired like subprocess.run(check=True).
+    """
+    proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+    timed_out = threading.Event()
+
+    def kill():
+        timed_out.set()
+        proc.kill()
+
+    timer = threading.Timer(timeout, kill)
+    timer.start()
+    try:
+        try:
+            yield from iter_events(proc.stdout)
+        except ValueError:
+            # Truncated output from a killed or failing child - report that instead
+            returncode = proc.wait()
+            if timed_out.is_set():
+                raise subprocess.TimeoutExpired(cmd, timeout)
+            if returncode:
+                raise subprocess.CalledProcessError(returncode, cmd)
+            raise
+
+        # Let the child finish writing whatever follows the events
+        while proc.stdout.read(READ_CHUNK):
+            pass
+        returncode = proc.wait()
+    finally:
+        timer.cancel()
+        if proc.poll() is None:
+            proc.kill()
+            proc.wait()
+        proc.stdout.close()
+
+    if timed_out.is_set():
+        raise subprocess.TimeoutExpired(cmd, timeout)
+    if returncode:
+        raise subprocess.CalledProcessError(returncode, cmd)
@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+"""
+Apple Screen Time Exporter - Coalescing
+Merges contiguous usage fragments of the same (source, app) into sessions.
+
+Biome and knowledgeC record many short, back-to-back fragments for one
+app session. With a gap tolerance of G seconds, a fragment starting at most
+G seconds after the end of the previous fragment of the same (source, app)
+is folded into it. The merged event keeps the first fragment's timestamp
+and the exact sum of the fragment durations (gaps are not counted), so
+totals do not change - only the number of rows does.
+"""
+
+from datetime import datetime, timezone
+
+# Durations are rounded to 2 decimals, so "back-to-back" may be off by that much
+_TOLERANCE = 0.005
+
+
+def _start_seconds(timestamp: str) -> float:
+    dt = datetime.fromisoformat(timestamp.replace("Z", "+00:00"))
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    return dt.timestamp()
+
+
+def coalesce_events(events: list[dict], gap_seconds: float) -> list[dict]:
+    """
+    Returns the events with near-contiguous fragments of the same
+    (source, app) merged, sorted by start time. Durations are summed in
+    hundredths of a second, so the total is exact. The merged event keeps
+    the largest _created_at of its fragments (for the watermarks).
+    """
+    by_key = {}
+    for ev in events:
+        by_key.setdefault((ev["source"], ev["app"]), []).append((_start_seconds(ev["timestamp"]), ev))
+
+    merged = []
+    for fragments in by_key.values():
+        fragments.sort(key=lambda item: item[0])
+        current, current_end, cents = None, 0.0, 0
+
+        for start, ev in fragments:
+            duration = float(ev["duration"])
+            if current is not None and start <= current_end + gap_seconds + _TOLERANCE:
+                cents += round(duration * 100)
+                current_end = max(current_end, start + duration)
+                if ev.get("_created_at", 0) > current.get("_created_at", 0):
+                    current["_created_at"] = ev["_created_at"]
+                continue
+
+            if current is not None:
+                current["duration"] = cents / 100
+                merged.append((current_start, current))
+            current, current_start = dict(ev), start
+            current_end, cents = start + duration, round(duration * 100)
+
+        if current is not None:
+            current["duration"] = cents / 100
+            merged.append((current_start, current))
+
+    merged.sort(key=lambda item: item[0])
+    return [ev for _, ev in merged]
+
+
+def reduction_ratio(before: int, after: int) -> float:
+    """Share of rows removed by coalescing (0.0 - 1.0)."""
+    return 1 - after / before if before else 0.0
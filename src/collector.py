@@ -4,26 +4,55 @@ Apple Screen Time Exporter - Collector
 Collects screen time data from Mac (knowledgeC.db) and iPhone (Biome)
 """
 
-import csv
-import json
+from __future__ import annotations
+
+import math
 import os
 import re
-import sqlite3
-import subprocess
-from datetime import datetime
+import time
+from collections import Counter
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone
+from functools import lru_cache
 from pathlib import Path
+from typing import TYPE_CHECKING
 from dotenv import load_dotenv
 
+import metrics
+from coalesce import coalesce_events, reduction_ratio
 from config import APP_MAP, TITLE_NORMALIZE, normalize_title
 
+# The extraction, storage and push modules (sqlite3, tempfile, subprocess,
+# hashlib, concurrent.futures, socket, ...) are imported inside the functions
+# that need them, which keeps the collector's startup cheap (see bench_startup)
+if TYPE_CHECKING:
+    import sqlite3
+    from dedup import DedupIndex, FragmentKeyLog
+    from state import CommitManifest, WatermarkStore
+
 # Load .env from parent directory
 load_dotenv(Path(__file__).parent.parent / ".env")
 
 # --- CONFIGURATION ---
 SCRIPT_DIR = Path(__file__).parent.parent
 OUTPUT_CSV = SCRIPT_DIR / "data" / "screentime.csv"
+OUTPUT_DB = SCRIPT_DIR / "data" / "screentime.db"
+STORE_BACKEND = os.getenv("STORE_BACKEND", "csv")
+WATERMARK_FILE = SCRIPT_DIR / "data" / "watermarks.json"
+DEDUP_DB = SCRIPT_DIR / "data" / "dedup.db"
+DEDUP_BLOOM = SCRIPT_DIR / "data" / "dedup.bloom"
+# Legacy single watermark shared by all sources (read-only fallback)
 LAST_TIMESTAMP_FILE = SCRIPT_DIR / "data" / "screentime.csv.last"
 AW_BIN = SCRIPT_DIR / "aw-import-screentime" / ".venv" / "bin" / "aw-import-screentime"
+AW_TIMEOUT = 300
+
+# Max. number of device extractions running at the same time
+COLLECT_CONCURRENCY = int(os.getenv("COLLECT_CONCURRENCY", "4"))
+
+# Biome history kept by aw-import-screentime, and the margin re-read before
+# each device's watermark to catch late-syncing events
+MAX_SINCE_DAYS = 28
+WATERMARK_OVERLAP_HOURS = float(os.getenv("WATERMARK_OVERLAP_HOURS", "24"))
 
 # Mac knowledgeC.db - the official Screen Time database
 KNOWLEDGE_DB = Path.home() / "Library" / "Application Support" / "Knowledge" / "knowledgeC.db"
@@ -31,6 +60,39 @@ KNOWLEDGE_DB = Path.home() / "Library" / "Application Support" / "Knowledge" / "
 # Apple Epoch offset (seconds between 1970-01-01 and 2001-01-01)
 APPLE_EPOCH_OFFSET = 978307200
 
+# Rows fetched from knowledgeC.db per round trip
+FETCH_BATCH_SIZE = 5000
+
+# Read a backup copy of knowledgeC.db instead of the live file
+MAC_SNAPSHOT = os.getenv("MAC_SNAPSHOT", "false").lower() in ("1", "true", "yes")
+# Seconds to wait for macOS to release a lock, and retries after that
+SQLITE_BUSY_TIMEOUT = float(os.getenv("SQLITE_BUSY_TIMEOUT", "5"))
+MAC_READ_RETRIES = 3
+
+# Source name of this Mac's knowledgeC.db events (give each Mac its own name
+# when several collectors push to one aggregator)
+MAC_SOURCE_NAME = os.getenv("MAC_SOURCE_NAME", "Mac")
+
+# local: write to the local store; push: send events to an ingest server (run.py ingest)
+COLLECTOR_MODE = os.getenv("COLLECTOR_MODE", "local").lower()
+AGGREGATOR_URL = os.getenv("AGGREGATOR_URL", "http://localhost:8787").rstrip("/")
+INGEST_TOKEN = os.getenv("INGEST_TOKEN", "")
+INGEST_BATCH_EVENTS = int(os.getenv("INGEST_BATCH_EVENTS", "5000"))
+INGEST_TIMEOUT = 30
+# Name this collector reports to the ingest server (empty = hostname, see collector_host)
+COLLECTOR_HOST = os.getenv("COLLECTOR_HOST", "")
+
+# Merge fragments of the same (source, app) that are at most this many
+# seconds apart into one event (unset = off, store fragments as they are)
+COALESCE_GAP_SECONDS = float(os.getenv("COALESCE_GAP_SECONDS")) if os.getenv("COALESCE_GAP_SECONDS") else None
+
+_local_timezones = {}
+
+# Warm state reused when running inside the daemon (see run.py daemon)
+_watermarks = None
+_dedup_index = None
+_manifest = None
+
 
 def parse_devices() -> list[tuple[str, str]]:
     """
@@ -56,6 +118,7 @@ def parse_devices() -> list[tuple[str, str]]:
     return []
 
 
+@lru_cache(maxsize=None)
 def get_app_title(bundle_id):
     """Returns a display name for the app with intelligent fallback."""
     # 1. Exaktes Mapping
@@ -73,33 +136,105 @@ def get_app_title(bundle_id):
 
     return bundle_id
 
-def get_last_timestamp():
-    """Reads the last extraction timestamp from a separate file."""
-    if LAST_TIMESTAMP_FILE.exists():
+def since_window(last_created_at: float) -> str:
+    """
+    Returns the --since window for aw-import-screentime: from the device's
+    own watermark minus an overlap margin (late syncs), capped at 28 days.
+    """
+    if last_created_at <= 0:
+        return f"{MAX_SINCE_DAYS}d"
+
+    age_hours = (datetime.now().timestamp() - last_created_at) / 3600 + WATERMARK_OVERLAP_HOURS
+    days = min(MAX_SINCE_DAYS, max(1, math.ceil(age_hours / 24)))
+    return f"{days}d"
+
+def local_isoformat(ts: float) -> str:
+    """
+    Same as datetime.fromtimestamp(ts).astimezone().isoformat(), but reuses
+    one timezone object per UTC offset instead of resolving it for each row.
+    """
+    offset = time.localtime(ts).tm_gmtoff
+    tz = _local_timezones.get(offset)
+    if tz is None:
+        tz = _local_timezones[offset] = timezone(timedelta(seconds=offset))
+    return datetime.fromtimestamp(ts, tz).isoformat()
+
+
+@contextmanager
+def open_knowledge_db(db_path: Path, snapshot: bool):
+    """
+    Opens knowledgeC.db read-only. In snapshot mode the live database (and
+    its WAL) is first copied to a temp file with the SQLite backup API, so
+    the extraction never competes with macOS writing to it.
+    """
+    import sqlite3
+    import tempfile
+
+    source = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True, timeout=SQLITE_BUSY_TIMEOUT)
+    if not snapshot:
+        try:
+            yield source
+        finally:
+            source.close()
+        return
+
+    with tempfile.TemporaryDirectory(prefix="screentime-") as tmp:
+        conn = sqlite3.connect(Path(tmp) / "knowledgeC.db")
         try:
-            with open(LAST_TIMESTAMP_FILE, "r") as f:
-                return float(f.read().strip())
-        except:
-            pass
-    return 0.0
-
-def save_last_timestamp(ts):
-    """Saves the last extraction timestamp."""
-    with open(LAST_TIMESTAMP_FILE, "w") as f:
-        f.write(str(ts))
-
-def get_mac_data(last_created_at):
+            try:
+                source.backup(conn)
+            finally:
+                source.close()
+            yield conn
+        finally:
+            conn.close()
+
+
+def get_mac_data(last_created_at, db_path=None, snapshot=None):
     """Extracts Mac Screen Time from knowledgeC.db."""
-    if not KNOWLEDGE_DB.exists():
-        print(f"[Mac] knowledgeC.db not found: {KNOWLEDGE_DB}")
+    import sqlite3
+
+    db_path = db_path or KNOWLEDGE_DB
+    snapshot = MAC_SNAPSHOT if snapshot is None else snapshot
+    if not db_path.exists():
+        print(f"[Mac] knowledgeC.db not found: {db_path}")
         return []
 
-    if not os.access(KNOWLEDGE_DB, os.R_OK):
+    if not os.access(db_path, os.R_OK):
         print("[Mac] knowledgeC.db not readable. Terminal needs Full Disk Access.")
         return []
 
     print(f"[{datetime.now().strftime('%H:%M:%S')}] Extracting Mac data...")
 
+    for attempt in range(MAC_READ_RETRIES + 1):
+        try:
+            with open_knowledge_db(db_path, snapshot) as conn:
+                events = read_mac_events(conn, last_created_at)
+            print(f"[Mac] {len(events)} new entries found")
+            return events
+        except sqlite3.OperationalError as e:
+            # "database is locked" / "busy" while macOS writes - wait and retry
+            if attempt < MAC_READ_RETRIES and ("locked" in str(e) or "busy" in str(e)):
+                delay = 0.5 * 2 ** attempt
+                print(f"[Mac] {e} - retrying in {delay:g}s")
+                metrics.count("retries", source=MAC_SOURCE_NAME)
+                time.sleep(delay)
+                continue
+            print(f"[Mac] Error: {e}")
+            metrics.count("errors", source=MAC_SOURCE_NAME)
+            return []
+        except Exception as e:
+            print(f"[Mac] Error: {e}")
+            metrics.count("errors", source=MAC_SOURCE_NAME)
+            return []
+
+
+def read_mac_events(conn: sqlite3.Connection, last_created_at: float) -> list[dict]:
+    """Reads /app/usage events created after last_created_at from an open knowledgeC.db."""
+    # ZCREATIONDATE is compared on the raw column first so SQLite can use an
+    # index; the exact check on the shifted value only runs on that range.
+    # likelihood() keeps the planner from preferring a ZSTREAMNAME index,
+    # which matches a large share of all rows.
     query = """
     SELECT
         ZOBJECT.ZVALUESTRING AS "app",
@@ -109,43 +244,36 @@ def get_mac_data(last_created_at):
         (ZOBJECT.ZCREATIONDATE + 978307200) as "created_at"
     FROM ZOBJECT
     WHERE
-        ZSTREAMNAME = "/app/usage" AND
+        likelihood(ZSTREAMNAME = '/app/usage', 0.5) AND
+        ZOBJECT.ZCREATIONDATE > ? AND
         (ZOBJECT.ZCREATIONDATE + 978307200) > ?
     ORDER BY ZSTARTDATE ASC
     """
+    params = (last_created_at - APPLE_EPOCH_OFFSET - 1, last_created_at)
 
-    try:
-        with sqlite3.connect(f"file:{KNOWLEDGE_DB}?mode=ro", uri=True) as conn:
-            cursor = conn.cursor()
-            cursor.execute(query, (last_created_at,))
-            rows = cursor.fetchall()
-
-            events = []
-            for row in rows:
-                app, usage, start_time, end_time, created_at = row
-                if not app or usage is None:
-                    continue
+    cursor = conn.execute(query, params)
 
-                ts_iso = datetime.fromtimestamp(start_time).astimezone().isoformat()
-                title = get_app_title(app)
+    events = []
+    while rows := cursor.fetchmany(FETCH_BATCH_SIZE):
+        for app, usage, start_time, end_time, created_at in rows:
+            if not app or usage is None:
+                continue
 
-                events.append({
-                    "timestamp": ts_iso,
-                    "app": app,
-                    "title": title,
-                    "duration": round(usage, 2),
-                    "source": "Mac",
-                    "_created_at": created_at
-                })
+            events.append({
+                "timestamp": local_isoformat(start_time),
+                "app": app,
+                "title": get_app_title(app),
+                "duration": round(usage, 2),
+                "source": MAC_SOURCE_NAME,
+                "_created_at": created_at
+            })
+    return events
 
-            print(f"[Mac] {len(events)} new entries found")
-            return events
-    except Exception as e:
-        print(f"[Mac] Error: {e}")
-        return []
 
 def get_mobile_data(device_name, device_id, last_created_at):
     """Extracts mobile Screen Time via aw-import-screentime."""
+    from biome import stream_command_events
+
     if not device_id:
         print(f"[{device_name}] Device ID not set - skipping")
         return []
@@ -156,112 +284,384 @@ def get_mobile_data(device_name, device_id, last_created_at):
 
     print(f"[{datetime.now().strftime('%H:%M:%S')}] Extracting {device_name} data...")
 
-    # Always query 28 days, deduplication happens via created_at
-    cmd = [str(AW_BIN), "events", "preview", "--device", device_id, "--since", "28d"]
+    # Only query back to this device's watermark minus the overlap margin. Events
+    # in the margin were mostly stored already; the dedup index drops those, so
+    # events that synced late (created_at behind the watermark) are kept.
+    cmd = [str(AW_BIN), "events", "preview", "--device", device_id, "--since", since_window(last_created_at)]
+    reread_from = last_created_at - WATERMARK_OVERLAP_HOURS * 3600 if last_created_at > 0 else 0
 
+    start = time.perf_counter()
     try:
-        result = subprocess.run(cmd, capture_output=True, text=True, check=True, timeout=300)
-        data = json.loads(result.stdout)
         events = []
 
-        if data and "events" in data[0]:
-            for event in data[0]["events"]:
-                ts = event["timestamp"]
-                duration = event.get("duration_seconds", 0)
-
-                # Parse timestamp für created_at Vergleich
-                try:
-                    dt = datetime.fromisoformat(ts.replace("Z", "+00:00"))
-                    end_time = dt.timestamp() + duration
-                    created_at = end_time
-
-                    # Skip already collected events
-                    if created_at <= last_created_at:
-                        continue
-                except:
-                    continue
-
-                bundle_id = event["data"].get("app", "unknown")
-                title = event["data"].get("title", "unknown")
-
-                if title == "unknown" or not title:
-                    title = APP_MAP.get(bundle_id, bundle_id.split(".")[-1])
+        # Events are parsed one at a time while aw-import-screentime is still writing
+        for event in stream_command_events(cmd, timeout=AW_TIMEOUT):
+            ts = event["timestamp"]
+            duration = event.get("duration_seconds", 0)
 
-                # Normalize long App Store names
-                title = normalize_title(title)
+            # Parse timestamp für created_at Vergleich
+            try:
+                dt = datetime.fromisoformat(ts.replace("Z", "+00:00"))
+                end_time = dt.timestamp() + duration
+                created_at = end_time
 
-                events.append({
-                    "timestamp": ts,
-                    "app": bundle_id,
-                    "title": title,
-                    "duration": round(duration, 2),
-                    "source": device_name,
-                    "_created_at": created_at
-                })
-
-        print(f"[{device_name}] {len(events)} new entries found")
+                # Skip events older than the overlap margin
+                if created_at <= reread_from:
+                    continue
+            except:
+                continue
+
+            bundle_id = event["data"].get("app", "unknown")
+            title = event["data"].get("title", "unknown")
+
+            if title == "unknown" or not title:
+                title = APP_MAP.get(bundle_id, bundle_id.split(".")[-1])
+
+            # Normalize long App Store names
+            title = normalize_title(title)
+
+            events.append({
+                "timestamp": ts,
+                "app": bundle_id,
+                "title": title,
+                "duration": round(duration, 2),
+                "source": device_name,
+                "_created_at": created_at
+            })
+
+        # The stream ends when the process has exited
+        metrics.add_time("subprocess", time.perf_counter() - start, device_name)
+        print(f"[{device_name}] {len(events)} entries found (incl. {WATERMARK_OVERLAP_HOURS:g}h overlap)")
         return events
     except Exception as e:
         print(f"[{device_name}] Error: {e}")
+        metrics.count("errors", source=device_name)
         return []
 
-def save_to_csv(events):
+def get_watermarks() -> WatermarkStore:
+    """Returns the watermark store, kept in memory across daemon cycles."""
+    from state import WatermarkStore
+
+    global _watermarks
+    if _watermarks is None:
+        _watermarks = WatermarkStore(WATERMARK_FILE, legacy_path=LAST_TIMESTAMP_FILE, manifest=get_manifest())
+    return _watermarks
+
+
+def get_dedup_index() -> DedupIndex:
+    """Returns the dedup index (with its Bloom filter), kept open across daemon cycles."""
+    from dedup import DedupIndex
+
+    global _dedup_index
+    if _dedup_index is None:
+        _dedup_index = DedupIndex(DEDUP_DB, DEDUP_BLOOM)
+    return _dedup_index
+
+
+def get_manifest() -> CommitManifest:
+    """Returns the commit manifest of the configured store (e.g. data/screentime.csv.manifest)."""
+    from state import CommitManifest
+    from store import manifest_path, open_store
+
+    global _manifest
+    path = manifest_path(open_store(STORE_BACKEND, OUTPUT_CSV, OUTPUT_DB))
+    if _manifest is None or _manifest.path != path:
+        _manifest = CommitManifest(path)
+    return _manifest
+
+
+def get_key_log(store) -> FragmentKeyLog:
+    """Returns the fragment key log of the store (e.g. data/screentime.csv.keys)."""
+    from dedup import FragmentKeyLog
+
+    return FragmentKeyLog(store.path.with_name(store.path.name + ".keys"))
+
+
+def recover_store(store, manifest: CommitManifest, index: DedupIndex, key_log: FragmentKeyLog):
+    """
+    Brings the store back to its last commit after a crash: rows (and
+    fragment keys) appended after the committed position are cut off (their
+    watermarks were not committed, so they are extracted again), and rows
+    committed just before a crash that kept them out of the dedup index are
+    indexed - by their raw fragment keys too if they were coalesced.
+    """
+    from dedup import event_key
+
+    if not manifest.applies_to(store.id) or not store.exists():
+        return
+
+    position = store.position()
+    if position > manifest.position and not manifest.from_backup:
+        print(f"[Recovery] Removing the uncommitted end of the store ({store.position_unit} "
+              f"{manifest.position}-{position})")
+        store.truncate(manifest.position)
+    key_log_previous, key_log_position = manifest.key_log
+    if key_log.position() > key_log_position and not manifest.from_backup:
+        key_log.truncate(key_log_position)
+
+    if index.bootstrapped and index.committed < manifest.seq:
+        print("[Recovery] Indexing the last committed batch")
+        keys = [event_key(ev) for ev in store.iter_range(manifest.previous, manifest.position)]
+        index.add(keys + key_log.read(key_log_previous, key_log_position), commit=manifest.seq)
+
+
+def pop_created_at(events) -> dict:
+    """Removes the internal _created_at fields and returns their maximum per source."""
+    max_created_at = {}
+    for ev in events:
+        created_at = ev.pop("_created_at", 0)
+        if created_at > max_created_at.get(ev["source"], 0):
+            max_created_at[ev["source"]] = created_at
+    return max_created_at
+
+
+def store_events(events, watermarks: WatermarkStore) -> int:
+    """
+    Appends the events that are not stored yet (see dedup.py) to the store,
+    coalesced if configured, and commits the new end of the store together
+    with the advanced watermarks (see state.CommitManifest). A crash at any
+    point leaves either the old or the new commit, never a full rescan.
+    Returns the number of events that were new.
+
+    Runs under an exclusive lock on the store (e.g. data/screentime.csv.lock),
+    so a local collector and `run.py ingest` can write to the same store.
+    """
+    from state import file_lock
+    from store import open_store
+
+    store = open_store(STORE_BACKEND, OUTPUT_CSV, OUTPUT_DB)
+    with file_lock(store.path.with_name(store.path.name + ".lock")):
+        return _store_events(store, events, watermarks)
+
+
+def _store_events(store, events, watermarks: WatermarkStore) -> int:
+    from dedup import event_key
+
+    max_created_at = pop_created_at(events)
+
+    # Another process may have committed since this one last looked
+    manifest = get_manifest()
+    manifest.reload()
+    index = get_dedup_index()
+    index.refresh()
+    key_log = get_key_log(store)
+    recover_store(store, manifest, index, key_log)
+    if not index.bootstrapped:
+        print("\n[Dedup] Indexing existing events (one-time)...")
+        with metrics.stage("dedup_bootstrap"):
+            committed_keys = manifest.key_log[1] if manifest.applies_to(store.id) else None
+            index.bootstrap(store.iter_events() if store.exists() else [],
+                            key_log.read(0, committed_keys))
+
+    # Drop events that are already stored (re-syncs, lost watermarks)
+    with metrics.stage("dedup"):
+        new_events, keys = index.filter_new(events)
+    if len(new_events) < len(events):
+        print(f"\n[Dedup] {len(events) - len(new_events)} already stored entries skipped")
+        duplicates = Counter(ev["source"] for ev in events) - Counter(ev["source"] for ev in new_events)
+        for source, n in duplicates.items():
+            metrics.count("rows_deduplicated", n, source)
+
+    previous = store.position()
+    key_log_previous = key_log.position()
+    if new_events:
+        # Hashes above are of the raw fragments, so re-collected fragments
+        # are still recognized after they were merged - they are logged with
+        # the batch, since the merged rows alone no longer yield them
+        rows = new_events
+        if COALESCE_GAP_SECONDS is not None:
+            rows = coalesce_events(new_events, COALESCE_GAP_SECONDS)
+            print(f"\n[Coalesce] {len(new_events)} -> {len(rows)} entries "
+                  f"({reduction_ratio(len(new_events), len(rows)):.0%} fewer, gap {COALESCE_GAP_SECONDS:g}s)")
+            key_log.append(keys)
+        with metrics.stage("store_write"):
+            store.append(rows)
+        for source, n in Counter(ev["source"] for ev in rows).items():
+            metrics.count("rows_written", n, source)
+
+    for source, ts in max_created_at.items():
+        watermarks.advance(source, ts)
+
+    # Commit point: the store end and the watermarks are replaced in one rename
+    with metrics.stage("commit"):
+        seq = manifest.commit(store.id, store.position(), previous, {watermarks.key: dict(watermarks.marks)},
+                              key_log=(key_log_previous, key_log.position()))
+        index.add(keys, commit=seq)
+        watermarks.save()
+
+    return len(new_events)
+
+
+def save_events(events, watermarks: WatermarkStore):
     if not events:
         print("\nNo new data since last run.")
         return
 
-    # Remove internal _created_at fields before writing
-    max_created_at = max(ev.get("_created_at", 0) for ev in events)
-    for ev in events:
-        ev.pop("_created_at", None)
+    stored = store_events(events, watermarks)
 
-    file_exists = OUTPUT_CSV.exists()
-    with open(OUTPUT_CSV, "a", newline="") as f:
-        writer = csv.DictWriter(f, fieldnames=["timestamp", "app", "title", "duration", "source"])
-        if not file_exists:
-            writer.writeheader()
-        writer.writerows(events)
+    if stored:
+        print(f"\nSuccess: {stored} NEW entries added.")
+    else:
+        print("\nNo new data since last run.")
 
-    # Save last timestamp for deduplication
-    if max_created_at > 0:
-        save_last_timestamp(max_created_at)
+class RemoteWatermarks:
+    """Watermarks of this host as kept by the ingest server ({source: last created_at})."""
 
-    print(f"\nSuccess: {len(events)} NEW entries added.")
+    def __init__(self, marks: dict[str, float]):
+        self.marks = marks
 
-if __name__ == "__main__":
-    print(f"=== Screen Time Collection - {datetime.now().isoformat()} ===\n")
+    def get(self, source: str) -> float:
+        return self.marks.get(source, 0.0)
 
-    last_ts = get_last_timestamp()
-    if last_ts > 0:
-        print(f"Last extraction: {datetime.fromtimestamp(last_ts).isoformat()}")
-    else:
-        print("First run - extracting all available data")
+
+def collector_host() -> str:
+    import socket
+
+    return COLLECTOR_HOST or socket.gethostname()
+
+
+def ingest_headers() -> dict:
+    return {"Authorization": f"Bearer {INGEST_TOKEN}"}
+
+
+def fetch_remote_watermarks() -> RemoteWatermarks:
+    """Asks the ingest server how far this host's sources were already stored."""
+    import requests
+
+    response = requests.get(f"{AGGREGATOR_URL}/watermarks", params={"host": collector_host()},
+                            headers=ingest_headers(), timeout=INGEST_TIMEOUT)
+    response.raise_for_status()
+    return RemoteWatermarks({k: float(v) for k, v in response.json().items()})
+
+
+def push_events(events) -> int:
+    """
+    Sends the events to the ingest server in gzipped JSON batches, oldest
+    created_at first, so the server's watermarks of this host only cover
+    batches it stored. Returns the number of events the server stored.
+    """
+    import gzip
+    import json
+    import requests
+
+    events = sorted(events, key=lambda ev: ev.get("_created_at", 0))
+    stored = 0
+    for i in range(0, len(events), INGEST_BATCH_EVENTS):
+        batch = [{**{k: ev[k] for k in ("timestamp", "app", "title", "duration", "source")},
+                  "created_at": ev.get("_created_at", 0)}
+                 for ev in events[i:i + INGEST_BATCH_EVENTS]]
+        body = gzip.compress(json.dumps({"host": collector_host(), "events": batch}).encode("utf-8"))
+
+        start = time.perf_counter()
+        response = requests.post(f"{AGGREGATOR_URL}/events", data=body, timeout=INGEST_TIMEOUT,
+                                 headers={**ingest_headers(), "Content-Type": "application/json",
+                                          "Content-Encoding": "gzip"})
+        metrics.observe("ingest_request", time.perf_counter() - start)
+        if response.status_code != 200:
+            raise RuntimeError(f"Ingest server returned {response.status_code}: {response.text[:200]}")
+
+        result = response.json()
+        stored += result["stored"]
+        metrics.count("bytes_sent", len(body), "ingest")
+        print(f"[Push] Batch {i // INGEST_BATCH_EVENTS + 1}: {len(batch)} sent, "
+              f"{result['stored']} stored, {result['duplicates']} duplicates")
+    return stored
+
+
+def timed_extract(source: str, func, *args) -> list:
+    """Runs one extraction and records its wall time and row count."""
+    with metrics.stage("extract", source):
+        events = func(*args)
+    metrics.count("rows_read", len(events), source)
+    return events
+
+
+def collect_all(devices: list[tuple[str, str]], watermarks: WatermarkStore,
+                max_workers: int = COLLECT_CONCURRENCY) -> list[tuple[str, list]]:
+    """
+    Runs all mobile extractions and the knowledgeC.db read concurrently.
+    Returns (source, events) pairs in configuration order (devices, then Mac),
+    independent of which extraction finishes first.
+    """
+    from concurrent.futures import ThreadPoolExecutor
+
+    with ThreadPoolExecutor(max_workers=max(1, max_workers)) as pool:
+        futures = [
+            (device_name, pool.submit(timed_extract, device_name, get_mobile_data,
+                                      device_name, device_id, watermarks.get(device_name)))
+            for device_name, device_id in devices
+        ]
+        futures.append((MAC_SOURCE_NAME, pool.submit(timed_extract, MAC_SOURCE_NAME, get_mac_data,
+                                                     watermarks.get(MAC_SOURCE_NAME))))
+
+        results = []
+        for source, future in futures:
+            try:
+                events = future.result()
+            except Exception as e:
+                print(f"[{source}] Error: {e}")
+                events = []
+            results.append((source, events))
+    return results
+
+
+def collect():
+    print(f"=== Screen Time Collection - {datetime.now().isoformat()} ===\n")
 
     # Parse configured devices
     devices = parse_devices()
+
+    if COLLECTOR_MODE == "push":
+        print(f"Push mode: sending events of host {collector_host()} to {AGGREGATOR_URL}\n")
+        watermarks = fetch_remote_watermarks()
+    else:
+        watermarks = get_watermarks()
+    for source in [name for name, _ in devices] + [MAC_SOURCE_NAME]:
+        last_ts = watermarks.get(source)
+        if last_ts > 0:
+            print(f"Last extraction ({source}): {datetime.fromtimestamp(last_ts).isoformat()}")
+        else:
+            print(f"First run ({source}) - extracting all available data")
+
     if not devices:
         print("\nNo mobile devices configured.")
         print("Tip: Set DEVICE_ID or DEVICES in .env")
         print("     Run: cd aw-import-screentime && .venv/bin/aw-import-screentime devices")
 
-    # Collect from all mobile devices
-    all_mobile_events = []
-    for device_name, device_id in devices:
-        events = get_mobile_data(device_name, device_id, last_ts)
-        all_mobile_events.extend(events)
-
-    # Collect Mac data
-    mac_events = get_mac_data(last_ts)
+    # Collect from all mobile devices and the Mac in parallel
+    with metrics.stage("collect"):
+        results = collect_all(devices, watermarks)
 
-    # Combine and sort by timestamp
-    all_events = all_mobile_events + mac_events
+    # Combine and sort by timestamp (stable, so ties keep configuration order)
+    all_events = [ev for _, events in results for ev in events]
     all_events.sort(key=lambda x: x["timestamp"])
 
     # Print summary
     print()
-    for device_name, device_id in devices:
-        count = sum(1 for e in all_mobile_events if e["source"] == device_name)
-        print(f"  {device_name}: {count} Events")
-    print(f"  Mac: {len(mac_events)} Events")
+    for source, events in results:
+        print(f"  {source}: {len(events)} Events")
+
+    if COLLECTOR_MODE == "push":
+        with metrics.stage("push"):
+            stored = push_events(all_events) if all_events else 0
+        print(f"\nSuccess: {stored} NEW entries stored by the aggregator." if stored
+              else "\nNo new data since last run.")
+        return
 
-    save_to_csv(all_events)
\ No newline at end of file
+    with metrics.stage("save"):
+        save_events(all_events, watermarks)
+
+
+def main():
+    """Runs one collection and writes its run report (see metrics.py)."""
+    metrics.start_run("collector")
+    try:
+        collect()
+    except BaseException:
+        metrics.finish_run(ok=False)
+        raise
+    metrics.finish_run(ok=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -4,6 +4,8 @@ Centralized configuration for app mappings and categories.
 Edit this file to customize app names and categories.
 """
 
+from functools import lru_cache
+
 # Bundle ID → Display Name (for Mac data from knowledgeC.db)
 APP_MAP = {
     # Social
@@ -286,16 +288,69 @@ CATEGORIES = {
 }
 
 
+# Leading characters compared when matching truncated App Store titles
+TITLE_PREFIX_LENGTH = 15
+
+
+class TitleMatcher:
+    """
+    Precompiled TITLE_NORMALIZE lookup.
+
+    Besides exact matches, a title matches every entry whose first
+    TITLE_PREFIX_LENGTH characters it starts with; the earliest such entry
+    in the table wins. The prefixes are stored in a character trie, so a
+    lookup walks at most TITLE_PREFIX_LENGTH nodes instead of the whole table.
+    """
+
+    _END = ""  # Node key holding (table index, short name) of a complete prefix
+
+    def __init__(self, table: dict, prefix_length: int = TITLE_PREFIX_LENGTH):
+        self.table = table
+        self.prefix_length = prefix_length
+        self.trie = {}
+        for index, (long_name, short_name) in enumerate(table.items()):
+            node = self.trie
+            for char in long_name[:prefix_length]:
+                node = node.setdefault(char, {})
+            node.setdefault(self._END, (index, short_name))
+
+    def __call__(self, title: str) -> str:
+        if title in self.table:
+            return self.table[title]
+
+        best = self.trie.get(self._END)
+        node = self.trie
+        for char in title[:self.prefix_length]:
+            node = node.get(char)
+            if node is None:
+                break
+            match = node.get(self._END)
+            if match and (best is None or match[0] < best[0]):
+                best = match
+
+        return best[1] if best else title
+
+
+@lru_cache(maxsize=1)
+def _title_matcher() -> TitleMatcher:
+    """Builds the trie on first use, not on import."""
+    return TitleMatcher(TITLE_NORMALIZE)
+
+
+@lru_cache(maxsize=4096)
 def normalize_title(title: str) -> str:
     """Normalizes app titles to short, consistent names."""
-    # Exact match
-    if title in TITLE_NORMALIZE:
-        return TITLE_NORMALIZE[title]
-    # Partial match for truncated titles
-    for long_name, short_name in TITLE_NORMALIZE.items():
-        if title.startswith(long_name[:15]):
-            return short_name
-    return title
+    return _title_matcher()(title)
+
+
+def normalize_titles(titles, exact_only: bool = False):
+    """
+    Normalizes a pandas Series of titles, computing each unique value once.
+    With exact_only, only exact TITLE_NORMALIZE keys are replaced.
+    """
+    lookup = (lambda t: TITLE_NORMALIZE.get(t, t)) if exact_only else normalize_title
+    mapping = {t: lookup(t) if isinstance(t, str) else t for t in titles.unique()}
+    return titles.map(mapping)
 
 
 def get_category(title: str) -> str:
@@ -0,0 +1,234 @@
+#!/usr/bin/env python3
+"""
+Apple Screen Time Exporter - Deduplication Index
+Remembers every stored event by a content hash of (source, app, timestamp,
+duration), so re-collecting the same events never duplicates them - even
+after clock skew, Biome re-syncs or a lost watermark file.
+
+The hashes live in a SQLite table. A Bloom filter persisted next to it
+answers "definitely new" for almost every new event without touching the
+database; only possible duplicates are looked up.
+"""
+
+import hashlib
+import itertools
+import math
+import os
+import sqlite3
+import struct
+from datetime import datetime, timezone
+from pathlib import Path
+
+from state import atomic_write_bytes
+
+BLOOM_MAGIC = b"STBF"
+BLOOM_HEADER = struct.Struct("<4sQIQ")  # magic, bits, hashes, count
+
+
+def event_key(event: dict) -> bytes:
+    """16-byte hash identifying an event independent of timestamp formatting."""
+    dt = datetime.fromisoformat(event["timestamp"].replace("Z", "+00:00"))
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    raw = f'{event["source"]}\x1f{event["app"]}\x1f{dt.timestamp():.6f}\x1f{float(event["duration"]):.2f}'
+    return hashlib.blake2b(raw.encode("utf-8"), digest_size=16).digest()
+
+
+class BloomFilter:
+    """Fixed-size Bloom filter using double hashing of a 16-byte key."""
+
+    def __init__(self, capacity: int, error_rate: float = 0.001):
+        self.capacity = capacity
+        self.bits = max(64, int(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.bits / capacity * math.log(2)))
+        self.array = bytearray((self.bits + 7) // 8)
+        self.count = 0
+
+    def _positions(self, key: bytes):
+        h1 = int.from_bytes(key[:8], "little")
+        h2 = int.from_bytes(key[8:16], "little") | 1
+        return ((h1 + i * h2) % self.bits for i in range(self.hashes))
+
+    def add(self, key: bytes):
+        for pos in self._positions(key):
+            self.array[pos >> 3] |= 1 << (pos & 7)
+        self.count += 1
+
+    def __contains__(self, key: bytes) -> bool:
+        return all(self.array[pos >> 3] & (1 << (pos & 7)) for pos in self._positions(key))
+
+    def to_bytes(self) -> bytes:
+        return BLOOM_HEADER.pack(BLOOM_MAGIC, self.bits, self.hashes, self.count) + bytes(self.array)
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> "BloomFilter | None":
+        try:
+            magic, bits, hashes, count = BLOOM_HEADER.unpack_from(data)
+        except struct.error:
+            return None
+        if magic != BLOOM_MAGIC or len(data) != BLOOM_HEADER.size + (bits + 7) // 8:
+            return None
+
+        bloom = cls.__new__(cls)
+        bloom.bits, bloom.hashes, bloom.count = bits, hashes, count
+        bloom.capacity = max(1, round(bits * math.log(2) / hashes))
+        bloom.array = bytearray(data[BLOOM_HEADER.size:])
+        return bloom
+
+
+class DedupIndex:
+    """Persistent set of event hashes with a Bloom filter front."""
+
+    SCHEMA = """
+    CREATE TABLE IF NOT EXISTS seen (hash BLOB PRIMARY KEY) WITHOUT ROWID;
+    CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value INTEGER NOT NULL);
+    """
+
+    def __init__(self, db_path: Path, bloom_path: Path, min_capacity: int = 1_000_000):
+        self.db_path = Path(db_path)
+        self.bloom_path = Path(bloom_path)
+        self.min_capacity = min_capacity
+
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self.conn = sqlite3.connect(self.db_path)
+        self.conn.executescript(self.SCHEMA)
+        self.count = self._meta("count")
+        self.bloom = self._load_bloom()
+
+    def _meta(self, key: str) -> int:
+        row = self.conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else 0
+
+    def _set_meta(self, key: str, value: int):
+        self.conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, value))
+
+    def _load_bloom(self) -> BloomFilter:
+        """Loads the persisted filter, rebuilding it if it is out of sync with the table."""
+        if self.bloom_path.exists():
+            bloom = BloomFilter.from_bytes(self.bloom_path.read_bytes())
+            if bloom and bloom.count == self.count and bloom.capacity >= self.count:
+                return bloom
+        return self._rebuild_bloom()
+
+    def _rebuild_bloom(self) -> BloomFilter:
+        bloom = BloomFilter(max(self.min_capacity, self.count * 2))
+        for (key,) in self.conn.execute("SELECT hash FROM seen"):
+            bloom.add(key)
+        return bloom
+
+    @property
+    def bootstrapped(self) -> bool:
+        return bool(self._meta("bootstrapped"))
+
+    def contains(self, key: bytes) -> bool:
+        if key not in self.bloom:
+            return False
+        return self.conn.execute("SELECT 1 FROM seen WHERE hash = ?", (key,)).fetchone() is not None
+
+    def filter_new(self, events: list[dict]) -> tuple[list[dict], list[bytes]]:
+        """Returns (events not seen before, their keys). Duplicates within events are dropped too."""
+        new_events, new_keys, batch = [], [], set()
+        for ev in events:
+            key = event_key(ev)
+            if key in batch or self.contains(key):
+                continue
+            batch.add(key)
+            new_events.append(ev)
+            new_keys.append(key)
+        return new_events, new_keys
+
+    def refresh(self):
+        """Picks up keys another process added since (the Bloom filter is held per process)."""
+        count = self._meta("count")
+        if count != self.count:
+            self.count = count
+            self.bloom = self._load_bloom()
+
+    @property
+    def committed(self) -> int:
+        """Number of the store commit (see state.CommitManifest) the index was last updated for."""
+        return self._meta("commit")
+
+    def add(self, keys, bootstrapped: bool = False, commit: int | None = None):
+        """Records keys as stored (by store commit `commit`) and persists the index."""
+        with self.conn:
+            before = self.conn.total_changes
+            self.conn.executemany("INSERT OR IGNORE INTO seen (hash) VALUES (?)", ((k,) for k in keys))
+            self.count += self.conn.total_changes - before
+            self._set_meta("count", self.count)
+            if bootstrapped:
+                self._set_meta("bootstrapped", 1)
+            if commit is not None:
+                self._set_meta("commit", commit)
+
+        if not keys:
+            return
+        if self.count > self.bloom.capacity:
+            self.bloom = self._rebuild_bloom()
+        else:
+            for key in keys:
+                self.bloom.add(key)
+        # The filter is in sync with the table as long as the counts match
+        self.bloom.count = self.count
+
+        atomic_write_bytes(self.bloom_path, self.bloom.to_bytes())
+
+    def bootstrap(self, events, fragment_keys=(), chunk_size: int = 50_000):
+        """
+        One-time import of the events already in the store, plus the raw
+        fragment keys behind its coalesced rows (see FragmentKeyLog).
+        """
+        keys = []
+        for key in itertools.chain((event_key(ev) for ev in events), fragment_keys):
+            keys.append(key)
+            if len(keys) >= chunk_size:
+                self.add(keys)
+                keys = []
+        self.add(keys, bootstrapped=True)
+
+    def close(self):
+        self.conn.close()
+
+
+class FragmentKeyLog:
+    """
+    Append-only file of the raw event keys behind coalesced rows (16 bytes
+    each, e.g. data/screentime.csv.keys). A coalesced row has a different key
+    than the fragments filter_new checks, so the fragment keys of each
+    coalesced batch are written here before the store commit. Recovery and
+    bootstrap index them from here; the committed end of the file is kept in
+    the store manifest, like the store's own position.
+    """
+
+    KEY_SIZE = 16
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+
+    def position(self) -> int:
+        return self.path.stat().st_size if self.path.exists() else 0
+
+    def append(self, keys) -> int:
+        """Appends keys and returns the new end of the file once they are on disk."""
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with open(self.path, "ab") as f:
+            f.write(b"".join(keys))
+            f.flush()
+            os.fsync(f.fileno())
+            return f.tell()
+
+    def truncate(self, position: int):
+        """Cuts the file back to a committed position (drops a crashed run's keys)."""
+        with open(self.path, "r+b") as f:
+            f.truncate(position)
+            f.flush()
+            os.fsync(f.fileno())
+
+    def read(self, start: int = 0, end: int | None = None) -> list[bytes]:
+        """Returns the keys between two byte positions."""
+        if not self.path.exists():
+            return []
+        with open(self.path, "rb") as f:
+            f.seek(start)
+            data = f.read() if end is None else f.read(max(0, end - start))
+        return [data[i:i + self.KEY_SIZE] for i in range(0, len(data) - self.KEY_SIZE + 1, self.KEY_SIZE)]
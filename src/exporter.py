@@ -4,16 +4,34 @@ Apple Screen Time Exporter - Exporter
 Exports data to Home Assistant and InfluxDB
 """
 
+from __future__ import annotations
+
+import gzip
+import hashlib
 import json
 import os
-import requests
-import pandas as pd
+import sys
+import time
 from datetime import datetime, timedelta
 from pathlib import Path
 from collections import defaultdict
+from typing import TYPE_CHECKING
 from dotenv import load_dotenv
 
-from config import CATEGORIES, TITLE_NORMALIZE, get_category
+from config import CATEGORIES, get_category, normalize_titles
+import metrics
+from aggregates import (DailyRollup, active_totals, aggregates_from_rollup, bucket_totals, day_index,
+                        local_days, rollup_frame, touched_days)
+from outbox import DELIVERED, REJECTED, RETRY, Outbox
+from state import CommitManifest, PushStateCache, atomic_write_text
+from store import UNITS_PER_SECOND, manifest_path, open_store
+
+# pandas, numpy and requests are imported inside the functions that need
+# them, so a run without new data finishes without loading them at all
+if TYPE_CHECKING:
+    import numpy as np
+    import pandas as pd
+    import requests
 
 # Load .env from parent directory
 load_dotenv(Path(__file__).parent.parent / ".env")
@@ -24,62 +42,451 @@ SCRIPT_DIR = Path(__file__).parent.parent
 # Home Assistant
 HA_URL = os.getenv("HA_URL", "http://homeassistant.local:8123")
 HA_TOKEN = os.getenv("HA_TOKEN", "")
+HA_CONCURRENCY = int(os.getenv("HA_CONCURRENCY", "4"))
+HA_TIMEOUT = int(os.getenv("HA_TIMEOUT", "10"))
+# Unchanged sensors are re-pushed after this many seconds anyway
+HA_STATE_MAX_AGE = float(os.getenv("HA_STATE_MAX_AGE", "3600"))
+# rest: /api/states per sensor; mqtt: MQTT discovery + retained topics
+HA_TRANSPORT = os.getenv("HA_TRANSPORT", "rest").lower()
+
+# MQTT (HA_TRANSPORT=mqtt, requires paho-mqtt)
+MQTT_HOST = os.getenv("MQTT_HOST", "")
+MQTT_PORT = int(os.getenv("MQTT_PORT", "1883"))
+MQTT_USERNAME = os.getenv("MQTT_USERNAME", "")
+MQTT_PASSWORD = os.getenv("MQTT_PASSWORD", "")
+MQTT_DISCOVERY_PREFIX = os.getenv("MQTT_DISCOVERY_PREFIX", "homeassistant")
+MQTT_TOPIC_PREFIX = os.getenv("MQTT_TOPIC_PREFIX", "screentime")
+MQTT_TIMEOUT = 10
 
 # InfluxDB
 INFLUX_URL = os.getenv("INFLUX_URL", "http://localhost:8086")
 INFLUX_TOKEN = os.getenv("INFLUX_TOKEN", "")
 INFLUX_ORG = os.getenv("INFLUX_ORG", "home")
 INFLUX_BUCKET = os.getenv("INFLUX_BUCKET", "screentime")
+INFLUX_BATCH_LINES = int(os.getenv("INFLUX_BATCH_LINES", "5000"))
+INFLUX_BATCH_BYTES = int(os.getenv("INFLUX_BATCH_BYTES", str(1024 * 1024)))
+INFLUX_MAX_RETRIES = int(os.getenv("INFLUX_MAX_RETRIES", "3"))
+INFLUX_RETRY_BACKOFF = float(os.getenv("INFLUX_RETRY_BACKOFF", "2"))
+INFLUX_TIMEOUT = int(os.getenv("INFLUX_TIMEOUT", "30"))
+# Hourly/daily rollup measurements for the rollup dashboard
+INFLUX_ROLLUPS = os.getenv("INFLUX_ROLLUPS", "true").lower() in ("1", "true", "yes")
+ROLLUP_MEASUREMENTS = {"hourly": "screentime_hourly", "daily": "screentime_daily"}
+# Overlap-free time per device and across devices (source=all), written with the rollups
+ACTIVE_MEASUREMENT = "screentime_active"
+
+# Rows encoded at once while streaming batches
+ENCODE_CHUNK_ROWS = 10_000
 
 # Paths
 CSV_FILE = SCRIPT_DIR / "data" / "screentime.csv"
+DB_FILE = SCRIPT_DIR / "data" / "screentime.db"
+STORE_BACKEND = os.getenv("STORE_BACKEND", "csv")
 LAST_EXPORT_FILE = SCRIPT_DIR / "data" / ".last_export_timestamp"
+ROLLUP_FILE = SCRIPT_DIR / "data" / ".daily_rollup.json"
+# Store position after the last fully successful export (no-new-data fast path)
+EXPORT_POSITION_FILE = SCRIPT_DIR / "data" / ".last_export_position"
+HA_STATE_FILE = SCRIPT_DIR / "data" / ".ha_state.json"
+
+# Durable queue for deliveries a sink did not accept, replayed on the next run
+OUTBOX_DIR = SCRIPT_DIR / "data" / "outbox"
+OUTBOX_ENABLED = os.getenv("OUTBOX_ENABLED", "true").lower() in ("1", "true", "yes")
+OUTBOX_MAX_BYTES = int(os.getenv("OUTBOX_MAX_BYTES", str(512 * 1024 * 1024)))
+# Backoff between replay attempts while a sink stays unavailable (doubles up to the max)
+OUTBOX_BACKOFF = float(os.getenv("OUTBOX_BACKOFF", "60"))
+OUTBOX_MAX_BACKOFF = float(os.getenv("OUTBOX_MAX_BACKOFF", "3600"))
+
+# Warm state reused when running inside the daemon (see run.py daemon)
+_influx_session = None
+_ha_session = None
+_mqtt_publisher = None
+_rollup = None
 
 
 def get_last_export_timestamp() -> float:
-    """Reads the last export timestamp."""
-    if LAST_EXPORT_FILE.exists():
+    """
+    Reads the last export timestamp (0.0 before the first export). Only
+    used when the export marker has no offset for the store (see
+    get_export_offset); if both are unreadable the export stops rather than
+    re-exporting all history.
+    """
+    if not LAST_EXPORT_FILE.exists():
+        return 0.0
+    try:
+        return float(LAST_EXPORT_FILE.read_text().strip())
+    except (OSError, ValueError) as e:
+        raise RuntimeError(f"{LAST_EXPORT_FILE} is unreadable ({e}) and there is no export marker - "
+                           f"delete it to export all data again")
+
+
+def get_export_offset(store) -> tuple[int | None, float]:
+    """
+    Returns (store offset, last exported timestamp) of the last export that
+    InfluxDB fully received. New rows are picked by store offset, so rows
+    appended with an older timestamp (late iCloud syncs, knowledgeC rows
+    written after they started) are exported too.
+
+    Without a marker offset for this store (markers written before offsets
+    were recorded, a migrated store, an unreadable marker) the offset is
+    None and the rows after the last export timestamp are exported once.
+    """
+    marker = {}
+    if EXPORT_POSITION_FILE.exists():
         try:
-            return float(LAST_EXPORT_FILE.read_text().strip())
-        except:
-            pass
-    return 0.0
+            marker = json.loads(EXPORT_POSITION_FILE.read_text())
+        except (OSError, ValueError) as e:
+            print(f"[State] Ignoring unreadable {EXPORT_POSITION_FILE.name}: {e}")
+    if isinstance(marker, dict) and marker.get("store") == store.id and isinstance(marker.get("offset"), int):
+        return marker["offset"], float(marker.get("last_export", 0))
+
+    last_export = get_last_export_timestamp()
+    if last_export <= 0:
+        return 0, 0.0
+    print(f"[State] No export offset for this store - exporting rows after "
+          f"{datetime.fromtimestamp(last_export).isoformat()}")
+    return None, last_export
+
+
+def save_export_offset(store_id: str, offset: int, last_export: float):
+    """
+    Records how far InfluxDB has the store (atomically - a crash never
+    leaves a truncated file). The marker is written first: it is what the
+    next run reads, the timestamp file is its fallback.
+    """
+    atomic_write_text(EXPORT_POSITION_FILE, json.dumps({"store": store_id, "offset": offset,
+                                                        "last_export": last_export}))
+    atomic_write_text(LAST_EXPORT_FILE, str(last_export))
+
 
+def committed_position(store) -> int:
+    """
+    End of the last collector commit (see collector.store_events). Rows past
+    it may still be rolled back by the next collector run, so they are not
+    read. Stores without a manifest (written before it existed) count as
+    fully committed.
+    """
+    manifest = CommitManifest(manifest_path(store))
+    if manifest.applies_to(store.id) and manifest.position is not None:
+        return min(manifest.position, store.position())
+    return store.position()
 
-def save_last_export_timestamp(ts: float):
-    """Saves the last export timestamp."""
-    LAST_EXPORT_FILE.write_text(str(ts))
 
+def load_data(since_timestamp: float = 0, until_timestamp: float | None = None) -> pd.DataFrame:
+    """Loads events with since_timestamp < unix_ts < until_timestamp from the store."""
+    import pandas as pd
 
-def load_data(since_timestamp: float = 0) -> pd.DataFrame:
-    """Loads the CSV and filters for new data."""
-    if not CSV_FILE.exists():
-        print(f"CSV not found: {CSV_FILE}")
+    store = open_store(STORE_BACKEND, CSV_FILE, DB_FILE)
+    if not store.exists():
+        print(f"Data store not found: {store.path}")
         return pd.DataFrame()
 
-    df = pd.read_csv(CSV_FILE)
-    df["timestamp"] = pd.to_datetime(df["timestamp"], format="ISO8601", utc=True)
-    df["unix_ts"] = df["timestamp"].apply(lambda x: int(x.timestamp()))
+    # Only new data (the SQLite backend reads just this range via its index)
+    df = store.read(since=since_timestamp, until=until_timestamp, end=committed_position(store))
+    return prepare_events(df)
+
+
+def load_export_data(store, offset: int | None, since_timestamp: float,
+                     end: int) -> tuple[pd.DataFrame, pd.DataFrame | None, int]:
+    """
+    Loads the rows appended to the store between offset and end (the
+    committed position), or with offset None the rows after since_timestamp.
+    When the InfluxDB rollups are on and the store has no range reads (CSV),
+    also returns all events of the local days the new rows fall on, from one
+    read of the store (SQLite reads them by range in export_rollups_to_influxdb).
+    Returns (new events, touched days or None, new offset).
+    """
+    if offset is None:
+        df, new_offset = store.read(since=since_timestamp, end=end), end
+    else:
+        df, new_offset = store.read_appended(offset, end)
+    df = prepare_events(df)
+    if df.empty or store.range_reads or not INFLUX_ROLLUPS:
+        return df, None, new_offset
+
+    import numpy as np
+
+    days, _, _ = touched_days(df["unix_ts"])
+    events = store.read(end=end)
+    touched = prepare_events(events[np.isin(local_days(events["unix_ts"]), days)])
+    return df, touched, new_offset
 
-    # Nur neue Daten
-    if since_timestamp > 0:
-        df = df[df["unix_ts"] > since_timestamp]
 
-    # Normalize titles (long App Store names -> short)
-    df["title"] = df["title"].apply(lambda t: TITLE_NORMALIZE.get(t, t))
+def prepare_events(df: pd.DataFrame) -> pd.DataFrame:
+    """Normalizes titles and adds the category column."""
+    # Normalize titles (long App Store names -> short), once per unique title
+    df["title"] = normalize_titles(df["title"], exact_only=True).astype("category")
 
-    # Add category
-    df["category"] = df["title"].apply(get_category)
+    # Add category (mapped over the title categories, not the rows)
+    df["category"] = df["title"].map(get_category).astype("category")
 
     return df
 
 
+# Characters escaped per tag column in line protocol
+_TAG_ESCAPES = {
+    "source": (" ", ","),
+    "app": (" ", ",", "="),
+    "title": (" ", ",", "="),
+    "category": (" ", ","),
+}
+
+def _escape_tag(value: str, chars: tuple) -> str:
+    """Escapes special characters in a single tag value."""
+    for char in chars:
+        value = value.replace(char, "\\" + char)
+    return value
+
+
+def _map_unique(column: pd.Series, func) -> np.ndarray:
+    """Applies func once per unique value and broadcasts the result to all rows."""
+    import numpy as np
+    import pandas as pd
+
+    codes, uniques = pd.factorize(column, use_na_sentinel=False)
+    mapped = np.array([func(v) for v in uniques], dtype=object)
+    return mapped[codes]
+
+
+def _timestamps_ns(column: pd.Series) -> np.ndarray:
+    """
+    Converts a datetime64 column to nanosecond epoch timestamps.
+
+    Matches int(ts.timestamp() * 1e9) exactly: whole seconds are converted
+    with integer arithmetic, sub-second values go through the same float
+    rounding as Timestamp.timestamp().
+    """
+    import numpy as np
+
+    per_second = UNITS_PER_SECOND[column.dt.unit]
+    values = column.array.asi8
+    ns = (values // per_second) * 10**9
+
+    fractional = np.flatnonzero(values % per_second)
+    if len(fractional):
+        ns[fractional] = [int(round(v / per_second, 6) * 1e9) for v in values[fractional].tolist()]
+
+    return ns
+
+
+def encode_line_protocol(df: pd.DataFrame) -> list[str]:
+    """
+    Encodes rows as InfluxDB line protocol, column by column.
+
+    Tags are escaped once per unique value and timestamps are derived from
+    the datetime64 column directly, so the cost no longer grows with a
+    Python loop over every row.
+    """
+    if df.empty:
+        return []
+
+    tags = {col: _map_unique(df[col], lambda v, c=chars: _escape_tag(v, c))
+            for col, chars in _TAG_ESCAPES.items()}
+    duration = _map_unique(df["duration"], str)
+    ts_ns = _timestamps_ns(df["timestamp"]).astype(str).astype(object)
+
+    lines = ("screentime,source=" + tags["source"] + ",app=" + tags["app"]
+             + ",title=" + tags["title"] + ",category=" + tags["category"]
+             + " duration=" + duration + " " + ts_ns)
+    return lines.tolist()
+
+
+def encode_rollup_lines(totals: pd.DataFrame, measurement: str) -> list[str]:
+    """
+    Encodes bucket totals (see aggregates.bucket_totals) as line protocol:
+      screentime_hourly,source=Mac,app=...,title=Chrome,category=Browser duration=3600.5,count=12i 1707397200000000000
+    """
+    if totals.empty:
+        return []
+
+    tags = {col: _map_unique(totals[col], lambda v, c=chars: _escape_tag(v, c))
+            for col, chars in _TAG_ESCAPES.items()}
+    duration = _map_unique(totals["cents"] / 100, str)
+    count = _map_unique(totals["count"], lambda n: f"{n}i")
+    ts_ns = (totals["start"].astype("int64") * 10**9).astype(str).astype(object)
+
+    lines = (measurement + ",source=" + tags["source"] + ",app=" + tags["app"]
+             + ",title=" + tags["title"] + ",category=" + tags["category"]
+             + " duration=" + duration + ",count=" + count + " " + ts_ns)
+    return lines.tolist()
+
+
+def encode_active_lines(totals: pd.DataFrame, bucket: str) -> list[str]:
+    """
+    Encodes overlap-free totals (see aggregates.active_totals) as line protocol:
+      screentime_active,source=all,bucket=hourly seconds=3300.25 1707397200000000000
+    """
+    if totals.empty:
+        return []
+
+    source = _map_unique(totals["source"], lambda v: _escape_tag(v, _TAG_ESCAPES["source"]))
+    seconds = _map_unique(totals["cents"] / 100, str)
+    ts_ns = (totals["start"].astype("int64") * 10**9).astype(str).astype(object)
+
+    lines = (ACTIVE_MEASUREMENT + ",source=" + source + ",bucket=" + bucket
+             + " seconds=" + seconds + " " + ts_ns)
+    return lines.tolist()
+
+
+def get_influx_session() -> requests.Session:
+    """Returns the shared, connection-pooled InfluxDB session."""
+    global _influx_session
+    if _influx_session is None:
+        import requests
+        from requests.adapters import HTTPAdapter
+
+        session = requests.Session()
+        session.headers.update({
+            "Authorization": f"Token {INFLUX_TOKEN}",
+            "Content-Type": "text/plain; charset=utf-8",
+            "Content-Encoding": "gzip",
+        })
+        session.mount(INFLUX_URL, HTTPAdapter(pool_connections=1, pool_maxsize=1))
+        _influx_session = session
+    return _influx_session
+
+
+def iter_influx_batches(df: pd.DataFrame, max_lines: int = INFLUX_BATCH_LINES,
+                        max_bytes: int = INFLUX_BATCH_BYTES):
+    """
+    Yields (lines, first_unix_ts, last_unix_ts) batches in unix_ts order.
+
+    Rows are encoded chunk by chunk, so only one chunk and one batch are held
+    in memory at a time. A batch is cut when it reaches max_lines or when the
+    next line would push it past max_bytes (uncompressed).
+    """
+    df = df.sort_values("unix_ts", kind="stable")
+    batch, batch_bytes, first_ts, last_ts = [], 0, None, None
+
+    for start in range(0, len(df), ENCODE_CHUNK_ROWS):
+        chunk = df.iloc[start:start + ENCODE_CHUNK_ROWS]
+        for line, ts in zip(encode_line_protocol(chunk), chunk["unix_ts"].tolist()):
+            line_bytes = len(line.encode("utf-8")) + 1
+            if batch and (len(batch) >= max_lines or batch_bytes + line_bytes > max_bytes):
+                yield batch, first_ts, last_ts
+                batch, batch_bytes, first_ts = [], 0, None
+
+            batch.append(line)
+            batch_bytes += line_bytes
+            if first_ts is None:
+                first_ts = ts
+            last_ts = ts
+
+    if batch:
+        yield batch, first_ts, last_ts
+
+
+def get_outbox(sink: str) -> Outbox | None:
+    """Returns the outbox of a sink (influx, homeassistant), or None if disabled."""
+    if not OUTBOX_ENABLED:
+        return None
+    return Outbox(OUTBOX_DIR / sink, OUTBOX_MAX_BYTES, OUTBOX_BACKOFF, OUTBOX_MAX_BACKOFF)
+
+
+def is_rejected(status: int | None) -> bool:
+    """Client errors (bad token, malformed data) will not succeed on retry."""
+    return status is not None and status != 429 and status < 500
+
+
+def write_influx_batch(lines: list[str]) -> bool:
+    """Writes one gzipped batch, retrying with exponential backoff."""
+    ok = post_influx_body(gzip.compress("\n".join(lines).encode("utf-8"))) == 204
+    if ok:
+        metrics.count("lines_written", len(lines), "influx")
+    return ok
+
+
+def post_influx_body(body: bytes) -> int | None:
+    """
+    Posts a gzipped line protocol body, retrying server errors and connection
+    failures with exponential backoff. Returns the last HTTP status, or None
+    if InfluxDB could not be reached.
+    """
+    import requests
+
+    status = None
+    for attempt in range(INFLUX_MAX_RETRIES + 1):
+        delay = INFLUX_RETRY_BACKOFF * 2 ** attempt
+        if attempt:
+            metrics.count("retries", source="influx")
+        start = time.perf_counter()
+        try:
+            response = get_influx_session().post(
+                f"{INFLUX_URL}/api/v2/write",
+                params={"org": INFLUX_ORG, "bucket": INFLUX_BUCKET, "precision": "ns"},
+                data=body,
+                timeout=INFLUX_TIMEOUT
+            )
+            metrics.observe("http_request", time.perf_counter() - start, "influx")
+            metrics.count("bytes_sent", len(body), "influx")
+            status = response.status_code
+
+            if status == 204:
+                return status
+
+            print(f"[InfluxDB] Error {status}: {response.text[:200]}")
+            if is_rejected(status):
+                return status
+
+            retry_after = response.headers.get("Retry-After", "")
+            if retry_after.isdigit():
+                delay = int(retry_after)
+
+        except requests.RequestException as e:
+            print(f"[InfluxDB] Connection error: {e}")
+            status = None
+
+        if attempt < INFLUX_MAX_RETRIES:
+            print(f"[InfluxDB] Retrying batch in {delay:g}s ({attempt + 1}/{INFLUX_MAX_RETRIES})")
+            time.sleep(delay)
+
+    return status
+
+
+def deliver_influx_batch(lines: list[str]) -> bool:
+    """
+    Writes a batch, or queues it in the outbox when InfluxDB is unavailable.
+    True if the batch was written or is durably queued.
+
+    While batches are queued, new ones are queued behind them without a
+    write attempt: replaying in order keeps later rollup overwrites last,
+    and an outage does not cost the retry backoff for every batch.
+    """
+    body = gzip.compress("\n".join(lines).encode("utf-8"))
+    outbox = get_outbox("influx")
+
+    if outbox is None or not outbox.pending():
+        status = post_influx_body(body)
+        if status == 204:
+            metrics.count("lines_written", len(lines), "influx")
+            return True
+        if outbox is None or is_rejected(status):
+            return False
+
+    if not outbox.enqueue(body):
+        return False
+    metrics.count("outbox_queued", len(lines), "influx")
+    return True
+
+
+def replay_influx(body: bytes, header: dict) -> str:
+    status = post_influx_body(body)
+    if status == 204:
+        return DELIVERED
+    return REJECTED if is_rejected(status) else RETRY
+
+
 def export_to_influxdb(df: pd.DataFrame) -> bool:
     """
     Writes raw data to InfluxDB in Line Protocol format.
 
+    Data is streamed in gzipped batches; the first batch that still fails
+    after retries (and cannot be queued in the outbox) stops the export.
+
     Schema:
       screentime,source=iphone,app=com.google.Chrome,title=Chrome,category=browser duration=45.5 1707400000000000000
+
+    Returns:
+        True if every row was written or queued. After a failure the next
+        run sends all rows again (rewriting points is idempotent).
     """
     if df.empty:
         print("[InfluxDB] No data to export")
@@ -87,52 +494,62 @@ def export_to_influxdb(df: pd.DataFrame) -> bool:
 
     if not INFLUX_TOKEN:
         print("[InfluxDB] INFLUX_TOKEN not set - skipping")
-        return False
+        return True
+
+    written = 0
+    for lines, _, _ in iter_influx_batches(df):
+        if not deliver_influx_batch(lines):
+            print(f"[InfluxDB] Batch failed - {written} data points written before the error")
+            return False
+        written += len(lines)
+
+    print(f"[InfluxDB] {written} data points written")
+    return True
 
-    lines = []
-    for _, row in df.iterrows():
-        # Escape special characters in tag values
-        source = row["source"].replace(" ", "\\ ").replace(",", "\\,")
-        app = row["app"].replace(" ", "\\ ").replace(",", "\\,").replace("=", "\\=")
-        title = row["title"].replace(" ", "\\ ").replace(",", "\\,").replace("=", "\\=")
-        category = row["category"].replace(" ", "\\ ").replace(",", "\\,")
 
-        # Timestamp in nanoseconds
-        ts_ns = int(row["timestamp"].timestamp() * 1e9)
+def export_rollups_to_influxdb(df: pd.DataFrame, touched: pd.DataFrame | None = None) -> bool:
+    """
+    Rewrites the hourly and daily rollup points of every local day touched
+    by the new events.
+
+    Each touched day is recomputed from all of its events (not just the new
+    rows), so a point always holds the bucket's full total and overwriting
+    it in InfluxDB (same series + timestamp) is idempotent. The events come
+    from `touched` if already loaded (see load_export_data), otherwise from
+    a range read of the store.
+    """
+    if df.empty or not INFLUX_TOKEN or not INFLUX_ROLLUPS:
+        return True
 
-        line = f'screentime,source={source},app={app},title={title},category={category} duration={row["duration"]} {ts_ns}'
-        lines.append(line)
+    import numpy as np
 
-    # Batch write
-    data = "\n".join(lines)
+    days, start, end = touched_days(df["unix_ts"])
+    events = touched
+    if events is None:
+        store = open_store(STORE_BACKEND, CSV_FILE, DB_FILE)
+        events = prepare_events(store.read(since=start - 1, until=end, end=committed_position(store)))
+        events = events[np.isin(local_days(events["unix_ts"]), days)]
 
-    try:
-        response = requests.post(
-            f"{INFLUX_URL}/api/v2/write",
-            params={"org": INFLUX_ORG, "bucket": INFLUX_BUCKET, "precision": "ns"},
-            headers={
-                "Authorization": f"Token {INFLUX_TOKEN}",
-                "Content-Type": "text/plain; charset=utf-8"
-            },
-            data=data.encode('utf-8'),
-            timeout=30
-        )
-
-        if response.status_code == 204:
-            print(f"[InfluxDB] {len(lines)} data points written")
-            return True
-        else:
-            print(f"[InfluxDB] Error {response.status_code}: {response.text[:200]}")
-            return False
+    batches = [encode_rollup_lines(totals, ROLLUP_MEASUREMENTS[name])
+               for name, totals in bucket_totals(events).items()]
+    batches += [encode_active_lines(totals, name) for name, totals in active_totals(events).items()]
 
-    except Exception as e:
-        print(f"[InfluxDB] Connection error: {e}")
-        return False
+    written = 0
+    for lines in batches:
+        for i in range(0, len(lines), INFLUX_BATCH_LINES):
+            if not deliver_influx_batch(lines[i:i + INFLUX_BATCH_LINES]):
+                print(f"[InfluxDB] Rollup batch failed - {written} rollup points written before the error")
+                return False
+            written += len(lines[i:i + INFLUX_BATCH_LINES])
+
+    print(f"[InfluxDB] {written} rollup points written ({len(days)} days recomputed)")
+    return True
 
 
 def calculate_daily_aggregates(df: pd.DataFrame, target_date: datetime.date = None) -> dict:
     """
-    Calculates daily aggregates for Home Assistant sensors.
+    Calculates daily aggregates for Home Assistant sensors from a full frame.
+    Produces the same numbers as the incremental DailyRollup.
 
     Returns:
         {
@@ -148,42 +565,71 @@ def calculate_daily_aggregates(df: pd.DataFrame, target_date: datetime.date = No
     if target_date is None:
         target_date = datetime.now().date()
 
-    # Filter for target day
-    df_day = df[df["timestamp"].dt.date == target_date]
+    # Filter for target (local) day on integer epoch seconds
+    df_day = df[local_days(df["unix_ts"]) == day_index(target_date)]
+
+    return aggregates_from_rollup(rollup_frame(df_day)["days"].get(target_date.isoformat()))
 
-    if df_day.empty:
-        return None
 
-    # Base aggregates
-    total_seconds = df_day["duration"].sum()
-
-    # Per-device aggregates (dynamic)
-    by_device = df_day.groupby("source")["duration"].sum().to_dict()
-    by_device = {k: round(v / 60, 1) for k, v in by_device.items()}
-
-    # Top App
-    app_totals = df_day.groupby("title")["duration"].sum().sort_values(ascending=False)
-    top_app = app_totals.index[0] if len(app_totals) > 0 else "Unknown"
-    top_app_seconds = app_totals.iloc[0] if len(app_totals) > 0 else 0
-
-    # By category
-    by_category = df_day.groupby("category")["duration"].sum().to_dict()
-    by_category = {k: round(v / 60, 1) for k, v in by_category.items()}
-
-    # Top 10 apps
-    by_app = app_totals.head(10).to_dict()
-    by_app = {k: round(v / 60, 1) for k, v in by_app.items()}
-
-    return {
-        "total_minutes": round(total_seconds / 60, 1),
-        "by_device": by_device,
-        "top_app": top_app,
-        "top_app_minutes": round(top_app_seconds / 60, 1),
-        "by_category": by_category,
-        "by_app": by_app,
-        "session_count": len(df_day),
+def update_daily_rollup() -> DailyRollup:
+    """
+    Brings the persisted per-day rollup up to date by reading only the
+    events appended to the store since the previous run. Without new
+    events it is just loaded from ROLLUP_FILE (no pandas import).
+    """
+    global _rollup
+    store = open_store(STORE_BACKEND, CSV_FILE, DB_FILE)
+    if _rollup is None or _rollup.store_id != store.id:
+        _rollup = DailyRollup.load(ROLLUP_FILE, store.id)
+    rollup = _rollup
+
+    if not store.exists():
+        return rollup
+
+    # Store was replaced or truncated (e.g. migrated) - rebuild from scratch
+    end = committed_position(store)
+    if rollup.offset > end:
+        print("[HA] Data store changed - rebuilding daily rollup")
+        rollup.reset()
+    if rollup.offset == end:
+        return rollup
+
+    df_new, offset = store.read_appended(rollup.offset, end)
+    rollup.add(prepare_events(df_new), offset)
+    rollup.save()
+    return rollup
+
+
+def get_ha_session() -> requests.Session:
+    """Returns the shared Home Assistant session (one pooled connection per worker)."""
+    global _ha_session
+    if _ha_session is None:
+        import requests
+        from requests.adapters import HTTPAdapter
+
+        session = requests.Session()
+        session.headers.update({
+            "Authorization": f"Bearer {HA_TOKEN}",
+            "Content-Type": "application/json",
+        })
+        session.mount(HA_URL, HTTPAdapter(pool_connections=1, pool_maxsize=max(1, HA_CONCURRENCY)))
+        _ha_session = session
+    return _ha_session
+
+
+def ha_payload(state: any, attributes: dict = None, unit: str = None) -> dict:
+    """Builds the /api/states payload (without the volatile last_updated attribute)."""
+    payload = {
+        "state": state,
+        "attributes": dict(attributes or {})
     }
 
+    if unit:
+        payload["attributes"]["unit_of_measurement"] = unit
+
+    payload["attributes"]["state_class"] = "measurement"
+    return payload
+
 
 def update_ha_sensor(entity_id: str, state: any, attributes: dict = None, unit: str = None):
     """Updates a Home Assistant sensor via REST API."""
@@ -193,27 +639,14 @@ def update_ha_sensor(entity_id: str, state: any, attributes: dict = None, unit:
 
     url = f"{HA_URL}/api/states/{entity_id}"
 
-    payload = {
-        "state": state,
-        "attributes": attributes or {}
-    }
-
-    if unit:
-        payload["attributes"]["unit_of_measurement"] = unit
-
-    payload["attributes"]["state_class"] = "measurement"
+    payload = ha_payload(state, attributes, unit)
     payload["attributes"]["last_updated"] = datetime.now().isoformat()
 
     try:
-        response = requests.post(
-            url,
-            headers={
-                "Authorization": f"Bearer {HA_TOKEN}",
-                "Content-Type": "application/json"
-            },
-            json=payload,
-            timeout=10
-        )
+        start = time.perf_counter()
+        response = get_ha_session().post(url, json=payload, timeout=HA_TIMEOUT)
+        metrics.observe("http_request", time.perf_counter() - start, "homeassistant")
+        metrics.count("bytes_sent", len(response.request.body or b""), "homeassistant")
 
         if response.status_code in [200, 201]:
             print(f"[HA] {entity_id} = {state}")
@@ -227,19 +660,128 @@ def update_ha_sensor(entity_id: str, state: any, attributes: dict = None, unit:
         return False
 
 
-def export_to_homeassistant(df: pd.DataFrame):
-    """Exports daily aggregates as Home Assistant sensors."""
-    if not HA_TOKEN:
-        print("[HA] HA_TOKEN not set - skipping Home Assistant export")
-        return
+class MqttPublisher:
+    """
+    Persistent MQTT connection publishing sensors via Home Assistant MQTT discovery.
 
-    today = datetime.now().date()
-    aggregates = calculate_daily_aggregates(df, today)
+    Each sensor gets a retained discovery config under
+    <MQTT_DISCOVERY_PREFIX>/sensor/<object_id>/config plus retained state and
+    attribute topics, so HA picks up the latest values even after a restart.
+    The connection stays open between daemon cycles.
+    """
 
-    if not aggregates:
-        print("[HA] No data for today")
-        return
+    def __init__(self, host: str, port: int = 1883, username: str = "", password: str = "",
+                 discovery_prefix: str = "homeassistant", topic_prefix: str = "screentime"):
+        import paho.mqtt.client as mqtt
+
+        if not hasattr(mqtt, "CallbackAPIVersion"):
+            raise ImportError("paho-mqtt 2.0+ is required")
+        self.discovery_prefix = discovery_prefix
+        self.topic_prefix = topic_prefix
+        self.availability_topic = f"{topic_prefix}/status"
+        self.announced = {}  # object_id -> discovery config last published
+
+        self.client = mqtt.Client(mqtt.CallbackAPIVersion.VERSION2, client_id=f"{topic_prefix}-exporter")
+        if username:
+            self.client.username_pw_set(username, password or None)
+        self.client.will_set(self.availability_topic, "offline", qos=1, retain=True)
+        self.client.on_connect = self._on_connect
+        self.client.connect(host, port, keepalive=60)
+        self.client.loop_start()
+
+    def _on_connect(self, client, userdata, flags, reason_code, properties):
+        if reason_code.is_failure:
+            print(f"[MQTT] Connection refused: {reason_code}")
+            return
+        client.publish(self.availability_topic, "online", qos=1, retain=True)
+        # Broker may have lost its retained discovery configs - announce again
+        self.announced.clear()
+
+    def _publish(self, topic: str, payload: str) -> bool:
+        start = time.perf_counter()
+        info = self.client.publish(topic, payload, qos=1, retain=True)
+        info.wait_for_publish(timeout=MQTT_TIMEOUT)
+        metrics.observe("publish", time.perf_counter() - start, "mqtt")
+        metrics.count("bytes_sent", len(payload.encode("utf-8")), "mqtt")
+        return info.is_published()
+
+    def discovery_config(self, object_id: str, state: any, unit: str, attributes: dict) -> dict:
+        base = f"{self.topic_prefix}/{object_id}"
+        config = {
+            "name": attributes.get("friendly_name", object_id),
+            "unique_id": object_id,
+            "object_id": object_id,
+            "state_topic": f"{base}/state",
+            "json_attributes_topic": f"{base}/attributes",
+            "availability_topic": self.availability_topic,
+            "icon": attributes.get("icon"),
+            "device": {"identifiers": [self.topic_prefix], "name": "Screen Time", "manufacturer": "Apple"},
+        }
+        if unit:
+            config["unit_of_measurement"] = unit
+        # Text states (e.g. the top app) must not be declared as measurements
+        if isinstance(state, (int, float)):
+            config["state_class"] = "measurement"
+        return {k: v for k, v in config.items() if v is not None}
+
+    def publish_sensor(self, entity_id: str, state: any, attributes: dict = None, unit: str = None) -> bool:
+        attributes = attributes or {}
+        object_id = entity_id.split(".", 1)[-1]
+        base = f"{self.topic_prefix}/{object_id}"
+
+        try:
+            config = self.discovery_config(object_id, state, unit, attributes)
+            if self.announced.get(object_id) != config:
+                if not self._publish(f"{self.discovery_prefix}/sensor/{object_id}/config", json.dumps(config)):
+                    print(f"[MQTT] Discovery config for {entity_id} not acknowledged")
+                    return False
+                self.announced[object_id] = config
+
+            ok = (self._publish(f"{base}/attributes", json.dumps(attributes, default=str))
+                  and self._publish(f"{base}/state", str(state)))
+        except Exception as e:
+            print(f"[MQTT] Publish error for {entity_id}: {e}")
+            return False
+
+        if ok:
+            print(f"[MQTT] {entity_id} = {state}")
+        else:
+            print(f"[MQTT] {entity_id} not acknowledged within {MQTT_TIMEOUT}s")
+        return ok
 
+    def close(self):
+        # A clean disconnect does not fire the will, so one-shot runs stay "online"
+        self.client.disconnect()
+        self.client.loop_stop()
+
+
+def get_mqtt_publisher() -> MqttPublisher | None:
+    """Returns the shared MQTT publisher, or None if paho-mqtt or the broker is unavailable."""
+    global _mqtt_publisher
+    if _mqtt_publisher is None:
+        try:
+            _mqtt_publisher = MqttPublisher(MQTT_HOST, MQTT_PORT, MQTT_USERNAME, MQTT_PASSWORD,
+                                            MQTT_DISCOVERY_PREFIX, MQTT_TOPIC_PREFIX)
+        except ImportError:
+            print("[MQTT] paho-mqtt 2.0+ not installed - run: pip3 install 'paho-mqtt>=2.0'")
+        except OSError as e:
+            print(f"[MQTT] Cannot connect to {MQTT_HOST}:{MQTT_PORT}: {e}")
+    return _mqtt_publisher
+
+
+def close_connections():
+    """Closes the persistent connections (called when the daemon stops)."""
+    global _influx_session, _ha_session, _mqtt_publisher
+    for session in (_influx_session, _ha_session):
+        if session is not None:
+            session.close()
+    if _mqtt_publisher is not None:
+        _mqtt_publisher.close()
+    _influx_session = _ha_session = _mqtt_publisher = None
+
+
+def build_ha_sensors(aggregates: dict) -> list[tuple]:
+    """Returns (entity_id, state, unit, attributes) for every sensor derived from the aggregates."""
     # Base sensors
     sensors = [
         ("sensor.screentime_total", aggregates["total_minutes"], "min", {
@@ -273,68 +815,332 @@ def export_to_homeassistant(df: pd.DataFrame):
             "icon": icon,
         }))
 
-    for entity_id, state, unit, attrs in sensors:
-        update_ha_sensor(entity_id, state, attrs, unit)
+    # Overlap-free screen time (time on several devices at once counted once)
+    if "active_minutes" in aggregates:
+        sensors.append(("sensor.screentime_active", aggregates["active_minutes"], "min", {
+            "friendly_name": "Screen Time Active",
+            "icon": "mdi:account-clock",
+            "overlap_minutes": round(aggregates["total_minutes"] - aggregates["active_minutes"], 1),
+            **{f"device_{k}": v for k, v in aggregates["active_by_device"].items()},
+        }))
 
     # Category sensor with all values as attributes
-    update_ha_sensor(
+    sensors.append((
         "sensor.screentime_by_category",
         aggregates["by_category"].get("Social", 0),
+        "min",
         {
             "friendly_name": "Screen Time by Category",
             "icon": "mdi:chart-pie",
             **{f"category_{k}": v for k, v in aggregates["by_category"].items()}
         },
-        "min"
-    )
+    ))
 
     # Top apps as attributes
-    update_ha_sensor(
+    sensors.append((
         "sensor.screentime_top_apps",
         len(aggregates["by_app"]),
+        "apps",
         {
             "friendly_name": "Screen Time Top Apps",
             "icon": "mdi:format-list-numbered",
             **aggregates["by_app"]
         },
-        "apps"
-    )
+    ))
+
+    return sensors
 
 
-def main():
+def _payload_digest(entity_id: str, state: any, attributes: dict, unit: str) -> str:
+    payload = ha_payload(state, attributes, unit)
+    # Transport is part of the digest, so switching transports pushes everything once
+    text = json.dumps([HA_TRANSPORT, entity_id, payload], sort_keys=True, default=str)
+    return hashlib.blake2b(text.encode("utf-8"), digest_size=16).hexdigest()
+
+
+def publish_ha_sensors(sensors: list[tuple]) -> bool:
+    """
+    Pushes sensors concurrently over the pooled session (or the MQTT
+    connection with HA_TRANSPORT=mqtt).
+
+    Sensors whose payload matches the last successful push (and is younger
+    than HA_STATE_MAX_AGE) are skipped. Failed updates are queued in the
+    outbox and replayed by the next run. Returns False if an update neither
+    went through nor could be queued.
+    """
+    from concurrent.futures import ThreadPoolExecutor
+
+    cache = PushStateCache(HA_STATE_FILE, HA_STATE_MAX_AGE)
+    now = time.time()
+
+    pending = []
+    for entity_id, state, unit, attrs in sensors:
+        digest = _payload_digest(entity_id, state, attrs, unit)
+        if not cache.is_current(entity_id, digest, now):
+            pending.append((entity_id, state, unit, attrs, digest))
+    skipped = len(sensors) - len(pending)
+
+    update = get_ha_update() if pending else None
+    if update is None:
+        return queue_ha_updates(pending)
+
+    def push(sensor):
+        entity_id, state, unit, attrs, _ = sensor
+        start = time.perf_counter()
+        ok = update(entity_id, state, attrs, unit)
+        return ok, time.perf_counter() - start
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=max(1, HA_CONCURRENCY)) as pool:
+        results = list(pool.map(push, pending))
+    elapsed = time.perf_counter() - start
+
+    for (entity_id, _, _, _, digest), (ok, _) in zip(pending, results):
+        if ok:
+            cache.mark(entity_id, digest, now)
+    cache.save()
+
+    # Queued older values of these sensors are outdated now
+    outbox = get_outbox("homeassistant")
+    if outbox and outbox.pending():
+        outbox.supersede(sensor[0] for sensor, (ok, _) in zip(pending, results) if ok)
+    queued = queue_ha_updates([sensor for sensor, (ok, _) in zip(pending, results) if not ok])
+
+    # Latency saved vs. pushing every sensor one after another
+    latencies = [latency for _, latency in results]
+    average = sum(latencies) / len(latencies) if latencies else 0.0
+    sequential = sum(latencies) + skipped * average
+    failed = sum(1 for ok, _ in results if not ok)
+    sink = "mqtt" if HA_TRANSPORT == "mqtt" else "homeassistant"
+    metrics.count("sensors_updated", len(pending) - failed, sink)
+    metrics.count("sensors_failed", failed, sink)
+    metrics.count("sensors_skipped", skipped, sink)
+    print(f"[HA] {len(pending) - failed} sensors updated, {failed} failed, {skipped} unchanged skipped "
+          f"in {elapsed:.2f}s (sequential ~{sequential:.2f}s, saved ~{max(0.0, sequential - elapsed):.2f}s)")
+
+    return queued
+
+
+def get_ha_update():
+    """Returns the update function of the configured transport, or None if it is unavailable."""
+    if HA_TRANSPORT == "mqtt":
+        publisher = get_mqtt_publisher()
+        return publisher.publish_sensor if publisher else None
+    get_ha_session()  # Create the shared session before the workers race for it
+    return update_ha_sensor
+
+
+def queue_ha_updates(sensors: list[tuple]) -> bool:
+    """Queues failed (entity_id, state, unit, attributes, digest) updates; True if all are queued."""
+    if not sensors:
+        return True
+    outbox = get_outbox("homeassistant")
+    if outbox is None:
+        return False
+
+    ok = all(outbox.enqueue(json.dumps(list(sensor), default=str).encode("utf-8"), key=sensor[0])
+             for sensor in sensors)
+    if ok:
+        metrics.count("outbox_queued", len(sensors), "homeassistant")
+        print(f"[Outbox] homeassistant: {len(sensors)} sensor updates queued for the next run")
+    return ok
+
+
+def drain_outboxes():
+    """Replays deliveries queued by earlier runs (oldest first, with backoff while a sink stays down)."""
+    if not OUTBOX_ENABLED:
+        return
+
+    influx = get_outbox("influx")
+    if influx.pending() and INFLUX_TOKEN:
+        delivered, remaining = influx.drain(replay_influx)
+        metrics.count("outbox_replayed", delivered, "influx")
+        if delivered:
+            print(f"[Outbox] influx: {delivered} queued batches written, {remaining} left")
+
+    ha = get_outbox("homeassistant")
+    if ha.pending() and ha.is_due() and (HA_TOKEN or HA_TRANSPORT == "mqtt"):
+        cache = PushStateCache(HA_STATE_FILE, HA_STATE_MAX_AGE)
+        update = get_ha_update()
+
+        def replay(payload: bytes, header: dict) -> str:
+            entity_id, state, unit, attrs, digest = json.loads(payload)
+            if update is None or not update(entity_id, state, attrs, unit):
+                return RETRY
+            cache.mark(entity_id, digest, time.time())
+            return DELIVERED
+
+        delivered, remaining = ha.drain(replay)
+        cache.save()
+        metrics.count("outbox_replayed", delivered, "homeassistant")
+        if delivered:
+            print(f"[Outbox] homeassistant: {delivered} queued sensor updates sent, {remaining} left")
+
+
+# Rolling window sensors: window label -> (entity suffix, friendly name)
+WINDOW_SENSORS = {
+    "1h": ("last_hour", "Screen Time Last Hour"),
+    "24h": ("last_24h", "Screen Time Last 24 Hours"),
+    "7d": ("last_7d", "Screen Time Last 7 Days"),
+}
+
+
+def build_window_sensors(windows: dict) -> list[tuple]:
+    """Rolling window sensors; windows without events report 0 so they drop back down."""
+    sensors = []
+    for label, aggregates in windows.items():
+        suffix, name = WINDOW_SENSORS[label]
+        aggregates = aggregates or {"total_minutes": 0, "by_device": {}, "top_app": "None",
+                                    "top_app_minutes": 0, "session_count": 0}
+        sensors.append((f"sensor.screentime_{suffix}", aggregates["total_minutes"], "min", {
+            "friendly_name": name,
+            "icon": "mdi:history",
+            "top_app": aggregates["top_app"],
+            "top_app_minutes": aggregates["top_app_minutes"],
+            "session_count": aggregates["session_count"],
+            # Windows are summed from hourly buckets, see aggregates.window_rollup
+            "resolution": "1h buckets, first hour prorated",
+            **{f"device_{k}": v for k, v in aggregates["by_device"].items()},
+        }))
+    return sensors
+
+
+def export_to_homeassistant(aggregates: dict | None, windows: dict | None = None) -> bool:
+    """Exports today's aggregates (and rolling windows) as Home Assistant sensors. Returns False if any update failed."""
+    if HA_TRANSPORT == "mqtt" and not MQTT_HOST:
+        print("[MQTT] MQTT_HOST not set - skipping Home Assistant export")
+        return True
+
+    if HA_TRANSPORT != "mqtt" and not HA_TOKEN:
+        print("[HA] HA_TOKEN not set - skipping Home Assistant export")
+        return True
+
+    sensors = build_window_sensors(windows) if windows else []
+    if aggregates:
+        sensors = build_ha_sensors(aggregates) + sensors
+    else:
+        print("[HA] No data for today")
+    if not sensors:
+        return True
+
+    return publish_ha_sensors(sensors)
+
+
+def push_homeassistant() -> bool:
+    """
+    Brings the rollup up to date and pushes today's and the rolling window
+    sensors. Unchanged sensors are skipped, so only the deltas go out.
+    Runs on every export, also without new data: the rolling windows move
+    with the clock and today's sensors reset at midnight.
+    """
+    rollup = update_daily_rollup()
+    return export_to_homeassistant(rollup.aggregates(datetime.now().date()), rollup.window_aggregates())
+
+
+def export() -> bool:
+    """Runs one export; returns False if a sink did not receive everything."""
     print(f"=== Screen Time Export - {datetime.now().isoformat()} ===\n")
 
-    # Load last export timestamp
-    last_export = get_last_export_timestamp()
+    # Deliveries queued while a sink was unavailable go out first
+    with metrics.stage("outbox"):
+        drain_outboxes()
+
+    store = open_store(STORE_BACKEND, CSV_FILE, DB_FILE)
+    if not store.exists():
+        print(f"Data store not found: {store.path}")
+        return True
+
+    # Home Assistant only: its sensors come from the rollup, which reads
+    # just the appended rows itself - nothing to load here
+    if not INFLUX_TOKEN:
+        print("[InfluxDB] INFLUX_TOKEN not set - skipping")
+        print("\n--- Home Assistant Export ---")
+        with metrics.stage("export", "homeassistant"):
+            return push_homeassistant()
+
+    # Where the last complete InfluxDB export stopped in the store
+    offset, last_export = get_export_offset(store)
     if last_export > 0:
         print(f"Last export: {datetime.fromtimestamp(last_export).isoformat()}")
     else:
         print("First export - all data will be exported")
 
-    # Load data
-    df = load_data(since_timestamp=last_export)
+    # Fast path: nothing was committed since the last complete export, so
+    # there is nothing to load (and no need to import pandas) - only the
+    # Home Assistant sensors are refreshed from the persisted rollup
+    end = committed_position(store)
+    if offset == end:
+        print("\nNo new data to export.")
+        with metrics.stage("export", "homeassistant"):
+            return push_homeassistant()
+
+    # Load the rows appended since then
+    with metrics.stage("load"):
+        df, touched, new_offset = load_export_data(store, offset, last_export, end)
+    metrics.count("rows_loaded", len(df))
     print(f"Loaded data: {len(df)} new entries")
 
+    influx_ok = True
     if df.empty:
         print("\nNo new data to export.")
-        return
-
-    # Export to InfluxDB (raw data)
-    print("\n--- InfluxDB Export ---")
-    influx_success = export_to_influxdb(df)
+    else:
+        # Export to InfluxDB (raw data)
+        print("\n--- InfluxDB Export ---")
+        with metrics.stage("export", "influx"):
+            influx_ok = export_to_influxdb(df)
+        # Rollups of the days the new rows fall on; on failure keep the old
+        # offset so the next run sends the rows and recomputes the days again
+        with metrics.stage("rollups", "influx"):
+            if influx_ok and not export_rollups_to_influxdb(df, touched):
+                print("[InfluxDB] Rollups incomplete - export offset not advanced")
+                influx_ok = False
+        influx_outbox = get_outbox("influx")
+        if influx_ok and influx_outbox and influx_outbox.pending():
+            print(f"[Outbox] influx: {len(influx_outbox.segments())} batches queued for replay")
 
     # Export to Home Assistant (aggregates)
     print("\n--- Home Assistant Export ---")
-    # For HA we need all data from today, not just new
-    df_full = load_data(since_timestamp=0)
-    export_to_homeassistant(df_full)
+    # For HA we need all data from today, not just new - the rollup keeps
+    # per-day totals and only reads rows appended since the last run
+    with metrics.stage("export", "homeassistant"):
+        ha_ok = push_homeassistant()
+
+    # Advance only once InfluxDB has every new row (written or queued)
+    if influx_ok:
+        if not df.empty:
+            last_export = max(last_export, float(df["unix_ts"].max()))
+        save_export_offset(store.id, new_offset, last_export)
+        print(f"\nExport completed up to {store.position_unit} {new_offset} "
+              f"(last timestamp: {datetime.fromtimestamp(last_export).isoformat()})")
+    return influx_ok and ha_ok
+
+
+def export_run_metrics(report: dict):
+    """Writes this run's report and the latest collector report to InfluxDB (METRICS_INFLUX)."""
+    reports = [report, metrics.latest_report("collector")]
+    # Points are keyed by the run's end time, so re-sending a report is idempotent
+    lines = [line for r in reports if r for line in metrics.influx_lines(r)]
+    if write_influx_batch(lines):
+        print(f"[Metrics] {len(lines)} pipeline points written to InfluxDB")
+
+
+def main() -> bool:
+    """Runs one export and writes its run report (see metrics.py). Returns False if a sink failed."""
+    metrics.start_run("exporter")
+    try:
+        ok = export()
+    except BaseException:
+        metrics.finish_run(ok=False)
+        raise
+    report = metrics.finish_run(ok=ok)
 
-    # Save last timestamp
-    if influx_success and len(df) > 0:
-        max_ts = df["unix_ts"].max()
-        save_last_export_timestamp(max_ts)
-        print(f"\nExport completed. Last timestamp: {datetime.fromtimestamp(max_ts).isoformat()}")
+    if metrics.METRICS_INFLUX and INFLUX_TOKEN:
+        export_run_metrics(report)
+    return ok
 
 
 if __name__ == "__main__":
-    main()
+    ok = main()
+    close_connections()
+    # Non-zero so run.py, launchd and cron see a partial export
+    sys.exit(0 if ok else 1)
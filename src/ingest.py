@@ -0,0 +1,183 @@
+#!/usr/bin/env python3
+"""
+Apple Screen Time Exporter - Ingest Server
+Receives events from collectors on several Macs (COLLECTOR_MODE=push) and
+writes them into this host's store as one deduplicated stream.
+
+Endpoints (all require "Authorization: Bearer <INGEST_TOKEN>"):
+
+  GET  /health                 -> {"ok": true}
+  GET  /watermarks?host=<host> -> {source: last stored created_at} of that host
+  POST /events                 {"host": ..., "events": [{timestamp, app, title, duration,
+                                source, created_at}, ...]}, optionally gzip-encoded
+                               -> {"received", "stored", "duplicates"}
+
+Watermarks are kept per host (data/hosts/<host>.json), so each collector
+resumes where its own events stopped. Batches are stored one at a time
+under STORE_LOCK, which the export cycles of `run.py ingest` share.
+"""
+
+import gzip
+import hmac
+import io
+import json
+import os
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from pathlib import Path
+from urllib.parse import parse_qs, urlparse
+from dotenv import load_dotenv
+
+import collector
+from state import WatermarkStore
+
+# Load .env from parent directory
+load_dotenv(Path(__file__).parent.parent / ".env")
+
+SCRIPT_DIR = Path(__file__).parent.parent
+HOSTS_DIR = SCRIPT_DIR / "data" / "hosts"
+INGEST_HOST = os.getenv("INGEST_HOST", "0.0.0.0")
+INGEST_PORT = int(os.getenv("INGEST_PORT", "8787"))
+INGEST_TOKEN = os.getenv("INGEST_TOKEN", "")
+INGEST_MAX_BYTES = int(os.getenv("INGEST_MAX_BYTES", str(64 * 1024 * 1024)))
+
+# Held while a batch is stored and during export cycles
+STORE_LOCK = threading.Lock()
+
+_host_watermarks = {}
+
+
+def host_watermarks(host: str) -> WatermarkStore:
+    """Returns the watermark store of one collector host (committed with the store, see collector.store_events)."""
+    name = re.sub(r"[^A-Za-z0-9._-]", "_", host)
+    if name not in _host_watermarks:
+        _host_watermarks[name] = WatermarkStore(HOSTS_DIR / f"{name}.json", manifest=collector.get_manifest(),
+                                                key=f"host:{name}")
+    return _host_watermarks[name]
+
+
+def validate_events(events) -> list[dict]:
+    """Checks the fields of received events; raises ValueError on the first bad one."""
+    if not isinstance(events, list):
+        raise ValueError("events must be a list")
+    valid = []
+    for i, ev in enumerate(events):
+        try:
+            valid.append({
+                "timestamp": str(ev["timestamp"]),
+                "app": str(ev["app"]),
+                "title": str(ev["title"]),
+                "duration": float(ev["duration"]),
+                "source": str(ev["source"]),
+                "_created_at": float(ev.get("created_at", 0)),
+            })
+        except (KeyError, TypeError, ValueError) as e:
+            raise ValueError(f"event {i}: {e!r}")
+        if not valid[-1]["source"] or not valid[-1]["timestamp"]:
+            raise ValueError(f"event {i}: empty source or timestamp")
+    return valid
+
+
+def ingest_batch(host: str, events: list[dict]) -> dict:
+    """Stores a validated batch and advances the host's watermarks in the same commit."""
+    with STORE_LOCK:
+        stored = collector.store_events(events, host_watermarks(host)) if events else 0
+
+    print(f"[Ingest] {host}: {len(events)} received, {stored} stored", flush=True)
+    return {"received": len(events), "stored": stored, "duplicates": len(events) - stored}
+
+
+class IngestHandler(BaseHTTPRequestHandler):
+    server_version = "screentime-ingest"
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, status: int, data: dict):
+        body = json.dumps(data).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _authorized(self) -> bool:
+        auth = self.headers.get("Authorization", "")
+        if INGEST_TOKEN and hmac.compare_digest(auth.encode("utf-8"), f"Bearer {INGEST_TOKEN}".encode("utf-8")):
+            return True
+        self._send_json(401, {"error": "unauthorized"})
+        return False
+
+    def do_GET(self):
+        if not self._authorized():
+            return
+        url = urlparse(self.path)
+        if url.path == "/health":
+            self._send_json(200, {"ok": True})
+        elif url.path == "/watermarks":
+            host = parse_qs(url.query).get("host", [""])[0]
+            if not host:
+                self._send_json(400, {"error": "host missing"})
+                return
+            self._send_json(200, host_watermarks(host).marks)
+        else:
+            self._send_json(404, {"error": "not found"})
+
+    def do_POST(self):
+        if not self._authorized():
+            return
+        if urlparse(self.path).path != "/events":
+            self._send_json(404, {"error": "not found"})
+            return
+
+        length = int(self.headers.get("Content-Length") or 0)
+        if length > INGEST_MAX_BYTES:
+            self._send_json(413, {"error": f"body larger than {INGEST_MAX_BYTES} bytes"})
+            return
+        try:
+            body = self.rfile.read(length)
+            if self.headers.get("Content-Encoding") == "gzip":
+                with gzip.GzipFile(fileobj=io.BytesIO(body)) as f:
+                    body = f.read(INGEST_MAX_BYTES + 1)
+                if len(body) > INGEST_MAX_BYTES:
+                    self._send_json(413, {"error": f"body larger than {INGEST_MAX_BYTES} bytes"})
+                    return
+            payload = json.loads(body)
+            host = str(payload["host"])
+            events = validate_events(payload["events"])
+        except (OSError, EOFError, ValueError, KeyError, TypeError) as e:
+            self._send_json(400, {"error": f"bad request: {e}"})
+            return
+
+        try:
+            result = ingest_batch(host, events)
+        except Exception as e:
+            print(f"[Ingest] {host}: error storing batch: {e}", flush=True)
+            self._send_json(500, {"error": str(e)})
+            return
+        self._send_json(200, result)
+
+
+def start_server(host: str = INGEST_HOST, port: int = INGEST_PORT) -> HTTPServer:
+    """
+    Serves the ingest API from a background thread. Requests are handled one
+    at a time, which also keeps the dedup index on a single thread.
+    """
+    if not INGEST_TOKEN:
+        raise RuntimeError("INGEST_TOKEN is not set")
+    server = HTTPServer((host, port), IngestHandler)
+    threading.Thread(target=server.serve_forever, name="ingest", daemon=True).start()
+    print(f"[Ingest] Listening on {host}:{server.server_port}", flush=True)
+    return server
+
+
+if __name__ == "__main__":
+    # Ingest only - `run.py ingest` also runs the export cycles
+    start_server()
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,281 @@
+#!/usr/bin/env python3
+"""
+Apple Screen Time Exporter - Metrics
+Per-run instrumentation for the collector and the exporter.
+
+A run records stage wall times (optionally per source, e.g. per device or
+sink), counters (rows read / deduplicated / written, bytes sent, ...) and
+request latencies. When the run finishes it is written as:
+
+  data/reports/<component>-<timestamp>.json   JSON run report (last METRICS_KEEP_REPORTS kept)
+  <METRICS_TEXTFILE_DIR>/screentime_<component>.prom
+                                              Prometheus textfile (node_exporter textfile collector)
+
+and the exporter can also write the reports to InfluxDB (METRICS_INFLUX).
+Recording functions are no-ops while no run is active, so the instrumented
+functions can still be called on their own (benchmarks, tools).
+"""
+
+import os
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+SCRIPT_DIR = Path(__file__).parent.parent
+REPORT_DIR = SCRIPT_DIR / "data" / "reports"
+
+# Settings from .env, read by load_settings() when a run finishes: this module
+# is imported by every entry point, so importing it must stay cheap (see
+# benchmarks/bench_startup.py). Values assigned before that are kept.
+METRICS_KEEP_REPORTS = None
+# Directory scraped by node_exporter --collector.textfile.directory (empty = off)
+METRICS_TEXTFILE_DIR = None
+# Also write run reports to InfluxDB (measurement screentime_pipeline)
+METRICS_INFLUX = None
+
+INFLUX_MEASUREMENT = "screentime_pipeline"
+
+_run = None
+
+
+class RunMetrics:
+    """Stage timings, counters and latencies of one collector/exporter run (thread-safe)."""
+
+    def __init__(self, component: str):
+        self.component = component
+        self.started = time.time()
+        self._start = time.perf_counter()
+        self.stages = {}     # (stage, source) -> seconds
+        self.counters = {}   # (name, source) -> value
+        self.latencies = {}  # (name, source) -> [count, sum, max]
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def stage(self, name: str, source: str = ""):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_time(name, time.perf_counter() - start, source)
+
+    def add_time(self, name: str, seconds: float, source: str = ""):
+        with self._lock:
+            self.stages[(name, source)] = self.stages.get((name, source), 0.0) + seconds
+
+    def count(self, name: str, value: int = 1, source: str = ""):
+        with self._lock:
+            self.counters[(name, source)] = self.counters.get((name, source), 0) + value
+
+    def observe(self, name: str, seconds: float, source: str = ""):
+        with self._lock:
+            entry = self.latencies.setdefault((name, source), [0, 0.0, 0.0])
+            entry[0] += 1
+            entry[1] += seconds
+            entry[2] = max(entry[2], seconds)
+
+    def report(self, ok: bool) -> dict:
+        with self._lock:
+            return {
+                "component": self.component,
+                "started": self.started,
+                "finished": time.time(),
+                "duration": round(time.perf_counter() - self._start, 6),
+                "ok": ok,
+                "stages": [{"stage": name, "source": source, "seconds": round(seconds, 6)}
+                           for (name, source), seconds in self.stages.items()],
+                "counters": [{"name": name, "source": source, "value": value}
+                             for (name, source), value in self.counters.items()],
+                "latencies": [{"name": name, "source": source, "count": n, "sum": round(total, 6),
+                               "max": round(peak, 6)}
+                              for (name, source), (n, total, peak) in self.latencies.items()],
+            }
+
+
+def start_run(component: str) -> RunMetrics:
+    """Starts recording a new run; the recording functions below write into it."""
+    global _run
+    _run = RunMetrics(component)
+    return _run
+
+
+def stage(name: str, source: str = ""):
+    """Context manager timing a stage of the active run."""
+    run = _run
+    return run.stage(name, source) if run else _no_stage()
+
+
+@contextmanager
+def _no_stage():
+    yield
+
+
+def add_time(name: str, seconds: float, source: str = ""):
+    if _run:
+        _run.add_time(name, seconds, source)
+
+
+def count(name: str, value: int = 1, source: str = ""):
+    if _run:
+        _run.count(name, value, source)
+
+
+def observe(name: str, seconds: float, source: str = ""):
+    if _run:
+        _run.observe(name, seconds, source)
+
+
+def load_settings():
+    """Reads the METRICS_* settings that are still unset from .env / the environment."""
+    global METRICS_KEEP_REPORTS, METRICS_TEXTFILE_DIR, METRICS_INFLUX
+    if None not in (METRICS_KEEP_REPORTS, METRICS_TEXTFILE_DIR, METRICS_INFLUX):
+        return
+    from dotenv import load_dotenv
+
+    # Load .env from parent directory
+    load_dotenv(SCRIPT_DIR / ".env")
+    if METRICS_KEEP_REPORTS is None:
+        METRICS_KEEP_REPORTS = int(os.getenv("METRICS_KEEP_REPORTS", "200"))
+    if METRICS_TEXTFILE_DIR is None:
+        METRICS_TEXTFILE_DIR = os.getenv("METRICS_TEXTFILE_DIR", str(REPORT_DIR))
+    if METRICS_INFLUX is None:
+        METRICS_INFLUX = os.getenv("METRICS_INFLUX", "false").lower() in ("1", "true", "yes")
+
+
+def finish_run(ok: bool = True) -> dict | None:
+    """Ends the active run and writes its JSON report and Prometheus textfile."""
+    from state import atomic_write_text
+
+    global _run
+    run, _run = _run, None
+    if run is None:
+        return None
+
+    load_settings()
+    report = run.report(ok)
+    try:
+        write_report(report)
+        if METRICS_TEXTFILE_DIR:
+            atomic_write_text(Path(METRICS_TEXTFILE_DIR) / f"screentime_{run.component}.prom",
+                              prometheus_text(report))
+    except OSError as e:
+        print(f"[Metrics] Could not write run report: {e}")
+    return report
+
+
+def write_report(report: dict, report_dir: Path | None = None, keep: int | None = None) -> Path:
+    """Writes a run report and prunes the oldest reports of the same component."""
+    import json
+    from datetime import datetime
+    from state import atomic_write_text
+
+    load_settings()
+    report_dir = report_dir or REPORT_DIR
+    keep = METRICS_KEEP_REPORTS if keep is None else keep
+    stamp = datetime.fromtimestamp(report["finished"]).strftime("%Y%m%dT%H%M%S%f")
+    path = Path(report_dir) / f"{report['component']}-{stamp}.json"
+    atomic_write_text(path, json.dumps(report, indent=2))
+
+    reports = sorted(Path(report_dir).glob(f"{report['component']}-*.json"))
+    for old in reports[:max(0, len(reports) - keep)]:
+        old.unlink(missing_ok=True)
+    return path
+
+
+def latest_report(component: str, report_dir: Path | None = None) -> dict | None:
+    """Returns the newest run report of a component, if any."""
+    import json
+
+    report_dir = report_dir or REPORT_DIR
+    reports = sorted(Path(report_dir).glob(f"{component}-*.json"))
+    if not reports:
+        return None
+    try:
+        return json.loads(reports[-1].read_text())
+    except (OSError, ValueError):
+        return None
+
+
+def _label_value(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def prometheus_text(report: dict) -> str:
+    """
+    Renders a run report in the Prometheus text exposition format:
+      screentime_stage_seconds{component="collector",stage="extract",source="Mac"} 1.23
+      screentime_rows_read{component="collector",source="Mac"} 412
+    """
+    component = _label_value(report["component"])
+    lines = [
+        "# HELP screentime_last_run_timestamp_seconds End of the last run (unix time).",
+        "# TYPE screentime_last_run_timestamp_seconds gauge",
+        f'screentime_last_run_timestamp_seconds{{component="{component}"}} {report["finished"]:.3f}',
+        "# HELP screentime_last_run_duration_seconds Wall time of the last run.",
+        "# TYPE screentime_last_run_duration_seconds gauge",
+        f'screentime_last_run_duration_seconds{{component="{component}"}} {report["duration"]}',
+        "# HELP screentime_last_run_success 1 if the last run succeeded.",
+        "# TYPE screentime_last_run_success gauge",
+        f'screentime_last_run_success{{component="{component}"}} {int(report["ok"])}',
+        "# HELP screentime_stage_seconds Wall time per stage in the last run.",
+        "# TYPE screentime_stage_seconds gauge",
+    ]
+    for entry in report["stages"]:
+        lines.append(f'screentime_stage_seconds{{component="{component}",stage="{_label_value(entry["stage"])}",'
+                     f'source="{_label_value(entry["source"])}"}} {entry["seconds"]}')
+
+    # Samples of one metric family have to be contiguous
+    counters = {}
+    for entry in report["counters"]:
+        counters.setdefault(f"screentime_{entry['name']}", []).append(entry)
+    for name, entries in counters.items():
+        lines.append(f"# TYPE {name} gauge")
+        lines.extend(f'{name}{{component="{component}",source="{_label_value(e["source"])}"}} {e["value"]}'
+                     for e in entries)
+
+    latencies = {}
+    for entry in report["latencies"]:
+        latencies.setdefault(f"screentime_{entry['name']}_seconds", []).append(entry)
+    for name, entries in latencies.items():
+        lines.append(f"# TYPE {name} summary")
+        for e in entries:
+            labels = f'component="{component}",source="{_label_value(e["source"])}"'
+            lines.append(f"{name}_sum{{{labels}}} {e['sum']}")
+            lines.append(f"{name}_count{{{labels}}} {e['count']}")
+        lines.append(f"# TYPE {name}_max gauge")
+        lines.extend(f'{name}_max{{component="{component}",source="{_label_value(e["source"])}"}} {e["max"]}'
+                     for e in entries)
+    return "\n".join(lines) + "\n"
+
+
+def _escape_tag(value: str) -> str:
+    return str(value).replace(",", "\\,").replace("=", "\\=").replace(" ", "\\ ")
+
+
+def influx_lines(report: dict) -> list[str]:
+    """
+    Encodes a run report as line protocol (one point per stage and source),
+    timestamped with the end of the run:
+      screentime_pipeline,component=collector,stage=extract,source=Mac seconds=1.23 1707400000000000000
+      screentime_pipeline,component=collector,stage=counters,source=Mac rows_read=412i 1707400000000000000
+    """
+    ts_ns = int(report["finished"] * 1e9)
+    prefix = f"{INFLUX_MEASUREMENT},component={_escape_tag(report['component'])}"
+
+    lines = [f"{prefix},stage=run duration={report['duration']},ok={str(report['ok']).lower()} {ts_ns}"]
+    for entry in report["stages"]:
+        lines.append(f"{prefix},stage={_escape_tag(entry['stage'])},source={_escape_tag(entry['source'] or 'all')} "
+                     f"seconds={entry['seconds']} {ts_ns}")
+
+    by_source = {}
+    for entry in report["counters"]:
+        by_source.setdefault(entry["source"] or "all", []).append(f"{entry['name']}={entry['value']}i")
+    for entry in report["latencies"]:
+        by_source.setdefault(entry["source"] or "all", []).extend([
+            f"{entry['name']}_count={entry['count']}i",
+            f"{entry['name']}_seconds={entry['sum']}",
+            f"{entry['name']}_max_seconds={entry['max']}",
+        ])
+    for source, fields in by_source.items():
+        lines.append(f"{prefix},stage=counters,source={_escape_tag(source)} {','.join(fields)} {ts_ns}")
+    return lines
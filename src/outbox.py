@@ -0,0 +1,164 @@
+#!/usr/bin/env python3
+"""
+Apple Screen Time Exporter - Outbox
+Durable queue of deliveries a sink did not accept (InfluxDB batches, HA
+sensor updates), replayed on the next run or daemon cycle.
+
+Layout (one directory per sink):
+
+  data/outbox/<sink>/<sequence>.seg   one queued delivery per segment
+  data/outbox/<sink>/state.json       retry backoff ({failures, next_attempt})
+  data/outbox/<sink>/rejected/        segments the sink refused (kept for inspection)
+  data/outbox/<sink>/corrupt/         segments that failed their checksum
+
+A segment is a JSON header line ({"key", "created", "length", "blake2b"})
+followed by the payload bytes. Segments are written with temp file + fsync
++ rename and only deleted after the sink accepted them, so a queued
+delivery survives crashes and is replayed at least once; InfluxDB writes
+are idempotent, which makes that exactly-once per batch in effect.
+Segments are replayed in order; for keyed segments (one HA sensor each)
+only the newest segment of a key is delivered.
+"""
+
+import hashlib
+import json
+import os
+import time
+from pathlib import Path
+
+from state import atomic_write_bytes, atomic_write_text
+
+# Results of a deliver() callback
+DELIVERED = "delivered"
+RETRY = "retry"        # Sink unavailable - keep the segment, back off
+REJECTED = "rejected"  # Sink refused it (e.g. malformed) - move it aside
+
+SEGMENT_SUFFIX = ".seg"
+
+
+def _checksum(payload: bytes) -> str:
+    return hashlib.blake2b(payload, digest_size=16).hexdigest()
+
+
+class Outbox:
+    """Append-only segment queue of one sink, with exponential retry backoff."""
+
+    def __init__(self, path: Path, max_bytes: int = 512 * 1024 * 1024,
+                 backoff: float = 60, max_backoff: float = 3600):
+        self.path = Path(path)
+        self.name = self.path.name
+        self.max_bytes = max_bytes
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.state_file = self.path / "state.json"
+
+    def segments(self) -> list[Path]:
+        """Queued segments, oldest first."""
+        if not self.path.exists():
+            return []
+        return sorted(self.path.glob(f"*{SEGMENT_SUFFIX}"))
+
+    def pending(self) -> bool:
+        return bool(self.segments())
+
+    def size(self) -> int:
+        return sum(segment.stat().st_size for segment in self.segments())
+
+    def enqueue(self, payload: bytes, key: str = "") -> bool:
+        """Durably appends a delivery. Returns False if the outbox is full."""
+        segments = self.segments()
+        if sum(segment.stat().st_size for segment in segments) + len(payload) > self.max_bytes:
+            print(f"[Outbox] {self.name}: full ({self.max_bytes} bytes) - not queued")
+            return False
+
+        # Increasing and never reused, also next to segments moved to rejected/ or corrupt/
+        seq = max(int(segments[-1].stem) + 1 if segments else 0, time.time_ns())
+        header = {"key": key, "created": time.time(), "length": len(payload), "blake2b": _checksum(payload)}
+        atomic_write_bytes(self.path / f"{seq:020d}{SEGMENT_SUFFIX}",
+                           json.dumps(header).encode("utf-8") + b"\n" + payload)
+        return True
+
+    def read(self, segment: Path) -> tuple[dict, bytes] | None:
+        """Returns (header, payload), or None if the segment is unreadable or fails its checksum."""
+        try:
+            data = segment.read_bytes()
+            header_line, payload = data.split(b"\n", 1)
+            header = json.loads(header_line)
+        except (OSError, ValueError):
+            return None
+        if len(payload) != header.get("length") or _checksum(payload) != header.get("blake2b"):
+            return None
+        return header, payload
+
+    def _move_aside(self, segment: Path, folder: str):
+        target = self.path / folder
+        target.mkdir(exist_ok=True)
+        os.replace(segment, target / segment.name)
+
+    def _load_state(self) -> dict:
+        try:
+            return json.loads(self.state_file.read_text())
+        except (OSError, ValueError):
+            return {"failures": 0, "next_attempt": 0}
+
+    def is_due(self, now: float | None = None) -> bool:
+        """True if the backoff after the last failed replay has passed."""
+        return (time.time() if now is None else now) >= self._load_state().get("next_attempt", 0)
+
+    def supersede(self, keys) -> int:
+        """Drops queued segments of these keys (a newer value was delivered directly)."""
+        keys, dropped = set(keys), 0
+        for segment in self.segments():
+            record = self.read(segment)
+            if record and record[0].get("key") in keys:
+                segment.unlink(missing_ok=True)
+                dropped += 1
+        return dropped
+
+    def drain(self, deliver, now: float | None = None) -> tuple[int, int]:
+        """
+        Replays queued segments in order with deliver(payload, header) until
+        one returns RETRY. Returns (delivered, still queued). Does nothing
+        while backing off after a failed replay.
+        """
+        now = time.time() if now is None else now
+        segments = self.segments()
+        if not segments or not self.is_due(now):
+            return 0, len(segments)
+
+        records = []
+        for segment in segments:
+            record = self.read(segment)
+            if record is None:
+                print(f"[Outbox] {self.name}: {segment.name} is corrupt - moved to corrupt/")
+                self._move_aside(segment, "corrupt")
+                continue
+            records.append((segment, *record))
+
+        # Keyed segments: only the newest value per key is worth delivering
+        newest = {header["key"]: segment for segment, header, _ in records if header.get("key")}
+
+        delivered = 0
+        for segment, header, payload in records:
+            if header.get("key") and newest[header["key"]] != segment:
+                segment.unlink(missing_ok=True)
+                continue
+
+            result = deliver(payload, header)
+            if result == DELIVERED:
+                segment.unlink(missing_ok=True)
+                delivered += 1
+            elif result == REJECTED:
+                print(f"[Outbox] {self.name}: {segment.name} rejected - moved to rejected/")
+                self._move_aside(segment, "rejected")
+            else:
+                state = self._load_state()
+                failures = state.get("failures", 0) + 1
+                delay = min(self.max_backoff, self.backoff * 2 ** (failures - 1))
+                atomic_write_text(self.state_file, json.dumps({"failures": failures, "next_attempt": now + delay}))
+                remaining = len(self.segments())
+                print(f"[Outbox] {self.name}: replay failed - {remaining} queued, next attempt in {delay:g}s")
+                return delivered, remaining
+
+        self.state_file.unlink(missing_ok=True)
+        return delivered, 0
@@ -0,0 +1,234 @@
+#!/usr/bin/env python3
+"""
+Apple Screen Time Exporter - State
+Crash-safe persistence for small state files such as per-source watermarks.
+"""
+
+import json
+import os
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+
+def atomic_write_text(path: Path, text: str):
+    """
+    Writes a file via temp file + fsync + rename, so readers see either the
+    old or the new content - never a truncated file.
+    """
+    atomic_write_bytes(path, text.encode("utf-8"))
+
+
+def atomic_write_bytes(path: Path, data: bytes):
+    """Binary variant of atomic_write_text()."""
+    import tempfile
+
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+
+    fd, tmp = tempfile.mkstemp(dir=path.parent, prefix=f".{path.name}.", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, path)
+    except BaseException:
+        Path(tmp).unlink(missing_ok=True)
+        raise
+
+    # Persist the rename itself
+    dir_fd = os.open(path.parent, os.O_RDONLY)
+    try:
+        os.fsync(dir_fd)
+    finally:
+        os.close(dir_fd)
+
+
+@contextmanager
+def file_lock(path: Path):
+    """Holds an exclusive lock (flock on path) that other processes wait for."""
+    import fcntl
+
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, "a") as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+class CommitManifest:
+    """
+    Commit record of the event store: the store position after the last
+    committed append and the watermarks that belong to it, in one JSON file
+    replaced atomically. Rows past the committed position were appended by
+    a run that crashed before its commit and are cut off on recovery; their
+    watermarks were never committed either, so they are simply extracted
+    again.
+
+    The previous manifest is kept as <name>.bak and used if the current one
+    is unreadable, so a damaged manifest costs one re-extracted batch, not
+    a full rescan.
+    """
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self.backup_path = self.path.with_name(self.path.name + ".bak")
+        self.data, self.from_backup = self._load()
+
+    def reload(self):
+        """Re-reads the manifest (another process may have committed since)."""
+        self.data, self.from_backup = self._load()
+
+    def _load(self) -> tuple[dict, bool]:
+        for path, is_backup in ((self.path, False), (self.backup_path, True)):
+            if not path.exists():
+                continue
+            try:
+                data = json.loads(path.read_text())
+                if not isinstance(data, dict) or "seq" not in data:
+                    raise ValueError("not a manifest")
+            except (OSError, ValueError) as e:
+                print(f"[State] Ignoring unreadable {path.name}: {e}")
+                continue
+            if is_backup:
+                print(f"[State] Using {path.name} - the last commit is re-extracted")
+            return data, is_backup
+        return {}, False
+
+    @property
+    def seq(self) -> int:
+        return self.data.get("seq", 0)
+
+    @property
+    def position(self) -> int | None:
+        """Committed store position (None without a commit)."""
+        return self.data.get("position")
+
+    @property
+    def previous(self) -> int:
+        """Store position before the last committed append."""
+        return self.data.get("previous", 0)
+
+    @property
+    def key_log(self) -> tuple[int, int]:
+        """(previous, committed) end of the store's fragment key log (see dedup.FragmentKeyLog)."""
+        key_log = self.data.get("key_log", {})
+        return key_log.get("previous", 0), key_log.get("position", 0)
+
+    def applies_to(self, store_id: str) -> bool:
+        return bool(self.data) and self.data.get("store") == store_id
+
+    def watermarks(self, key: str) -> dict[str, float]:
+        return {k: float(v) for k, v in self.data.get("watermarks", {}).get(key, {}).items()}
+
+    def commit(self, store_id: str, position: int, previous: int, watermarks: dict,
+               key_log: tuple[int, int] | None = None) -> int:
+        """
+        Records the store position together with watermarks ({key: marks})
+        and the (previous, new) end of the fragment key log. Returns the
+        commit number.
+        """
+        if key_log is None:
+            key_log = (self.key_log[1], self.key_log[1])
+        data = {
+            "seq": self.seq + 1,
+            "store": store_id,
+            "position": position,
+            "previous": previous,
+            "committed": time.time(),
+            "watermarks": {**self.data.get("watermarks", {}), **watermarks},
+            "key_log": {"previous": key_log[0], "position": key_log[1]},
+        }
+        if self.data:
+            atomic_write_text(self.backup_path, json.dumps(self.data, indent=2, sort_keys=True))
+        atomic_write_text(self.path, json.dumps(data, indent=2, sort_keys=True))
+        self.data, self.from_backup = data, False
+        return data["seq"]
+
+
+class WatermarkStore:
+    """
+    Per-source extraction watermarks ({source: last created_at}) in a JSON file.
+
+    Sources without an entry fall back to the legacy single-value watermark
+    file, so upgrading from one global watermark does not re-extract history.
+    With a commit manifest, the watermarks committed there under `key` take
+    precedence where they are ahead of the file (or the file is unreadable);
+    the file is a readable copy written after each commit.
+    """
+
+    def __init__(self, path: Path, legacy_path: Path | None = None,
+                 manifest: CommitManifest | None = None, key: str = "watermarks"):
+        self.path = Path(path)
+        self.legacy_path = Path(legacy_path) if legacy_path else None
+        self.manifest = manifest
+        self.key = key
+        self.marks = self._load()
+        if manifest is not None:
+            for source, ts in manifest.watermarks(key).items():
+                self.marks[source] = max(ts, self.marks.get(source, 0.0))
+        self.default = self._load_legacy()
+
+    def _load(self) -> dict[str, float]:
+        if not self.path.exists():
+            return {}
+        try:
+            return {k: float(v) for k, v in json.loads(self.path.read_text()).items()}
+        except (OSError, ValueError, AttributeError) as e:
+            print(f"[State] Ignoring unreadable {self.path.name}: {e}")
+            return {}
+
+    def _load_legacy(self) -> float:
+        if self.legacy_path and self.legacy_path.exists():
+            try:
+                return float(self.legacy_path.read_text().strip())
+            except (OSError, ValueError):
+                pass
+        return 0.0
+
+    def get(self, source: str) -> float:
+        return self.marks.get(source, self.default)
+
+    def advance(self, source: str, ts: float):
+        """Moves a source's watermark forward (never backwards)."""
+        if ts > self.get(source):
+            self.marks[source] = ts
+
+    def save(self):
+        atomic_write_text(self.path, json.dumps(self.marks, indent=2, sort_keys=True))
+
+
+class PushStateCache:
+    """
+    Remembers what was last pushed per entity ({entity_id: [digest, pushed_at]}),
+    so unchanged values can be skipped. Entries older than max_age seconds count
+    as stale and are pushed again (e.g. to restore states after a HA restart).
+    """
+
+    def __init__(self, path: Path, max_age: float):
+        self.path = Path(path)
+        self.max_age = max_age
+        self.entries = self._load()
+
+    def _load(self) -> dict[str, list]:
+        if not self.path.exists():
+            return {}
+        try:
+            return {k: [str(d), float(t)] for k, (d, t) in json.loads(self.path.read_text()).items()}
+        except (OSError, ValueError, TypeError, AttributeError) as e:
+            print(f"[State] Ignoring unreadable {self.path.name}: {e}")
+            return {}
+
+    def is_current(self, key: str, digest: str, now: float) -> bool:
+        entry = self.entries.get(key)
+        return entry is not None and entry[0] == digest and now - entry[1] < self.max_age
+
+    def mark(self, key: str, digest: str, now: float):
+        self.entries[key] = [digest, now]
+
+    def save(self):
+        atomic_write_text(self.path, json.dumps(self.entries, indent=2, sort_keys=True))
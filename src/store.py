@@ -0,0 +1,377 @@
+#!/usr/bin/env python3
+"""
+Apple Screen Time Exporter - Event Store
+Pluggable storage backends for collected events:
+
+  csv     - append-only data/screentime.csv (default, full scan on read)
+  sqlite  - data/screentime.db indexed on (source, unix_ts), range reads
+
+Usage:
+  python3 src/store.py migrate [--csv PATH] [--db PATH]   # CSV -> SQLite
+  python3 src/store.py export [--db PATH] [--csv PATH]    # SQLite -> CSV
+"""
+
+import csv
+import io
+import os
+import sqlite3
+import sys
+from datetime import datetime, timezone
+from pathlib import Path
+
+FIELDNAMES = ["timestamp", "app", "title", "duration", "source"]
+
+# Column types when loading events into pandas; repeated strings become categoricals
+FRAME_DTYPES = {
+    "timestamp": "object",
+    "app": "category",
+    "title": "category",
+    "duration": "float64",
+    "source": "category",
+}
+
+UNITS_PER_SECOND = {"s": 1, "ms": 10**3, "us": 10**6, "ns": 10**9}
+
+# Rows per executemany() call when importing
+INSERT_BATCH_SIZE = 10_000
+
+
+def event_unix_ts(timestamp: str) -> int:
+    """Converts an ISO timestamp to whole epoch seconds (naive = UTC, like pandas)."""
+    dt = datetime.fromisoformat(timestamp.replace("Z", "+00:00"))
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    return int(dt.timestamp())
+
+
+def epoch_seconds(timestamps):
+    """Whole epoch seconds of a datetime64 Series as int64, without per-row Python calls."""
+    return timestamps.array.asi8 // UNITS_PER_SECOND[timestamps.dt.unit]
+
+
+def _finish_frame(df):
+    """Applies FRAME_DTYPES, parses timestamps and adds unix_ts."""
+    import pandas as pd
+
+    df = df.astype({col: dtype for col, dtype in FRAME_DTYPES.items() if df[col].dtype != dtype})
+    df["timestamp"] = pd.to_datetime(df["timestamp"], format="ISO8601", utc=True)
+    if "unix_ts" not in df:
+        df["unix_ts"] = epoch_seconds(df["timestamp"])
+    return df
+
+
+class CsvStore:
+    """Append-only CSV file. Range reads parse the whole file."""
+
+    name = "csv"
+    position_unit = "bytes"
+    # read(since, until) costs the same as reading everything
+    range_reads = False
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self.id = f"{self.name}:{self.path.resolve()}"
+
+    def exists(self) -> bool:
+        return self.path.exists()
+
+    def append(self, events) -> int:
+        """Appends events (any iterable of dicts) and returns the row count once they are on disk."""
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        file_exists = self.path.exists() and self.path.stat().st_size > 0
+        count = 0
+        with open(self.path, "a", newline="") as f:
+            writer = csv.DictWriter(f, fieldnames=FIELDNAMES, extrasaction="ignore")
+            if not file_exists:
+                writer.writeheader()
+            for ev in events:
+                writer.writerow(ev)
+                count += 1
+            f.flush()
+            os.fsync(f.fileno())
+        return count
+
+    def truncate(self, position: int):
+        """Cuts the file back to a committed position (drops a crashed run's tail)."""
+        with open(self.path, "r+b") as f:
+            f.truncate(position)
+            f.flush()
+            os.fsync(f.fileno())
+
+    def read(self, since: float = 0, until: float | None = None, end: int | None = None):
+        """
+        Returns events with since < unix_ts < until as a DataFrame
+        (timestamp as UTC datetime64, plus an integer unix_ts column),
+        optionally only from the file up to byte position end.
+        """
+        import pandas as pd
+
+        source = self.path
+        if end is not None:
+            with open(self.path, "rb") as f:
+                source = io.BytesIO(f.read(end))
+        df = _finish_frame(pd.read_csv(source, usecols=FIELDNAMES, dtype=FRAME_DTYPES))
+        if since > 0:
+            df = df[df["unix_ts"] > since]
+        if until is not None:
+            df = df[df["unix_ts"] < until]
+        return df
+
+    def position(self) -> int:
+        """Current end of the store (file size in bytes)."""
+        return self.path.stat().st_size if self.path.exists() else 0
+
+    def read_appended(self, offset: int = 0, end: int | None = None):
+        """
+        Returns (events appended after byte offset (up to end), new offset).
+        Only complete lines are consumed, the new offset points past the last one.
+        """
+        import pandas as pd
+
+        with open(self.path, "rb") as f:
+            f.seek(offset)
+            data = f.read() if end is None else f.read(max(0, end - offset))
+        data = data[:data.rfind(b"\n") + 1]
+
+        if not data:
+            return _finish_frame(pd.DataFrame(columns=FIELDNAMES)), offset
+
+        if offset == 0:
+            df = pd.read_csv(io.BytesIO(data), usecols=FIELDNAMES, dtype=FRAME_DTYPES)
+        else:
+            df = pd.read_csv(io.BytesIO(data), header=None, names=FIELDNAMES, dtype=FRAME_DTYPES)
+        return _finish_frame(df), offset + len(data)
+
+    def iter_events(self):
+        """Yields every stored event as a dict of CSV strings."""
+        with open(self.path, newline="") as f:
+            yield from csv.DictReader(f)
+
+    def iter_range(self, start: int, end: int):
+        """Yields the events between two positions (byte offsets), as dicts of CSV strings."""
+        with open(self.path, "rb") as f:
+            f.seek(start)
+            data = f.read(end - start).decode("utf-8")
+        rows = csv.reader(io.StringIO(data, newline=""))
+        if start == 0:
+            next(rows, None)
+        for row in rows:
+            yield dict(zip(FIELDNAMES, row))
+
+
+class SqliteStore:
+    """SQLite database with (source, unix_ts) and unix_ts indexes."""
+
+    name = "sqlite"
+    position_unit = "row ids"
+    range_reads = True
+
+    SCHEMA = """
+    CREATE TABLE IF NOT EXISTS events (
+        id INTEGER PRIMARY KEY,
+        timestamp TEXT NOT NULL,
+        unix_ts INTEGER NOT NULL,
+        app TEXT NOT NULL,
+        title TEXT NOT NULL,
+        duration REAL NOT NULL,
+        source TEXT NOT NULL
+    );
+    CREATE INDEX IF NOT EXISTS idx_events_source_ts ON events (source, unix_ts);
+    CREATE INDEX IF NOT EXISTS idx_events_ts ON events (unix_ts);
+    """
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self.id = f"{self.name}:{self.path.resolve()}"
+
+    def exists(self) -> bool:
+        return self.path.exists()
+
+    def connect(self) -> sqlite3.Connection:
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        conn = sqlite3.connect(self.path)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.executescript(self.SCHEMA)
+        return conn
+
+    def append(self, events) -> int:
+        """Inserts events (any iterable of dicts) and returns the row count."""
+        query = """
+        INSERT INTO events (timestamp, unix_ts, app, title, duration, source)
+        VALUES (?, ?, ?, ?, ?, ?)
+        """
+        count = 0
+        batch = []
+        with self.connect() as conn:
+            for ev in events:
+                batch.append((
+                    ev["timestamp"], event_unix_ts(ev["timestamp"]),
+                    ev["app"], ev["title"], float(ev["duration"]), ev["source"],
+                ))
+                if len(batch) >= INSERT_BATCH_SIZE:
+                    conn.executemany(query, batch)
+                    count += len(batch)
+                    batch = []
+            if batch:
+                conn.executemany(query, batch)
+                count += len(batch)
+        conn.close()
+        return count
+
+    def read(self, since: float = 0, until: float | None = None, end: int | None = None):
+        """
+        Returns events with since < unix_ts < until (and row id <= end) as a
+        DataFrame. Uses the unix_ts index, so only the requested range is read.
+        """
+        import pandas as pd
+
+        query = "SELECT timestamp, app, title, duration, source, unix_ts FROM events WHERE unix_ts > ?"
+        params = [since]
+        if until is not None:
+            query += " AND unix_ts < ?"
+            params.append(until)
+        if end is not None:
+            query += " AND id <= ?"
+            params.append(end)
+        query += " ORDER BY id"
+
+        conn = self.connect()
+        try:
+            df = pd.read_sql_query(query, conn, params=params, dtype=FRAME_DTYPES)
+        finally:
+            conn.close()
+        return _finish_frame(df)
+
+    def position(self) -> int:
+        """Current end of the store (highest row id)."""
+        conn = self.connect()
+        try:
+            return conn.execute("SELECT COALESCE(MAX(id), 0) FROM events").fetchone()[0]
+        finally:
+            conn.close()
+
+    def read_appended(self, offset: int = 0, end: int | None = None):
+        """Returns (events with offset < row id <= end, new offset)."""
+        import pandas as pd
+
+        conn = self.connect()
+        try:
+            df = pd.read_sql_query(
+                "SELECT id, timestamp, app, title, duration, source, unix_ts FROM events "
+                "WHERE id > ? AND id <= ? ORDER BY id",
+                conn, params=[offset, end if end is not None else 2**63 - 1])
+        finally:
+            conn.close()
+
+        new_offset = int(df["id"].max()) if len(df) else offset
+        return _finish_frame(df.drop(columns="id")), new_offset
+
+    def iter_events(self):
+        """Yields every stored event as a dict, in insertion order."""
+        conn = self.connect()
+        try:
+            cursor = conn.execute("SELECT timestamp, app, title, duration, source FROM events ORDER BY id")
+            for row in cursor:
+                yield dict(zip(FIELDNAMES, row))
+        finally:
+            conn.close()
+
+    def iter_range(self, start: int, end: int):
+        """Yields the events with start < row id <= end, in insertion order."""
+        conn = self.connect()
+        try:
+            cursor = conn.execute("SELECT timestamp, app, title, duration, source FROM events "
+                                  "WHERE id > ? AND id <= ? ORDER BY id", (start, end))
+            for row in cursor:
+                yield dict(zip(FIELDNAMES, row))
+        finally:
+            conn.close()
+
+    def truncate(self, position: int):
+        """Deletes rows after a committed position (highest committed row id)."""
+        with self.connect() as conn:
+            conn.execute("DELETE FROM events WHERE id > ?", (position,))
+        conn.close()
+
+    def count(self) -> int:
+        conn = self.connect()
+        try:
+            return conn.execute("SELECT COUNT(*) FROM events").fetchone()[0]
+        finally:
+            conn.close()
+
+
+def manifest_path(store) -> Path:
+    """Commit manifest next to the store (see state.CommitManifest), e.g. data/screentime.csv.manifest."""
+    return store.path.with_name(store.path.name + ".manifest")
+
+
+def open_store(backend: str, csv_path: Path, db_path: Path):
+    """Returns the configured event store."""
+    if backend == "sqlite":
+        return SqliteStore(db_path)
+    if backend != "csv":
+        print(f"[Store] Unknown STORE_BACKEND '{backend}' - using csv")
+    return CsvStore(csv_path)
+
+
+def migrate(csv_path: Path, db_path: Path, force: bool = False) -> int:
+    """Imports an existing CSV history into the SQLite store."""
+    source = CsvStore(csv_path)
+    target = SqliteStore(db_path)
+
+    if not source.exists():
+        print(f"CSV not found: {csv_path}")
+        return 1
+
+    if target.exists() and target.count() > 0 and not force:
+        print(f"{db_path} already contains events - use --force to append anyway")
+        return 1
+
+    count = target.append(source.iter_events())
+    print(f"Migrated {count} events: {csv_path} -> {db_path}")
+    print("Set STORE_BACKEND=sqlite in .env to use it.")
+    return 0
+
+
+def export_csv(db_path: Path, csv_path: Path) -> int:
+    """Writes the SQLite store back to a CSV file in the collector format."""
+    source = SqliteStore(db_path)
+    if not source.exists():
+        print(f"Database not found: {db_path}")
+        return 1
+
+    if csv_path.exists():
+        print(f"{csv_path} already exists - refusing to overwrite")
+        return 1
+
+    count = CsvStore(csv_path).append(source.iter_events())
+    print(f"Exported {count} events: {db_path} -> {csv_path}")
+    return 0
+
+
+def main() -> int:
+    import argparse
+
+    data_dir = Path(__file__).parent.parent / "data"
+
+    parser = argparse.ArgumentParser(description="Screen Time event store tools")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p_migrate = sub.add_parser("migrate", help="Import screentime.csv into SQLite")
+    p_migrate.add_argument("--csv", type=Path, default=data_dir / "screentime.csv")
+    p_migrate.add_argument("--db", type=Path, default=data_dir / "screentime.db")
+    p_migrate.add_argument("--force", action="store_true", help="Append even if the database has events")
+
+    p_export = sub.add_parser("export", help="Write the SQLite store to a CSV file")
+    p_export.add_argument("--db", type=Path, default=data_dir / "screentime.db")
+    p_export.add_argument("--csv", type=Path, default=data_dir / "screentime-export.csv")
+
+    args = parser.parse_args()
+    if args.command == "migrate":
+        return migrate(args.csv, args.db, args.force)
+    return export_csv(args.db, args.csv)
+
+
+if __name__ == "__main__":
+    sys.exit(main())